@@ -1,12 +1,10 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect, BackgroundTasks
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.cors import CORSMiddleware
-import whisper
 import os
-import yt_dlp
 import sys
 from datetime import datetime
 import asyncio
@@ -14,12 +12,26 @@ import json
 import uuid
 import time
 from dotenv import load_dotenv
-import requests
 import shutil
 from pathlib import Path
 from audio_manager import AudioManager
+from audio_decoder import TAXA_AMOSTRAGEM, EXTENSAO_PCM, sondar_midia
+from inference_pool import PoolInferencia, JANELA_STREAMING_SEGUNDOS
+from transcript_cache import CacheTranscricoes, hash_audio
+from insight_cache import CacheInsights, hash_texto
+from insight_mapreduce import InsightsLongos, estimar_tokens
+from insight_rag import InsightsTrechos, pergunta_geral
+from youtube_cache import CacheYoutube
+from youtube_download import OrquestradorDownload
+from job_store import ArmazemJobs
+from job_queue import FilaJobs, FilaCheia, PrevisorDuracao
+from upload_stream import receber_upload
+from resumable_upload import UploadsRetomaveis
+from checkpoint_journal import DiarioCheckpoints
+from search_index import IndiceBusca, formatar_tempo
+from llm_client import ClienteLLM, ErroLLM, CircuitoAberto
+from event_bus import BarramentoEventos, PROTOCOLO_ATUAL, TIPO_DELTA, delta_texto, serializar
 import glob
-import pytube
 import ssl
 import certifi
 from pydantic import BaseModel
@@ -64,67 +76,54 @@ MODELOS = {
     "large-v3": "Large V3 (versão mais recente)"
 }
 
-# Carrega o modelo inicial (pode ser alterado via API)
-modelo_atual = None
+# Modelo padrão das novas transcrições (pode ser alterado via API; cada job guarda o seu)
 modelo_atual_nome = 'small'  # Variável para armazenar o nome do modelo atual
+modelo_pendente = None  # Modelo sendo carregado em background para substituir o atual
+erro_troca_modelo = None
 
-# Gerenciador de conexões WebSocket
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections = {}
-        self.connection_states = {}  # Rastreia estado das conexões
-
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
-        self.connection_states[client_id] = {
-            "connected": True,
-            "last_ping": time.time(),
-            "transcricao_id": None
-        }
-        print(f"WebSocket conectado: {client_id}")
-
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-        if client_id in self.connection_states:
-            self.connection_states[client_id]["connected"] = False
-        print(f"WebSocket desconectado: {client_id}")
-
-    def is_connected(self, client_id: str) -> bool:
-        """Verifica se a conexão ainda está ativa"""
-        return (client_id in self.active_connections and 
-                client_id in self.connection_states and 
-                self.connection_states[client_id]["connected"])
-
-    async def send_message(self, message: str, client_id: str):
-        if not self.is_connected(client_id):
-            print(f"Tentativa de enviar mensagem para conexão inativa: {client_id}")
-            return False
-        
-        try:
-            websocket = self.active_connections.get(client_id)
-            if websocket and websocket.client_state.name == "CONNECTED":
-                await websocket.send_text(message)
-                self.connection_states[client_id]["last_ping"] = time.time()
-                return True
-            else:
-                self.disconnect(client_id)
-                return False
-        except Exception as e:
-            print(f"Erro ao enviar mensagem WebSocket para {client_id}: {e}")
-            self.disconnect(client_id)
-            return False
+# Pool de processos que executa o Whisper fora do event loop
+pool_inferencia = PoolInferencia(modelo_inicial=modelo_atual_nome)
+
+# Cache de transcrições por conteúdo do áudio (+ modelo, idioma e opções abaixo)
+cache_transcricoes = CacheTranscricoes()
+OPCOES_DECODIFICACAO = {"janela": JANELA_STREAMING_SEGUNDOS}
+
+# Cache de áudio e metadados do YouTube por ID do vídeo
+cache_youtube = CacheYoutube()
+
+# Cache das respostas de insights por texto da transcrição + pergunta + modelo + versão do prompt
+cache_insights = CacheInsights()
+
+# Estratégias de download do YouTube executadas com hedging (ver youtube_download.py)
+orquestrador_download = OrquestradorDownload()
+
+# Uploads retomáveis em partes (uploads/parciais)
+uploads_retomaveis = UploadsRetomaveis()
 
-    def set_transcricao_id(self, client_id: str, transcricao_id: str):
-        """Associa uma transcrição a uma conexão"""
-        if client_id in self.connection_states:
-            self.connection_states[client_id]["transcricao_id"] = transcricao_id
+# Checkpoints das transcrições: diário de segmentos compactado em retratos (transcricoes/)
+diario_checkpoints = DiarioCheckpoints()
 
-manager = ConnectionManager()
+# Índice de busca textual (FTS5) das transcrições concluídas
+indice_busca = IndiceBusca()
 
-# Armazena informações sobre as transcrições em andamento
-transcricoes_ativas = {}
+# Cliente da API de LLM (insights): conexões reaproveitadas, repetições e disjuntor
+cliente_llm = ClienteLLM()
+
+# Insights em map-reduce para transcrições maiores que o limite de um prompt
+insights_longos = InsightsLongos(cliente_llm, cache_insights)
+
+# Insights só com os trechos relevantes da transcrição, buscados no índice de busca
+insights_trechos = InsightsTrechos(cliente_llm, indice_busca)
+
+# Eventos de cada job (numerados e com buffer para reenvio), assinados pelos WebSockets
+barramento_eventos = BarramentoEventos()
+
+async def publicar(transcricao_id, mensagem):
+    """Publica uma atualização do job para quem o estiver acompanhando (pode não haver ninguém)"""
+    return barramento_eventos.publicar(transcricao_id, mensagem)
+
+# Jobs de transcrição (metadados, status e texto) persistidos em SQLite
+armazem_jobs = ArmazemJobs()
 
 # Cria diretórios para armazenar arquivos se não existirem
 UPLOAD_DIR = Path("uploads")
@@ -137,21 +136,87 @@ for directory in [UPLOAD_DIR, TRANSCRIPTION_DIR, AUDIO_DIR]:
 # Inicializa o gerenciador de áudio
 audio_manager = AudioManager(model_size="base", voice="pt-BR-FranciscaNeural")
 
-def carregar_modelo(nome_modelo):
-    global modelo_atual, modelo_atual_nome
+async def carregar_modelo(nome_modelo):
+    """
+    Carrega o modelo em background e só então o torna o padrão (double-buffering)
+    
+    Enquanto o novo modelo carrega em todos os processos do pool, o anterior
+    continua sendo o padrão; jobs já iniciados mantêm o modelo com que foram criados.
+    """
+    global modelo_atual_nome, modelo_pendente, erro_troca_modelo
     try:
         print(f"Iniciando carregamento do modelo {nome_modelo}...")
-        print(f"Baixando e carregando o modelo Whisper {nome_modelo}...")
-        modelo_atual = whisper.load_model(nome_modelo)
-        modelo_atual_nome = nome_modelo
+        print(f"Baixando e carregando o modelo Whisper {nome_modelo} em todos os processos do pool de inferência...")
+        await pool_inferencia.carregar_modelo(nome_modelo)
+        # Se outra troca foi pedida enquanto este carregava, a mais recente prevalece
+        if modelo_pendente == nome_modelo:
+            modelo_atual_nome = nome_modelo
+            modelo_pendente = None
         print(f"Modelo {nome_modelo} carregado com sucesso!")
         return True
     except Exception as e:
         print(f"Erro ao carregar modelo: {str(e)}")
+        if modelo_pendente == nome_modelo:
+            modelo_pendente = None
+            erro_troca_modelo = f"Erro ao carregar modelo {nome_modelo}: {str(e)}"
         return False
 
-# Carrega o modelo inicial (usando 'small' que é mais leve e rápido)
-carregar_modelo('small')
+# Estado do aquecimento do modelo inicial, exposto em /health/ready
+estado_aquecimento = {
+    "status": "pendente",  # pendente, carregando, pronto ou erro
+    "modelo": None,
+    "iniciado_em": None,
+    "pronto_em": None,
+    "erro": None
+}
+
+async def aquecer_modelo(nome_modelo):
+    """Carrega o modelo inicial no pool em background, sem atrasar o início do servidor"""
+    estado_aquecimento.update({
+        "status": "carregando",
+        "modelo": nome_modelo,
+        "iniciado_em": datetime.now().isoformat(),
+        "erro": None
+    })
+    try:
+        await pool_inferencia.carregar_modelo(nome_modelo)
+        estado_aquecimento["status"] = "pronto"
+        estado_aquecimento["pronto_em"] = datetime.now().isoformat()
+        print(f"Aquecimento concluído: modelo {nome_modelo} pronto")
+    except Exception as e:
+        estado_aquecimento["status"] = "erro"
+        estado_aquecimento["erro"] = str(e)
+        print(f"Erro no aquecimento do modelo {nome_modelo}: {e}")
+
+@app.on_event("startup")
+async def iniciar_pool_inferencia():
+    # O servidor já aceita conexões enquanto os processos carregam o modelo inicial
+    criar_diretorios()
+    interrompidos = armazem_jobs.marcar_interrompidos()
+    if interrompidos:
+        print(f"{interrompidos} transcrição(ões) interrompida(s) pelo reinício marcada(s) para retomada")
+    # Checkpoints deixados em diário por uma queda viram retratos (descartando registros truncados)
+    compactados = await asyncio.to_thread(diario_checkpoints.compactar_todos)
+    if compactados:
+        print(f"{compactados} diário(s) de checkpoint compactado(s)")
+    pool_inferencia.iniciar()
+    fila_jobs.iniciar()
+    # Jobs que aguardavam na fila quando o servidor parou voltam para a fila, na ordem original
+    for transcricao_id in armazem_jobs.pendentes():
+        job = armazem_jobs.obter(transcricao_id)
+        await enfileirar_job(transcricao_id, job.get("duracao_audio"), job.get("modelo"),
+                             job.get("origem"), verificar_vaga=False)
+    asyncio.create_task(aquecer_modelo(modelo_atual_nome))
+    asyncio.create_task(asyncio.to_thread(indexar_pendentes))
+
+@app.on_event("shutdown")
+async def encerrar_pool_inferencia():
+    await fila_jobs.encerrar()
+    pool_inferencia.encerrar()
+    diario_checkpoints.fechar_todos()
+    armazem_jobs.fechar()
+    indice_busca.fechar()
+    await cliente_llm.fechar()
 
 # Armazena as últimas transcrições
 ultima_transcricao = None
@@ -169,396 +234,270 @@ def criar_diretorios():
         os.makedirs(dir, exist_ok=True)
 
 def baixar_audio_youtube(url):
-    # Cria diretório audios se não existir
-    os.makedirs('audios', exist_ok=True)
-    download_id = str(uuid.uuid4())
-    last_error = None
-
-    # --- Tentativa 1: yt-dlp (Principal) ---
-    print(f"Iniciando download do YouTube (Tentativa 1 - yt-dlp principal): {url}")
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': f'audios/audio_{download_id}.%(ext)s',
-        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
-        'geo_bypass': True, 'geo_bypass_country': 'US',
-        'nocheckcertificate': True,  # Ignora verificação de certificado SSL
-        'ignoreerrors': False, 'noplaylist': True,
-        # Mais opções de robustez
-        'socket_timeout': 30,
-        'retries': 10,
-        'fragment_retries': 10,
-        'skip_download': False,
-        'hls_prefer_native': False,
-        'hls_use_mpegts': True,
-        'extractor_args': {'youtube': {'skip': ['dash', 'hls']}},
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-us,en;q=0.5', 'Sec-Fetch-Mode': 'navigate',
-        },
-    }
+    """Retorna (arquivo de áudio, título) do vídeo, baixando-o só se não estiver em cache"""
+    entrada = cache_youtube.obter_ou_baixar(url, orquestrador_download.baixar, formato="original")
+    return entrada["caminho"], entrada["titulo"]
+
+def extrair_audio_video(caminho_video):
+    """
+    Prepara o vídeo para transcrição e retorna (caminho da mídia, nome do arquivo)
+    
+    Não há conversão intermediária: a faixa de áudio é decodificada uma única
+    vez, direto do vídeo para PCM 16 kHz, em carregar_audio. Aqui só se confere
+    (com o ffprobe) que o arquivo tem uma faixa de áudio.
+    """
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            print("Extraindo informações do vídeo...")
-            info_dict = ydl.extract_info(url, download=True)
-            if not info_dict:
-                raise Exception("Não foi possível obter informações do vídeo (info_dict vazio)")
-            video_title = info_dict.get('title', 'Video sem título')
-            possible_files = glob.glob(f'audios/audio_{download_id}.*')
-            if not possible_files:
-                raise Exception("Arquivo de áudio não foi criado após o download (yt-dlp principal)")
-            actual_file = possible_files[0]
-            print(f"Download (Tentativa 1) concluído com sucesso: {actual_file}")
-            return actual_file, video_title
+        nome_arquivo = os.path.splitext(os.path.basename(caminho_video))[0]
+        if not sondar_midia(caminho_video)["tem_audio"]:
+            raise Exception("O arquivo enviado não possui faixa de áudio")
+        return caminho_video, nome_arquivo
     except Exception as e:
-        print(f"Tentativa 1 (yt-dlp principal) falhou: {e}")
-        last_error = e
+        raise HTTPException(status_code=500, detail=str(e))
 
-    # --- Tentativa 2: pytube ---
-    if last_error: # Só tenta se a anterior falhou
-        print("Tentando download alternativo (Tentativa 2 - pytube)...")
-        try:
-            # (Código de baixar_audio_youtube_pytube adaptado)
-            yt = pytube.YouTube(url)
-            video_title = yt.title
-            audio_stream = yt.streams.filter(only_audio=True).first()
-            if not audio_stream:
-                raise Exception("Nenhum stream de áudio disponível (pytube)")
-            filename_pytube = audio_stream.download(output_path='audios', filename=f"audio_{download_id}_pytube") # Nome diferente para evitar conflito
-            if not os.path.exists(filename_pytube):
-                 raise Exception(f"Falha ao baixar o arquivo (pytube): {filename_pytube}")
-            output_mp3 = f"audios/audio_{download_id}.mp3"
-            if not filename_pytube.endswith('.mp3'):
-                print(f"Convertendo para MP3 (pytube): {filename_pytube} -> {output_mp3}")
-                comando = f'ffmpeg -y -i "{filename_pytube}" -vn -acodec mp3 "{output_mp3}"'
-                os.system(comando)
-                if os.path.exists(output_mp3):
-                    os.remove(filename_pytube)
-                    actual_file = output_mp3
-                else:
-                     raise Exception("Falha na conversão para MP3 (pytube)")
-            else:
-                # Se já for mp3 (raro), renomeia para o padrão
-                os.rename(filename_pytube, output_mp3)
-                actual_file = output_mp3
-            print(f"Download (Tentativa 2 - pytube) concluído com sucesso: {actual_file}")
-            return actual_file, video_title
-        except Exception as e_pytube:
-            print(f"Tentativa 2 (pytube) falhou: {e_pytube}")
-            last_error = e_pytube
-
-    # --- Tentativa 3: yt-dlp (Alternativo com lista de formatos) ---
-    if last_error: # Só tenta se as anteriores falharam
-        print("Tentando download alternativo (Tentativa 3 - yt-dlp com lista de formatos)...")
-        try:
-            # Primeiro, listar os formatos disponíveis
-            list_opts = {
-                'listformats': True,
-                'quiet': False,
-                'no_warnings': False,
-                'geo_bypass': True,
-                'nocheckcertificate': True,
-            }
-            with yt_dlp.YoutubeDL(list_opts) as ydl_list:
-                print("Listando formatos disponíveis...")
-                info = ydl_list.extract_info(url, download=False)
-                
-            # Tenta baixar com formato específico (começando pelo áudio)
-            alt_opts = {
-                'format': '140/bestaudio/best', # Tenta formato 140 (m4a) primeiro, depois outros
-                'outtmpl': f'audios/audio_{download_id}.%(ext)s',
-                'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
-                'noplaylist': True, 'geo_bypass': True, 'nocheckcertificate': True,
-                'ignoreerrors': False, 'quiet': False, 'no_warnings': False,
-                'socket_timeout': 30,
-                'retries': 10,
-                'http_headers': {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36'},
-            }
-            with yt_dlp.YoutubeDL(alt_opts) as ydl_alt:
-                info_dict = ydl_alt.extract_info(url, download=True)
-                if not info_dict:
-                     raise Exception("Não foi possível obter informações do vídeo (info_dict vazio - alt)")
-                video_title = info_dict.get('title', 'Video sem título')
-                possible_files = glob.glob(f'audios/audio_{download_id}.*')
-                if not possible_files:
-                    raise Exception("Arquivo de áudio não foi criado após o download (yt-dlp alternativo)")
-                actual_file = possible_files[0]
-                print(f"Download (Tentativa 3 - yt-dlp formato específico) concluído com sucesso: {actual_file}")
-                return actual_file, video_title
-        except Exception as e_alt:
-            print(f"Tentativa 3 (yt-dlp formato específico) falhou: {e_alt}")
-            last_error = e_alt
-            
-    # --- Tentativa 4: Usando YouTube API --- 
-    if last_error:
-        print("Tentando download final (Tentativa 4 - método direto)...")
-        try:
-            import urllib.request
-            from urllib.parse import parse_qs, urlparse
-            
-            # Extrair video_id da URL
-            query = urlparse(url)
-            if query.hostname == 'youtu.be':
-                video_id = query.path[1:]
-            elif query.hostname in ('www.youtube.com', 'youtube.com'):
-                if query.path == '/watch':
-                    video_id = parse_qs(query.query)['v'][0]
-                elif query.path[:7] == '/embed/':
-                    video_id = query.path.split('/')[2]
-                elif query.path[:3] == '/v/':
-                    video_id = query.path.split('/')[2]
-            else:
-                video_id = None
-                
-            if not video_id:
-                raise Exception("Não foi possível extrair o ID do vídeo da URL")
-                
-            # Usar API para obter o título
-            api_url = f"https://www.googleapis.com/youtube/v3/videos?id={video_id}&part=snippet&key=YOUR_API_KEY"
-            video_title = f"Video {video_id}"  # Título padrão se não conseguir pela API
-            
-            # URL direta para o áudio (pode não funcionar para todos os vídeos)
-            direct_url = f"https://www.youtube.com/get_video_info?video_id={video_id}"
-            output_file = f"audios/audio_{download_id}.mp3"
-            
-            # Baixar usando urllib
-            print(f"Tentando baixar diretamente: {direct_url}")
-            req = urllib.request.Request(
-                direct_url,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36'
-                }
-            )
-            with urllib.request.urlopen(req) as response, open(output_file, 'wb') as out_file:
-                data = response.read()
-                out_file.write(data)
-                
-            if os.path.exists(output_file) and os.path.getsize(output_file) > 1000:  # Verificar se tem conteúdo
-                print(f"Download (Tentativa 4 - método direto) concluído com sucesso: {output_file}")
-                return output_file, video_title
-            else:
-                raise Exception("Arquivo baixado parece estar vazio ou é muito pequeno")
-                
-        except Exception as e_direct:
-            print(f"Tentativa 4 (método direto) falhou: {e_direct}")
-            last_error = e_direct
+def remover_upload(upload):
+    """Remove o arquivo enviado e o áudio extraído dele"""
+    # Uploads retomáveis não extraem o áudio durante o envio (não têm 'caminho_audio')
+    for caminho in (upload["caminho"], upload.get("caminho_audio")):
+        if caminho and os.path.exists(caminho):
+            os.remove(caminho)
+
+async def salvar_transcricao_parcial(transcricao_id, texto, concluido=False, segmentos=None, posicao=0.0,
+                                     **metadados):
+    """
+    Registra o checkpoint da transcrição parcial (ver checkpoint_journal.py)
+    
+    Além do texto, guarda os segmentos já concluídos e a posição (em segundos)
+    até onde o áudio foi decodificado, para que a retomada continue dali.
+    Metadados extras (modelo, idioma, caminho_audio, titulo...) são gravados junto.
+    A escrita, o fsync e a compactação rodam em uma thread, fora do event loop.
+    """
+    await asyncio.to_thread(diario_checkpoints.salvar, transcricao_id, texto, concluido, segmentos, posicao,
+                            **metadados)
 
-    # --- Falha Total ---
-    print(f"Todas as tentativas de download para {url} falharam.")
-    # Levanta a última exceção ocorrida para ser tratada pela função chamadora
-    raise last_error
+def carregar_transcricao_parcial(transcricao_id):
+    """Carrega uma transcrição parcial salva anteriormente (retrato + diário), ou None"""
+    return diario_checkpoints.carregar(transcricao_id)
 
-def extrair_audio_video(caminho_video):
+async def indexar_transcricao(transcricao_id, titulo, segmentos, texto):
+    """Atualiza o índice de busca com a transcrição concluída (uma falha aqui não afeta o job)"""
     try:
-        # Gera um ID único para o arquivo
-        file_id = str(uuid.uuid4())
-        nome_arquivo = os.path.splitext(os.path.basename(caminho_video))[0]
-        extensao_original = os.path.splitext(caminho_video)[1].lower()
-        
-        # Se já for um arquivo WAV, apenas copia para o diretório de áudios
-        if extensao_original == '.wav':
-            nome_audio = f"{nome_arquivo}_{file_id}.wav"
-            caminho_audio = os.path.join('audios', nome_audio)
-            # Copia o arquivo WAV
-            shutil.copy2(caminho_video, caminho_audio)
-        else:
-            # Para outros formatos, converte para MP3
-            nome_audio = f"{nome_arquivo}_{file_id}.mp3"
-            caminho_audio = os.path.join('audios', nome_audio)
-            comando = f'ffmpeg -y -i "{caminho_video}" -vn -acodec mp3 "{caminho_audio}"'
-            os.system(comando)
-        
-        return caminho_audio, nome_arquivo
+        await asyncio.to_thread(indice_busca.indexar, transcricao_id, titulo, segmentos, texto)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Erro ao indexar transcrição {transcricao_id} para busca: {e}")
 
-def salvar_transcricao_parcial(transcricao_id, texto, concluido=False):
-    """Salva a transcrição parcial em um arquivo"""
-    caminho = f"transcricoes/{transcricao_id}.json"
-    dados = {
-        "texto": texto,
-        "timestamp": datetime.now().isoformat(),
-        "concluido": concluido
-    }
+def indexar_pendentes():
+    """Indexa transcrições concluídas (e textos em transcriptions/) que ainda não estão no índice"""
+    indexados = indice_busca.versoes()
+    novos = 0
+    for transcricao_id in armazem_jobs.ids("concluida"):
+        if transcricao_id in indexados:
+            continue
+        job = armazem_jobs.obter(transcricao_id, com_texto=True)
+        segmentos = (carregar_transcricao_parcial(transcricao_id) or {}).get("segmentos")
+        indice_busca.indexar(transcricao_id, job.get("titulo"), segmentos, job.get("texto"))
+        novos += 1
+    for caminho in TRANSCRIPTION_DIR.glob("*.txt"):
+        documento_id = f"arquivo:{caminho.stem}"
+        versao = caminho.stat().st_mtime
+        if indexados.get(documento_id) == versao:
+            continue
+        indice_busca.indexar(documento_id, caminho.stem, texto=caminho.read_text(encoding="utf-8"),
+                             origem="arquivo", versao=versao)
+        novos += 1
+    if novos:
+        print(f"{novos} transcrição(ões) adicionada(s) ao índice de busca")
+
+async def concluir_sem_inferencia(transcricao_id, titulo, texto_completo, etapa):
+    """Conclui um job cujo resultado já existia (checkpoint concluído ou cache)"""
+    global ultima_transcricao
+    
+    # Atualiza interface diretamente para 100%
+    await publicar(transcricao_id, {
+        "tipo": "transcricao_parcial", 
+        "texto": texto_completo,
+        "progresso": 100,
+        "transcricao_id": transcricao_id,
+        "titulo": titulo,
+        "etapa": etapa
+    })
     
-    with open(caminho, 'w', encoding='utf-8') as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
+    # Marca como concluída
+    armazem_jobs.atualizar(transcricao_id, status="concluida", texto=texto_completo)
+    ultima_transcricao = texto_completo
+    segmentos = (carregar_transcricao_parcial(transcricao_id) or {}).get("segmentos")
+    await indexar_transcricao(transcricao_id, titulo, segmentos, texto_completo)
     
-    return caminho
+    await publicar(transcricao_id, {
+        "tipo": "transcricao_concluida", 
+        "transcricao_id": transcricao_id,
+        "titulo": titulo,
+        "tempo_processamento": "0.0s (cache)"
+    })
 
-def carregar_transcricao_parcial(transcricao_id):
-    """Carrega uma transcrição parcial salva anteriormente"""
-    caminho = f"transcricoes/{transcricao_id}.json"
-    if os.path.exists(caminho):
-        with open(caminho, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+async def transcrever_com_cache(caminho_audio, idioma='pt', modelo=None):
+    """Transcreve o arquivo inteiro (rotas antigas), consultando antes o cache por conteúdo"""
+    modelo = modelo or modelo_atual_nome
+    audio = await pool_inferencia.carregar_audio(caminho_audio)
+    chave = cache_transcricoes.chave(await asyncio.to_thread(hash_audio, audio),
+                                     modelo, idioma, OPCOES_DECODIFICACAO)
+    em_cache = cache_transcricoes.obter(chave)
+    if em_cache:
+        return em_cache["texto"]
+    
+    segmentos = []
+    async for novos, _, _, _ in pool_inferencia.transcrever_stream(audio, idioma, modelo):
+        segmentos.extend(novos)
+    texto = "".join(s["texto"] for s in segmentos).strip()
+    cache_transcricoes.salvar(chave, texto, segmentos, modelo=modelo, idioma=idioma)
+    return texto
 
-async def transcrever_audio_em_chunks(caminho_audio, client_id, transcricao_id, titulo, idioma='pt'):
-    """Transcreve o áudio em chunks e envia atualizações via WebSocket com sistema de retomada aprimorado"""
+async def transcrever_audio_em_chunks(caminho_audio, transcricao_id, titulo, idioma='pt', modelo=None):
+    """Transcreve o áudio em chunks e publica as atualizações do job, com sistema de retomada aprimorado"""
     try:
-        if not modelo_atual:
-            raise Exception("Modelo não carregado")
-        
-        # Verifica se a conexão ainda está ativa antes de começar
-        if not manager.is_connected(client_id):
-            print(f"Conexão WebSocket inativa para {client_id}, abortando transcrição")
+        if armazem_jobs.status(transcricao_id) == "cancelada":
+            print(f"Transcrição {transcricao_id} cancelada antes de começar")
             return None
         
-        # Notifica o cliente que o processamento começou
-        sent = await manager.send_message(json.dumps({
-            "tipo": "status",
-            "mensagem": f"Preparando áudio para transcrição ({modelo_atual_nome})..."
-        }), client_id)
+        # Verifica se há uma transcrição parcial salva (checkpoint de uma execução anterior)
+        transcricao_parcial = carregar_transcricao_parcial(transcricao_id)
         
-        if not sent:
-            print("Falha ao enviar mensagem inicial, abortando transcrição")
-            return None
+        # O modelo é do job, então trocas via API não o afetam;
+        # uma retomada continua com o mesmo modelo do checkpoint
+        nome_modelo = (transcricao_parcial or {}).get("modelo") or modelo or modelo_atual_nome
         
-        # Verifica se há uma transcrição parcial salva e se está realmente completa
-        transcricao_parcial = carregar_transcricao_parcial(transcricao_id)
-        texto_atual = ""
+        # Notifica quem acompanha o job que o processamento começou
+        await publicar(transcricao_id, {
+            "tipo": "status",
+            "mensagem": f"Preparando áudio para transcrição ({nome_modelo})..."
+        })
+        
+        segmentos = []
+        posicao_inicial = 0.0
         
         # CORREÇÃO PRINCIPAL: Só usa transcrição parcial se for uma retomada legítima
         if transcricao_parcial and transcricao_parcial.get("concluido", False):
             # Se já está concluída, retorna o resultado salvo
             texto_completo = transcricao_parcial["texto"]
             print(f"Transcrição {transcricao_id} já estava completa, usando resultado salvo")
-            
-            # Atualiza interface diretamente para 100%
-            await manager.send_message(json.dumps({
-                "tipo": "transcricao_parcial", 
-                "texto": texto_completo,
-                "progresso": 100,
-                "transcricao_id": transcricao_id,
-                "titulo": titulo,
-                "etapa": "Transcrição já concluída"
-            }), client_id)
-            
-            # Marca como concluída
-            transcricoes_ativas[transcricao_id]["status"] = "concluida"
-            transcricoes_ativas[transcricao_id]["texto"] = texto_completo
-            
-            await manager.send_message(json.dumps({
-                "tipo": "transcricao_concluida", 
-                "transcricao_id": transcricao_id,
-                "titulo": titulo,
-                "tempo_processamento": "0.0s (cache)"
-            }), client_id)
-            
+            await concluir_sem_inferencia(transcricao_id, titulo, texto_completo,
+                                          "Transcrição já concluída")
             return texto_completo
         
-        elif transcricao_parcial and not transcricao_parcial.get("concluido", False):
-            # Se há transcrição parcial incompleta, mostra progresso parcial mas refaz
-            texto_atual = transcricao_parcial["texto"]
-            print(f"Encontrada transcrição parcial para {transcricao_id}, mas refazendo processamento")
+        elif transcricao_parcial and transcricao_parcial.get("segmentos"):
+            # Se há transcrição parcial incompleta, continua a partir do último segmento concluído
+            segmentos = transcricao_parcial["segmentos"]
+            posicao_inicial = transcricao_parcial.get("posicao", segmentos[-1]["fim"])
+            duracao_anterior = transcricao_parcial.get("duracao") or 0
+            print(f"Encontrada transcrição parcial para {transcricao_id}, retomando a partir de {formatar_tempo(posicao_inicial)}")
             
-            await manager.send_message(json.dumps({
+            await publicar(transcricao_id, {
                 "tipo": "transcricao_parcial", 
-                "texto": texto_atual,
-                "progresso": 25,  # Progresso parcial
+                "texto": transcricao_parcial["texto"],
+                "progresso": min(99, 30 + int(69 * posicao_inicial / duracao_anterior)) if duracao_anterior else 30,
                 "transcricao_id": transcricao_id,
                 "titulo": titulo,
-                "etapa": "Retomando processamento..."
-            }), client_id)
-        
-        # Verifica conexão antes de iniciar processamento pesado
-        if not manager.is_connected(client_id):
-            print(f"Conexão perdida durante preparação para {client_id}")
-            return None
+                "etapa": f"Retomando a partir de {formatar_tempo(posicao_inicial)}..."
+            })
         
         # Notifica sobre o início da transcrição
-        await manager.send_message(json.dumps({
+        await publicar(transcricao_id, {
             "tipo": "status",
-            "mensagem": f"Iniciando transcrição com modelo {modelo_atual_nome}..."
-        }), client_id)
+            "mensagem": f"Iniciando transcrição com modelo {nome_modelo}..."
+        })
         
-        # Notifica o processamento de áudio
-        await manager.send_message(json.dumps({
-            "tipo": "transcricao_parcial", 
-            "texto": "",
-            "progresso": 30,
-            "transcricao_id": transcricao_id,
-            "titulo": titulo,
-            "etapa": "Processando áudio"
-        }), client_id)
+        # Decodifica o áudio uma única vez (fora do event loop)
+        audio = await pool_inferencia.carregar_audio(caminho_audio)
         
-        # Verifica conexão antes do processamento principal
-        if not manager.is_connected(client_id):
-            print(f"Conexão perdida antes do processamento principal para {client_id}")
-            return None
+        # O mesmo áudio já transcrito com o mesmo modelo e idioma sai direto do cache
+        chave_cache = cache_transcricoes.chave(await asyncio.to_thread(hash_audio, audio),
+                                               nome_modelo, idioma, OPCOES_DECODIFICACAO)
+        em_cache = cache_transcricoes.obter(chave_cache)
+        if em_cache:
+            print(f"Transcrição {transcricao_id} encontrada no cache, sem inferência")
+            await salvar_transcricao_parcial(transcricao_id, em_cache["texto"], True, em_cache["segmentos"],
+                                             len(audio) / TAXA_AMOSTRAGEM, modelo=nome_modelo, idioma=idioma,
+                                             caminho_audio=caminho_audio, titulo=titulo)
+            await concluir_sem_inferencia(transcricao_id, titulo, em_cache["texto"],
+                                          "Transcrição encontrada no cache")
+            return em_cache["texto"]
+        
+        # Com o áudio decodificado a duração é exata: corrige a previsão (ETA) do job
+        duracao_restante = len(audio) / TAXA_AMOSTRAGEM - posicao_inicial
+        fila_jobs.atualizar_previsao(transcricao_id, previsor_duracao.prever(nome_modelo, duracao_restante))
         
         # Inicia a transcrição efetivamente
         tempo_inicio = time.time()
         print(f"Iniciando transcrição Whisper para {transcricao_id}")
         
-        # PROCESSAMENTO PRINCIPAL - sempre executa para garantir resultado completo
-        transcricao = modelo_atual.transcribe(caminho_audio, language=idioma)
-        tempo_total = time.time() - tempo_inicio
-        texto_completo = transcricao['text']
-        
-        print(f"Transcrição Whisper concluída para {transcricao_id} em {tempo_total:.1f}s")
-        
-        # Verifica conexão após processamento
-        if not manager.is_connected(client_id):
-            print(f"Conexão perdida após processamento para {client_id}, salvando resultado")
-            # Salva o resultado mesmo se a conexão caiu
-            salvar_transcricao_parcial(transcricao_id, texto_completo, True)
-            transcricoes_ativas[transcricao_id]["status"] = "concluida"
-            transcricoes_ativas[transcricao_id]["texto"] = texto_completo
-            return texto_completo
-        
-        # Simula processamento em chunks para mostrar progresso
-        pontos = [50, 70, 85, 95, 100]
-        
-        for i, ponto in enumerate(pontos):
-            # Verifica conexão antes de cada envio
-            if not manager.is_connected(client_id):
-                print(f"Conexão perdida durante envio de progresso para {client_id}")
-                break
-                
-            if ponto == 100:
-                texto_atual = texto_completo
-                etapa = "Transcrição completa"
-            else:
-                # Mostra progresso gradual do texto
-                char_position = int((ponto/100) * len(texto_completo))
-                texto_atual = texto_completo[:char_position]
-                etapa = f"Finalizando transcrição ({i+1}/{len(pontos)})"
+        # PROCESSAMENTO PRINCIPAL - cada segmento é enviado assim que o Whisper o decodifica
+        texto_completo = "".join(s["texto"] for s in segmentos).strip()
+        texto_publicado = texto_completo  # Os eventos de progresso levam só o que mudou desde então
+        prompt = texto_completo[-200:] or None
+        checkpoint = {
+            "modelo": nome_modelo,
+            "idioma": idioma,
+            "caminho_audio": caminho_audio,
+            "titulo": titulo,
+            "duracao": len(audio) / TAXA_AMOSTRAGEM
+        }
+        posicao = posicao_inicial
+        async for novos, posicao, duracao, fracao in pool_inferencia.transcrever_stream(
+                audio, idioma, nome_modelo, inicio=posicao_inicial, prompt=prompt):
+            segmentos.extend(novos)
+            texto_completo = "".join(s["texto"] for s in segmentos).strip()
             
-            # Salva transcrição parcial
-            salvar_transcricao_parcial(transcricao_id, texto_atual, ponto == 100)
+            # A transcrição continua mesmo sem conexão; o checkpoint fica salvo para retomada
+            await salvar_transcricao_parcial(transcricao_id, texto_completo, False, segmentos, posicao, **checkpoint)
             
-            # Envia atualização se conexão ativa
-            success = await manager.send_message(json.dumps({
-                "tipo": "transcricao_parcial", 
-                "texto": texto_atual,
-                "progresso": ponto,
+            if armazem_jobs.status(transcricao_id) == "cancelada":
+                print(f"Transcrição {transcricao_id} cancelada durante o processamento")
+                return None
+            
+            # Progresso real, com base na fração do áudio já decodificada (30% a 99%)
+            progresso = min(99, 30 + int(69 * fracao))
+            if duracao_restante > 0:
+                fila_jobs.registrar_progresso(transcricao_id, (posicao - posicao_inicial) / duracao_restante)
+            delta = delta_texto(texto_publicado, texto_completo)
+            texto_publicado = texto_completo
+            await publicar(transcricao_id, {
+                "tipo": TIPO_DELTA,
+                **delta,
+                "segmentos": novos,
+                "progresso": progresso,
                 "transcricao_id": transcricao_id,
                 "titulo": titulo,
-                "etapa": etapa,
-                "tempo_processamento": f"{tempo_total:.1f}s"
-            }), client_id)
-            
-            if not success:
-                print(f"Falha ao enviar progresso {ponto}% para {client_id}")
-                break
-            
-            # Pausa menor para mostrar progresso
-            await asyncio.sleep(0.3)
+                "etapa": f"Transcrevendo ({formatar_tempo(posicao)} de {formatar_tempo(duracao)})",
+                "tempo_processamento": f"{time.time() - tempo_inicio:.1f}s",
+                **eta_do_job(transcricao_id)
+            })
+        
+        tempo_total = time.time() - tempo_inicio
+        print(f"Transcrição Whisper concluída para {transcricao_id} em {tempo_total:.1f}s")
+        previsor_duracao.registrar(nome_modelo, duracao_restante, tempo_total)
+        
+        await salvar_transcricao_parcial(transcricao_id, texto_completo, True, segmentos, posicao, **checkpoint)
+        cache_transcricoes.salvar(chave_cache, texto_completo, segmentos, modelo=nome_modelo, idioma=idioma)
+        await publicar(transcricao_id, {
+            "tipo": TIPO_DELTA,
+            **delta_texto(texto_publicado, texto_completo),
+            "progresso": 100,
+            "transcricao_id": transcricao_id,
+            "titulo": titulo,
+            "etapa": "Transcrição completa",
+            "tempo_processamento": f"{tempo_total:.1f}s"
+        })
         
         # Marca como concluída sempre (independente da conexão)
-        transcricoes_ativas[transcricao_id]["status"] = "concluida"
-        transcricoes_ativas[transcricao_id]["texto"] = texto_completo
+        armazem_jobs.atualizar(transcricao_id, status="concluida", texto=texto_completo)
+        await indexar_transcricao(transcricao_id, titulo, segmentos, texto_completo)
         
         # Tenta enviar mensagem de conclusão
-        await manager.send_message(json.dumps({
+        await publicar(transcricao_id, {
             "tipo": "transcricao_concluida", 
             "transcricao_id": transcricao_id,
             "titulo": titulo,
             "tempo_processamento": f"{tempo_total:.1f}s"
-        }), client_id)
+        })
         
         global ultima_transcricao
         ultima_transcricao = texto_completo
@@ -568,41 +507,79 @@ async def transcrever_audio_em_chunks(caminho_audio, client_id, transcricao_id,
         
     except Exception as e:
         # Marca como falha
-        if transcricao_id in transcricoes_ativas:
-            transcricoes_ativas[transcricao_id]["status"] = "falha"
-            transcricoes_ativas[transcricao_id]["erro"] = str(e)
+        armazem_jobs.atualizar(transcricao_id, status="falha", erro=str(e))
         
         # Tenta notificar o cliente sobre o erro
-        await manager.send_message(json.dumps({
+        await publicar(transcricao_id, {
             "tipo": "erro", 
             "mensagem": f"Erro na transcrição: {str(e)}",
             "transcricao_id": transcricao_id
-        }), client_id)
+        })
         
         print(f"Erro na transcrição {transcricao_id}: {str(e)}")
         return None
-
-def transcrever_audio(caminho_audio, idioma='pt'):
-    """Versão síncrona para compatibilidade com código existente"""
-    try:
-        if not modelo_atual:
-            raise Exception("Modelo não carregado")
-        resultado = modelo_atual.transcribe(caminho_audio, language=idioma)
-        return resultado['text']
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Cancelada, com falha ou concluída: grava em disco o que falta do diário e fecha o arquivo
+        # (os checkpoints continuam no disco para a retomada)
+        try:
+            await asyncio.to_thread(diario_checkpoints.fechar, transcricao_id)
+        except OSError as e:
+            print(f"Erro ao fechar o diário de checkpoints de {transcricao_id}: {e}")
 
 # Define o modelo para o corpo da requisição de insights
 class InsightsRequest(BaseModel):
     transcricao_id: Optional[str] = None
     pergunta: str
+    # auto: trechos relevantes quando a transcrição é longa; completo: sempre o texto inteiro;
+    # trechos: sempre só os trechos relevantes (com o tempo de cada um)
+    modo: Optional[str] = "auto"
+
+MODOS_INSIGHTS = ("auto", "completo", "trechos")
+
+# Mudar quando o prompt de insights mudar, para não reaproveitar respostas do prompt antigo
+VERSAO_PROMPT_INSIGHTS = 1
+
+def documento_indexado(transcricao_id):
+    """ID da transcrição no índice de busca (job ou arquivo em transcriptions/), ou None"""
+    for documento_id in (transcricao_id, f"arquivo:{transcricao_id}"):
+        if indice_busca.existe(documento_id):
+            return documento_id
+    return None
+
+async def gerar_insights(texto: str, pergunta_usuario: str, transcricao_id: str = None, modo: str = "auto"):
+    """
+    Gera insights usando a API OpenRouter com base na pergunta do usuário
 
-def gerar_insights(texto: str, pergunta_usuario: str):
-    """Gera insights usando a API OpenRouter com base na pergunta do usuário"""
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        print("Aviso: Chave API do OpenRouter não configurada. Não será possível gerar insights.")
-        return "Chave API do OpenRouter não configurada."
+    Returns:
+        (resposta ou mensagem de erro, metadados: modo usado, cache e trechos citados)
+    """
+    passagens = []
+    if modo != "completo" and transcricao_id:
+        documento_id = await asyncio.to_thread(documento_indexado, transcricao_id)
+        # Transcrição curta ou pergunta sobre o todo: o texto inteiro responde melhor
+        if documento_id and (modo == "trechos" or (not pergunta_geral(pergunta_usuario)
+                                                   and estimar_tokens(texto) > insights_trechos.limite_tokens)):
+            passagens = await asyncio.to_thread(insights_trechos.buscar, documento_id, pergunta_usuario)
+    if passagens:
+        modo_usado = "trechos"
+    elif insights_longos.precisa(texto):
+        modo_usado = "map_reduce"
+    else:
+        modo_usado = "direto"
+
+    chave = cache_insights.chave(hash_texto(texto), pergunta_usuario, cliente_llm.modelo,
+                                 f"{VERSAO_PROMPT_INSIGHTS}-{modo_usado}")
+    em_cache = await asyncio.to_thread(cache_insights.obter, chave)
+    metadados = {
+        "modo": modo_usado,
+        "cache": "hit" if em_cache else "miss",
+        "modelo": cliente_llm.modelo,
+        "hits": cache_insights.hits,
+        "misses": cache_insights.misses,
+    }
+    if em_cache:
+        metadados.update(em_cache.get("detalhes") or {})
+        return em_cache["resposta"], metadados
 
     # Construir o prompt dinâmico
     prompt = f"""
@@ -619,46 +596,38 @@ def gerar_insights(texto: str, pergunta_usuario: str):
     Resposta:
     """
 
+    detalhes = {}
     try:
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}"
-            },
-            json={
-                "model": "google/gemini-2.5-flash-preview", # Modelo atualizado
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        response.raise_for_status() # Levanta erro para status HTTP 4xx/5xx
-        data = response.json()
-        
-        # Verificação robusta da resposta da API
-        if data.get('choices') and len(data['choices']) > 0:
-            if data['choices'][0].get('message') and data['choices'][0]['message'].get('content'):
-                return data['choices'][0]['message']['content']
-            else:
-                print(f"Resposta da API malformada (faltando message/content): {data}")
-                return "Erro: Resposta da API inválida."
+        if modo_usado == "trechos":
+            resposta, detalhes = await insights_trechos.responder(passagens, pergunta_usuario)
+        elif modo_usado == "map_reduce":
+            resposta, detalhes = await insights_longos.responder(texto, pergunta_usuario)
         else:
-            print(f"Resposta da API malformada (faltando choices): {data}")
-            return "Erro: Resposta da API inválida."
-            
-    except requests.exceptions.RequestException as e:
+            resposta = await cliente_llm.completar([{"role": "user", "content": prompt}])
+    except CircuitoAberto as e:
+        print(f"Insights recusados: {e}")
+        return f"Erro ao gerar insights: {e}", metadados
+    except ErroLLM as e:
         print(f"Erro ao chamar a API OpenRouter: {e}")
-        error_detail = str(e)
-        if e.response is not None:
-            try:
-                # Tenta obter detalhes do corpo da resposta do erro, se houver
-                error_detail = f"{e} - {e.response.text}"
-            except Exception:
-                pass # Ignora se não conseguir ler o corpo da resposta
-        return f"Erro ao gerar insights: {error_detail}"
+        if not os.getenv("OPENROUTER_API_KEY"):
+            return str(e), metadados
+        return f"Erro ao gerar insights: {e}", metadados
     except Exception as e:
         print(f"Erro inesperado ao gerar insights: {e}")
-        return f"Erro inesperado ao gerar insights."
+        return f"Erro inesperado ao gerar insights.", metadados
+
+    metadados.update(detalhes)
+    await salvar_insight_em_cache(chave, resposta, pergunta_usuario, detalhes)
+    return resposta, metadados
+
+async def salvar_insight_em_cache(chave, resposta, pergunta_usuario, detalhes=None):
+    """Só respostas válidas vão para o cache; erros são tentados de novo na próxima pergunta"""
+    try:
+        await asyncio.to_thread(cache_insights.salvar, chave, resposta, pergunta=pergunta_usuario,
+                                modelo=cliente_llm.modelo, versao_prompt=VERSAO_PROMPT_INSIGHTS,
+                                detalhes=detalhes or {})
+    except OSError as e:
+        print(f"Erro ao salvar resposta de insights no cache: {e}")
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -668,108 +637,287 @@ async def home(request: Request):
         "modelo_atual": modelo_atual_nome
     })
 
+@app.get("/health/live")
+async def health_live():
+    """O processo está de pé e atendendo HTTP"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Pronto para receber tráfego somente depois que o modelo inicial foi carregado"""
+    if estado_aquecimento["status"] != "pronto":
+        return JSONResponse(status_code=503, content=estado_aquecimento)
+    return estado_aquecimento
+
 @app.get("/modelos")
 async def listar_modelos():
     return {"modelos": MODELOS}
 
+@app.get("/cache/estatisticas")
+async def estatisticas_cache():
+    return {
+        "transcricoes": cache_transcricoes.estatisticas(),
+        "youtube": cache_youtube.estatisticas(),
+        "insights": cache_insights.estatisticas()
+    }
+
+@app.get("/llm/estatisticas")
+async def estatisticas_llm():
+    """Estado do disjuntor e contadores do cliente da API de LLM"""
+    return cliente_llm.estatisticas()
+
+@app.get("/fila")
+async def estatisticas_fila():
+    return {**fila_jobs.estatisticas(), "eventos": barramento_eventos.estatisticas()}
+
+@app.get("/modelos/memoria")
+async def memoria_modelos():
+    """Modelos carregados em cada processo de inferência, a memória usada por cada um e o total"""
+    return {
+        "modelo_atual": modelo_atual_nome,
+        **pool_inferencia.resumo_memoria()
+    }
+
 @app.post("/mudar-modelo/{nome_modelo}")
 async def mudar_modelo(nome_modelo: str):
+    """Define o modelo padrão das próximas transcrições, carregando-o em background"""
+    global modelo_pendente, erro_troca_modelo
     if nome_modelo not in MODELOS:
         raise HTTPException(status_code=400, detail="Modelo não disponível")
     
-    if carregar_modelo(nome_modelo):
+    if nome_modelo == modelo_atual_nome:
+        modelo_pendente = None
         return {"status": "success", "modelo": nome_modelo}
-    else:
-        raise HTTPException(status_code=500, detail="Erro ao carregar modelo")
+    
+    if modelo_pendente != nome_modelo:
+        modelo_pendente = nome_modelo
+        erro_troca_modelo = None
+        asyncio.create_task(carregar_modelo(nome_modelo))
+    
+    return {
+        "status": "carregando",
+        "modelo": nome_modelo,
+        "modelo_atual": modelo_atual_nome,
+        "message": "Modelo sendo carregado em background. Transcrições em andamento não são afetadas."
+    }
+
+@app.get("/modelo-status")
+async def modelo_status():
+    return {
+        "modelo_atual": modelo_atual_nome,
+        "modelo_pendente": modelo_pendente,
+        "erro": erro_troca_modelo
+    }
+
+def validar_modelo(modelo):
+    """Retorna o modelo do job (ou o padrão atual), validando o nome"""
+    if not modelo:
+        return modelo_atual_nome
+    if modelo not in MODELOS:
+        raise HTTPException(status_code=400, detail="Modelo não disponível")
+    return modelo
 
 @app.post("/iniciar-transcricao-youtube")
-async def iniciar_transcricao_youtube(url: str = Form(...), background_tasks: BackgroundTasks = None):
+async def iniciar_transcricao_youtube(request: Request, url: str = Form(...), modelo: Optional[str] = Form(None), background_tasks: BackgroundTasks = None):
+    modelo = validar_modelo(modelo)
+    exigir_vaga_na_fila()
     try:
         client_id = str(uuid.uuid4())
         transcricao_id = str(uuid.uuid4())
         
         # Registra a transcrição como "em andamento"
-        transcricoes_ativas[transcricao_id] = {
-            "client_id": client_id,
-            "tipo": "youtube",
-            "url": url,
-            "status": "em_andamento",
-            "iniciado_em": datetime.now().isoformat()
-        }
+        armazem_jobs.criar(
+            transcricao_id,
+            client_id=client_id,
+            tipo="youtube",
+            url=url,
+            modelo=modelo,
+            status="em_andamento",
+        )
+        # A duração só é conhecida se o vídeo já estiver no cache; senão a fila usa uma estimativa
+        em_cache = cache_youtube.consultar(url, "original")
+        eta = await enfileirar_job(transcricao_id, (em_cache or {}).get("duracao"), modelo,
+                                   origem_requisicao(request))
         
         return {
             "status": "iniciado", 
             "client_id": client_id, 
             "transcricao_id": transcricao_id,
-            "message": "Transcrição iniciada. Conecte-se ao WebSocket para receber atualizações."
+            **eta,
+            "message": "Transcrição na fila. Conecte-se ao WebSocket para receber atualizações."
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/iniciar-transcricao-arquivo")
-async def iniciar_transcricao_arquivo(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def iniciar_transcricao_arquivo(request: Request):
+    # A vaga é conferida antes de receber o arquivo, para não aceitar um upload inteiro e recusá-lo depois
+    exigir_vaga_na_fila()
+    client_id = str(uuid.uuid4())
+    transcricao_id = str(uuid.uuid4())
+
+    # Grava o arquivo em blocos, extraindo o áudio enquanto o upload chega
+    upload = await receber_upload(request, "videos", transcricao_id)
     try:
-        client_id = str(uuid.uuid4())
-        transcricao_id = str(uuid.uuid4())
-        
-        # Salva o arquivo temporariamente
-        temp_path = f"videos/{transcricao_id}_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Registra a transcrição como "em andamento"
-        transcricoes_ativas[transcricao_id] = {
-            "client_id": client_id,
-            "tipo": "arquivo",
-            "caminho": temp_path,
-            "nome_arquivo": file.filename,
-            "status": "em_andamento",
-            "iniciado_em": datetime.now().isoformat()
-        }
-        
-        return {
-            "status": "iniciado", 
-            "client_id": client_id, 
-            "transcricao_id": transcricao_id,
-            "message": "Transcrição iniciada. Conecte-se ao WebSocket para receber atualizações."
-        }
+        modelo = validar_modelo(upload["campos"].get("modelo"))
+    except HTTPException:
+        remover_upload(upload)
+        raise
+
+    try:
+        return await registrar_transcricao_arquivo(transcricao_id, client_id, upload, modelo,
+                                                   origem_requisicao(request))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def registrar_transcricao_arquivo(transcricao_id, client_id, upload, modelo, origem=None):
+    """Registra a transcrição de um arquivo já recebido e a coloca na fila"""
+    armazem_jobs.criar(
+        transcricao_id,
+        client_id=client_id,
+        tipo="arquivo",
+        caminho=upload["caminho"],
+        nome_arquivo=upload["nome_arquivo"],
+        titulo=os.path.splitext(upload["nome_arquivo"])[0],
+        audio_pre_extraido=upload.get("caminho_audio"),
+        sha256=upload["sha256"],
+        tamanho=upload["tamanho"],
+        modelo=modelo,
+        status="em_andamento",
+    )
+    duracao_audio = await duracao_da_midia(upload.get("caminho_audio") or upload["caminho"])
+    try:
+        eta = await enfileirar_job(transcricao_id, duracao_audio, modelo, origem)
+    except HTTPException:
+        remover_upload(upload)
+        raise
+    
+    return {
+        "status": "iniciado", 
+        "client_id": client_id, 
+        "transcricao_id": transcricao_id,
+        "sha256": upload["sha256"],
+        **eta,
+        "message": "Transcrição na fila. Conecte-se ao WebSocket para receber atualizações."
+    }
+
+# Upload retomável: criar -> enviar partes (PATCH) -> consultar -> finalizar
+@app.post("/uploads")
+async def criar_upload(nome_arquivo: str = Form(...), tamanho: int = Form(...),
+                       sha256: Optional[str] = Form(None), modelo: Optional[str] = Form(None)):
+    modelo = validar_modelo(modelo)
+    status = uploads_retomaveis.criar(nome_arquivo, tamanho, sha256, modelo=modelo)
+    return JSONResponse(status, status_code=201, headers={"Upload-Offset": str(status["offset"])})
+
+@app.patch("/uploads/{upload_id}")
+async def enviar_parte_upload(upload_id: str, request: Request):
+    """Grava o corpo da requisição no offset do cabeçalho Upload-Offset (checksum opcional em Upload-Checksum)"""
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Cabeçalho Upload-Offset ausente ou inválido")
+    status = await uploads_retomaveis.receber_parte(upload_id, offset, request.stream(),
+                                                   request.headers.get("upload-checksum"))
+    return JSONResponse(status, headers={"Upload-Offset": str(status["offset"])})
+
+@app.get("/uploads/{upload_id}")
+async def status_upload(upload_id: str):
+    status = uploads_retomaveis.status(upload_id)
+    return JSONResponse(status, headers={"Upload-Offset": str(status["offset"]),
+                                         "Upload-Length": str(status["tamanho"])})
+
+@app.head("/uploads/{upload_id}")
+async def status_upload_head(upload_id: str):
+    status = uploads_retomaveis.status(upload_id)
+    return Response(headers={"Upload-Offset": str(status["offset"]),
+                             "Upload-Length": str(status["tamanho"])})
+
+@app.delete("/uploads/{upload_id}")
+async def cancelar_upload(upload_id: str):
+    uploads_retomaveis.cancelar(upload_id)
+    return {"status": "cancelado", "upload_id": upload_id}
+
+@app.post("/uploads/{upload_id}/finalizar")
+async def finalizar_upload(upload_id: str, request: Request):
+    """Confere o upload completo e cria a transcrição do arquivo"""
+    exigir_vaga_na_fila()
+    client_id = str(uuid.uuid4())
+    transcricao_id = str(uuid.uuid4())
+    nome_arquivo = uploads_retomaveis.status(upload_id)["nome_arquivo"]
+    upload = await uploads_retomaveis.finalizar(upload_id, f"videos/{transcricao_id}_{nome_arquivo}")
+    return await registrar_transcricao_arquivo(transcricao_id, client_id, upload, upload["metadados"].get("modelo"),
+                                               origem_requisicao(request))
+
 @app.get("/transcricoes")
-async def listar_transcricoes():
-    return {"transcricoes": transcricoes_ativas}
+async def listar_transcricoes(status: Optional[str] = None, tipo: Optional[str] = None,
+                              client_id: Optional[str] = None, desde: Optional[str] = None,
+                              limite: int = 50, offset: int = 0):
+    """Lista as transcrições (sem o texto), da mais recente para a mais antiga, com filtros e paginação"""
+    limite = max(1, min(limite, 500))
+    offset = max(0, offset)
+    total, jobs = armazem_jobs.listar(status, tipo, client_id, desde, limite, offset)
+    return {
+        "transcricoes": dict(jobs),
+        "total": total,
+        "limite": limite,
+        "offset": offset
+    }
+
+@app.get("/buscar")
+async def buscar_transcricoes(q: str, limite: int = 20, offset: int = 0):
+    """Busca textual em todas as transcrições: palavras, "frases entre aspas" e prefixos*"""
+    limite = max(1, min(limite, 100))
+    offset = max(0, offset)
+    inicio = time.perf_counter()
+    try:
+        total, resultados = await asyncio.to_thread(indice_busca.buscar, q, limite, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for resultado in resultados:
+        resultado["transcricao_id"] = resultado.pop("documento")
+        if resultado["inicio"] is not None:
+            resultado["inicio_formatado"] = formatar_tempo(resultado["inicio"])
+    return {
+        "consulta": q,
+        "total": total,
+        "limite": limite,
+        "offset": offset,
+        "resultados": resultados,
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    }
 
 @app.get("/transcricao/{transcricao_id}")
 async def obter_transcricao(transcricao_id: str):
-    # Verifica se a transcrição existe na lista de ativas
-    if transcricao_id not in transcricoes_ativas:
-        # Se não estiver nas ativas, verifica se existe um arquivo salvo
-        caminho = f"transcricoes/{transcricao_id}.json"
-        if os.path.exists(caminho):
+    # Verifica se a transcrição existe no armazém de jobs
+    if not armazem_jobs.existe(transcricao_id):
+        # Se não estiver registrada, verifica se existe um checkpoint salvo
+        dados_arquivo = carregar_transcricao_parcial(transcricao_id)
+        if dados_arquivo is not None:
             try:
-                with open(caminho, 'r', encoding='utf-8') as f:
-                    dados_arquivo = json.load(f)
-                    
                 # Recria o registro da transcrição com os dados básicos
-                transcricoes_ativas[transcricao_id] = {
-                    "status": "falha",  # Assume que foi interrompida
-                    "texto": dados_arquivo.get("texto", ""),
-                    "iniciado_em": dados_arquivo.get("timestamp", datetime.now().isoformat()),
-                    "tipo": "desconhecido",
-                    "titulo": "Transcrição Recuperada",
-                    "concluido": dados_arquivo.get("concluido", False)
-                }
+                armazem_jobs.criar(
+                    transcricao_id,
+                    status="falha",  # Assume que foi interrompida
+                    texto=dados_arquivo.get("texto", ""),
+                    iniciado_em=dados_arquivo.get("timestamp", datetime.now().isoformat()),
+                    tipo="desconhecido",
+                    titulo="Transcrição Recuperada",
+                    concluido=dados_arquivo.get("concluido", False)
+                )
                 
-                return transcricoes_ativas[transcricao_id]
+                return armazem_jobs.obter(transcricao_id, com_texto=True)
             except Exception as e:
                 print(f"Erro ao recuperar transcrição do arquivo: {str(e)}")
                 raise HTTPException(status_code=404, detail="Transcrição não encontrada ou corrompida")
         else:
             raise HTTPException(status_code=404, detail="Transcrição não encontrada")
     
-    dados = transcricoes_ativas[transcricao_id]
+    dados = armazem_jobs.obter(transcricao_id, com_texto=True)
+    dados.update(eta_do_job(transcricao_id))
     
     # Carrega a transcrição do arquivo
     transcricao = carregar_transcricao_parcial(transcricao_id)
@@ -780,29 +928,27 @@ async def obter_transcricao(transcricao_id: str):
     return dados
 
 @app.post("/retomar-transcricao/{transcricao_id}")
-async def retomar_transcricao(transcricao_id: str):
+async def retomar_transcricao(transcricao_id: str, request: Request):
     print(f"Tentativa de retomar transcrição: {transcricao_id}")
     
-    # Verifica se a transcrição existe na lista de ativas
-    if transcricao_id not in transcricoes_ativas:
-        # Tenta recuperar do arquivo
-        caminho = f"transcricoes/{transcricao_id}.json"
-        if os.path.exists(caminho):
+    # Verifica se a transcrição existe no armazém de jobs
+    if not armazem_jobs.existe(transcricao_id):
+        # Tenta recuperar do checkpoint
+        dados_arquivo = carregar_transcricao_parcial(transcricao_id)
+        if dados_arquivo is not None:
             try:
-                with open(caminho, 'r', encoding='utf-8') as f:
-                    dados_arquivo = json.load(f)
-                
                 # Se a transcrição já está concluída no arquivo, não precisa retomar
                 if dados_arquivo.get("concluido", False):
                     print(f"Transcrição {transcricao_id} já estava concluída")
-                    transcricoes_ativas[transcricao_id] = {
-                        "status": "concluida",
-                        "texto": dados_arquivo.get("texto", ""),
-                        "iniciado_em": dados_arquivo.get("timestamp", datetime.now().isoformat()),
-                        "tipo": "arquivo_recuperado",
-                        "titulo": "Transcrição Recuperada (Completa)",
-                        "concluido": True
-                    }
+                    armazem_jobs.criar(
+                        transcricao_id,
+                        status="concluida",
+                        texto=dados_arquivo.get("texto", ""),
+                        iniciado_em=dados_arquivo.get("timestamp", datetime.now().isoformat()),
+                        tipo="arquivo_recuperado",
+                        titulo="Transcrição Recuperada (Completa)",
+                        concluido=True
+                    )
                     
                     # Retorna status concluído
                     return {
@@ -812,19 +958,21 @@ async def retomar_transcricao(transcricao_id: str):
                         "texto": dados_arquivo.get("texto", "")
                     }
                 
-                # Recria o registro da transcrição para retomada
-                transcricoes_ativas[transcricao_id] = {
-                    "status": "falha",  # Marca como falha para poder retomar
-                    "texto": dados_arquivo.get("texto", ""),
-                    "iniciado_em": dados_arquivo.get("timestamp", datetime.now().isoformat()),
-                    "tipo": "arquivo_recuperado",
-                    "titulo": "Transcrição Recuperada",
-                    "progresso_anterior": len(dados_arquivo.get("texto", "")) > 0,
-                    "dados_salvos": dados_arquivo  # Preserva dados originais
-                }
+                # Recria o registro da transcrição para retomada (o checkpoint continua no arquivo)
+                armazem_jobs.criar(
+                    transcricao_id,
+                    status="falha",  # Marca como falha para poder retomar
+                    texto=dados_arquivo.get("texto", ""),
+                    iniciado_em=dados_arquivo.get("timestamp", datetime.now().isoformat()),
+                    tipo="arquivo_recuperado",
+                    titulo=dados_arquivo.get("titulo") or "Transcrição Recuperada",
+                    caminho_audio=dados_arquivo.get("caminho_audio"),
+                    progresso_anterior=len(dados_arquivo.get("texto", "")) > 0
+                )
                 
                 print(f"Transcrição {transcricao_id} recuperada do arquivo para retomada")
                 print(f"Texto parcial encontrado: {len(dados_arquivo.get('texto', ''))} caracteres")
+                print(f"Segmentos concluídos: {len(dados_arquivo.get('segmentos', []))} (até {dados_arquivo.get('posicao', 0):.1f}s)")
                 
             except Exception as e:
                 print(f"Erro ao recuperar transcrição do arquivo para retomada: {str(e)}")
@@ -832,7 +980,7 @@ async def retomar_transcricao(transcricao_id: str):
         else:
             raise HTTPException(status_code=404, detail="Transcrição não encontrada")
     
-    transcricao = transcricoes_ativas[transcricao_id]
+    transcricao = armazem_jobs.obter(transcricao_id, com_texto=True)
     
     # Verifica se podemos retomar
     if transcricao["status"] == "concluida":
@@ -847,6 +995,10 @@ async def retomar_transcricao(transcricao_id: str):
     if transcricao["status"] not in ["falha", "cancelada"] and not transcricao.get("progresso_anterior", False):
         raise HTTPException(status_code=400, detail=f"Não é possível retomar transcrição com status: {transcricao['status']}")
     
+    if fila_jobs.posicao(transcricao_id) is not None:
+        raise HTTPException(status_code=400, detail="Transcrição já está na fila ou em execução")
+    exigir_vaga_na_fila()
+    
     # Preserva informações importantes para a retomada
     dados_anteriores = {
         "texto_parcial": transcricao.get("texto", ""),
@@ -857,13 +1009,21 @@ async def retomar_transcricao(transcricao_id: str):
         "nome_arquivo_original": transcricao.get("nome_arquivo", "")
     }
     
-    # Atualiza o status para retomada
-    transcricao["status"] = "preparando_retomada"
-    transcricao["dados_anteriores"] = dados_anteriores
-    
-    # Retorna um novo client_id para reconexão
+    # Volta o job para a fila, com um novo client_id para reconexão
     novo_client_id = str(uuid.uuid4())
-    transcricao["client_id"] = novo_client_id
+    armazem_jobs.atualizar(
+        transcricao_id,
+        status="em_andamento",
+        dados_anteriores=dados_anteriores,
+        client_id=novo_client_id
+    )
+    # Só falta transcrever o trecho após o checkpoint
+    checkpoint = carregar_transcricao_parcial(transcricao_id) or {}
+    duracao_restante = None
+    if checkpoint.get("duracao"):
+        duracao_restante = max(0.0, checkpoint["duracao"] - checkpoint.get("posicao", 0.0))
+    eta = await enfileirar_job(transcricao_id, duracao_restante, transcricao.get("modelo"),
+                               origem_requisicao(request))
     
     print(f"Retomando transcrição {transcricao_id} com novo client_id {novo_client_id}")
     print(f"Dados anteriores preservados: {dados_anteriores}")
@@ -872,6 +1032,7 @@ async def retomar_transcricao(transcricao_id: str):
         "status": "preparando_retomada", 
         "client_id": novo_client_id, 
         "transcricao_id": transcricao_id,
+        **eta,
         "message": "Transcrição preparada para retomada. Conecte-se ao WebSocket para receber atualizações.",
         "progresso_anterior": transcricao.get("progresso_anterior", False),
         "texto_parcial": dados_anteriores["texto_parcial"]
@@ -885,6 +1046,9 @@ async def generate_insights_endpoint(request_data: InsightsRequest):
     texto_para_analise = None
     transcricao_id = request_data.transcricao_id
     pergunta = request_data.pergunta
+    modo = request_data.modo or "auto"
+    if modo not in MODOS_INSIGHTS:
+        raise HTTPException(status_code=400, detail=f"Modo inválido. Use: {', '.join(MODOS_INSIGHTS)}")
 
     if not pergunta or not pergunta.strip(): # Verifica se a pergunta não está vazia
          raise HTTPException(status_code=400, detail="A pergunta do usuário não pode estar vazia.")
@@ -914,228 +1078,409 @@ async def generate_insights_endpoint(request_data: InsightsRequest):
          raise HTTPException(status_code=404, detail="Texto da transcrição está vazio ou não pôde ser carregado.")
 
     # Chama a função para gerar insights com a pergunta
-    insights = gerar_insights(texto_para_analise, pergunta)
-    return {"insights": insights}
+    insights, metadados = await gerar_insights(texto_para_analise, pergunta, transcricao_id, modo)
+    return {"insights": insights, "metadados": metadados}
 
-@app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    transcricao_id = None
-    try:
-        await manager.connect(websocket, client_id)
-        print(f"Cliente WebSocket conectado: {client_id}")
-        
-        # Busca transcrição associada a este client_id
-        for tid, info in transcricoes_ativas.items():
-            if info.get("client_id") == client_id:
-                transcricao_id = tid
-                manager.set_transcricao_id(client_id, transcricao_id)
-                break
-        
-        if not transcricao_id:
-            await manager.send_message(json.dumps({
-                "tipo": "erro",
-                "mensagem": "Nenhuma transcrição associada a este cliente"
-            }), client_id)
-            return
+async def executar_job(transcricao_id):
+    """Processa um job da fila: baixa/extrai o áudio e transcreve, publicando o progresso"""
+    info = armazem_jobs.obter(transcricao_id)
+    if info is None or info["status"] == "cancelada":
+        return
+    
+    # Atualiza status para processamento
+    armazem_jobs.atualizar(transcricao_id, status="processando")
+    
+    # Em uma retomada, reaproveita o áudio do checkpoint (sem baixar/extrair de novo)
+    checkpoint = carregar_transcricao_parcial(transcricao_id) or {}
+    caminho_checkpoint = info.get("caminho_audio") or checkpoint.get("caminho_audio")
+    
+    if caminho_checkpoint and os.path.exists(caminho_checkpoint):
+        titulo = info.get("titulo") or checkpoint.get("titulo") or "Transcrição Recuperada"
+        await publicar(transcricao_id, {
+            "tipo": "preparando",
+            "mensagem": "Retomando a partir do áudio já processado...",
+            "progresso": 25,
+            "transcricao_id": transcricao_id
+        })
+        await transcrever_audio_em_chunks(caminho_checkpoint, transcricao_id, titulo,
+                                          checkpoint.get("idioma", "pt"), info.get("modelo"))
         
-        info = transcricoes_ativas[transcricao_id]
-        print(f"Transcrição associada: {transcricao_id}, Status: {info.get('status', 'desconhecido')}")
+    elif info["tipo"] == "youtube":
+        # Notifica que está baixando o vídeo do YouTube
+        await publicar(transcricao_id, {
+            "tipo": "baixando",
+            "mensagem": "Baixando áudio do YouTube...",
+            "progresso": 10,
+            "transcricao_id": transcricao_id
+        })
         
-        # Verifica o status atual
-        if info["status"] in ["concluida", "falha"]:
-            # Se já concluiu ou falhou, envia o status
-            await manager.send_message(json.dumps({
-                "tipo": info["status"],
+        # Baixa o áudio do YouTube
+        try:
+            caminho_audio, titulo = await asyncio.to_thread(baixar_audio_youtube, info["url"])
+            
+            # Atualiza o título na transcrição
+            armazem_jobs.atualizar(transcricao_id, titulo=titulo, caminho_audio=caminho_audio)
+            
+            # Notifica que o download foi concluído
+            await publicar(transcricao_id, {
+                "tipo": "preparando",
+                "mensagem": f"Áudio baixado com sucesso: {titulo}",
+                "progresso": 20,
                 "transcricao_id": transcricao_id
-            }), client_id)
+            })
             
-            # Se concluída, envia o texto
-            if info["status"] == "concluida" and "texto" in info:
-                await manager.send_message(json.dumps({
-                    "tipo": "transcricao_parcial",
-                    "texto": info["texto"],
-                    "progresso": 100,
-                    "transcricao_id": transcricao_id
-                }), client_id)
+            await transcrever_audio_em_chunks(caminho_audio, transcricao_id, titulo,
+                                              modelo=info.get("modelo"))
             
-            return
+        except Exception as e:
+            # Atualiza o status da transcrição
+            armazem_jobs.atualizar(transcricao_id, status="falha", erro=str(e))
+            
+            # Notifica o cliente sobre o erro
+            await publicar(transcricao_id, {
+                "tipo": "erro", 
+                "mensagem": f"Erro ao baixar áudio do YouTube: {str(e)}",
+                "transcricao_id": transcricao_id
+            })
+            print(f"Erro no download do YouTube para {transcricao_id}: {e}")
         
-        # Atualiza status para processamento
-        transcricoes_ativas[transcricao_id]["status"] = "processando"
+    elif info["tipo"] == "arquivo":
+        # Notifica que está extraindo o áudio
+        await publicar(transcricao_id, {
+            "tipo": "preparando",
+            "mensagem": "Extraindo áudio do vídeo...",
+            "progresso": 15,
+            "transcricao_id": transcricao_id
+        })
         
-        # Realiza a transcrição em background
-        if info["tipo"] == "youtube":
-            # Notifica que está baixando o vídeo do YouTube
-            await manager.send_message(json.dumps({
-                "tipo": "baixando",
-                "mensagem": "Baixando áudio do YouTube...",
-                "progresso": 10,
-                "transcricao_id": transcricao_id
-            }), client_id)
+        # Extrai áudio do vídeo
+        try:
+            caminho_pcm = info.get("audio_pre_extraido")
+            if caminho_pcm and os.path.exists(caminho_pcm):
+                # O áudio já foi decodificado durante o upload
+                caminho_audio = caminho_pcm
+                titulo = os.path.splitext(info["nome_arquivo"])[0]
+            else:
+                caminho_audio, titulo = await asyncio.to_thread(extrair_audio_video, info["caminho"])
             
-            # Baixa o áudio do YouTube
-            try:
-                caminho_audio, titulo = await asyncio.to_thread(baixar_audio_youtube, info["url"])
-                
-                # Verifica se conexão ainda está ativa após download
-                if not manager.is_connected(client_id):
-                    print(f"Conexão perdida após download para {client_id}")
-                    return
-                
-                # Atualiza o título na transcrição
-                transcricoes_ativas[transcricao_id]["titulo"] = titulo
-                
-                # Notifica que o download foi concluído
-                await manager.send_message(json.dumps({
-                    "tipo": "preparando",
-                    "mensagem": f"Áudio baixado com sucesso: {titulo}",
-                    "progresso": 20,
-                    "transcricao_id": transcricao_id
-                }), client_id)
-                
-                # Inicia a transcrição SEM create_task para melhor controle
-                await transcrever_audio_em_chunks(caminho_audio, client_id, transcricao_id, titulo)
-                
-            except Exception as e:
-                # Atualiza o status da transcrição
-                transcricoes_ativas[transcricao_id]["status"] = "falha"
-                transcricoes_ativas[transcricao_id]["erro"] = str(e)
-                
-                # Notifica o cliente sobre o erro
-                await manager.send_message(json.dumps({
-                    "tipo": "erro", 
-                    "mensagem": f"Erro ao baixar áudio do YouTube: {str(e)}",
-                    "transcricao_id": transcricao_id
-                }), client_id)
-                print(f"Erro no download do YouTube para {transcricao_id}: {e}")
+            # Atualiza o título na transcrição
+            armazem_jobs.atualizar(transcricao_id, titulo=titulo, caminho_audio=caminho_audio)
             
-        elif info["tipo"] == "arquivo":
-            # Notifica que está extraindo o áudio
-            await manager.send_message(json.dumps({
+            # Notifica que a extração foi concluída
+            await publicar(transcricao_id, {
                 "tipo": "preparando",
-                "mensagem": "Extraindo áudio do vídeo...",
-                "progresso": 15,
+                "mensagem": f"Áudio extraído com sucesso: {info['nome_arquivo']}",
+                "progresso": 25,
                 "transcricao_id": transcricao_id
-            }), client_id)
+            })
             
-            # Extrai áudio do vídeo
-            try:
-                caminho_audio, titulo = await asyncio.to_thread(extrair_audio_video, info["caminho"])
-                
-                # Verifica se conexão ainda está ativa após extração
-                if not manager.is_connected(client_id):
-                    print(f"Conexão perdida após extração para {client_id}")
-                    return
-                
-                # Atualiza o título na transcrição
-                transcricoes_ativas[transcricao_id]["titulo"] = titulo
-                
-                # Notifica que a extração foi concluída
-                await manager.send_message(json.dumps({
-                    "tipo": "preparando",
-                    "mensagem": f"Áudio extraído com sucesso: {info['nome_arquivo']}",
-                    "progresso": 25,
-                    "transcricao_id": transcricao_id
-                }), client_id)
-                
-                # Inicia a transcrição SEM create_task para melhor controle
-                await transcrever_audio_em_chunks(caminho_audio, client_id, transcricao_id, titulo)
-                
-            except Exception as e:
-                transcricoes_ativas[transcricao_id]["status"] = "falha"
-                transcricoes_ativas[transcricao_id]["erro"] = str(e)
-                
-                await manager.send_message(json.dumps({
-                    "tipo": "erro", 
-                    "mensagem": f"Erro ao extrair áudio do vídeo: {str(e)}",
-                    "transcricao_id": transcricao_id
-                }), client_id)
-                print(f"Erro na extração de áudio para {transcricao_id}: {e}")
-        
-        # Mantém a conexão aberta para receber comandos do cliente
-        while manager.is_connected(client_id):
-            try:
-                # Timeout para evitar bloqueio infinito
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                cmd = json.loads(data)
-                
-                if cmd["acao"] == "cancelar":
-                    # Cancela a transcrição
-                    transcricoes_ativas[transcricao_id]["status"] = "cancelada"
-                    await manager.send_message(json.dumps({
-                        "tipo": "cancelada",
-                        "transcricao_id": transcricao_id
-                    }), client_id)
-                    break
-                    
-            except asyncio.TimeoutError:
-                # Timeout normal, continua o loop
+            await transcrever_audio_em_chunks(caminho_audio, transcricao_id, titulo,
+                                              modelo=info.get("modelo"))
+            
+        except Exception as e:
+            armazem_jobs.atualizar(transcricao_id, status="falha", erro=str(e))
+            
+            await publicar(transcricao_id, {
+                "tipo": "erro", 
+                "mensagem": f"Erro ao extrair áudio do vídeo: {str(e)}",
+                "transcricao_id": transcricao_id
+            })
+            print(f"Erro na extração de áudio para {transcricao_id}: {e}")
+    
+    else:
+        erro = "O áudio original desta transcrição não está mais disponível para retomada"
+        armazem_jobs.atualizar(transcricao_id, status="falha", erro=erro)
+        await publicar(transcricao_id, {
+            "tipo": "erro",
+            "mensagem": erro,
+            "transcricao_id": transcricao_id
+        })
+
+def formatar_eta(previsao):
+    """Converte a previsão da fila (epoch) para o formato exposto na API e no WebSocket"""
+    return {
+        "posicao_fila": previsao["posicao"],
+        "inicio_previsto": datetime.fromtimestamp(previsao["inicio_previsto"]).isoformat(timespec="seconds"),
+        "fim_previsto": datetime.fromtimestamp(previsao["fim_previsto"]).isoformat(timespec="seconds"),
+        "duracao_prevista_s": round(previsao["duracao_prevista_s"])
+    }
+
+def eta_do_job(transcricao_id):
+    previsao = fila_jobs.previsao(transcricao_id)
+    return formatar_eta(previsao) if previsao else {}
+
+def mensagem_na_fila(transcricao_id, posicao, previsao):
+    inicio = datetime.fromtimestamp(previsao["inicio_previsto"]).strftime("%H:%M")
+    return {
+        "tipo": "na_fila",
+        "posicao": posicao,
+        "mensagem": f"Aguardando na fila (posição {posicao}, início previsto às {inicio})",
+        "transcricao_id": transcricao_id,
+        **formatar_eta(previsao)
+    }
+
+async def publicar_posicao_fila(transcricao_id, posicao, previsao):
+    await publicar(transcricao_id, mensagem_na_fila(transcricao_id, posicao, previsao))
+
+# Previsão do tempo de cada job pelo histórico de RTF (por modelo e host)
+previsor_duracao = PrevisorDuracao(armazem_jobs)
+
+# Fila de jobs: um número fixo de transcrições roda ao mesmo tempo, com ou sem cliente conectado
+fila_jobs = FilaJobs(executar_job, ao_mudar_posicao=publicar_posicao_fila)
+
+def origem_requisicao(request: Request):
+    """Identifica quem enviou o job (IP original atrás do proxy), para a política de fila justa"""
+    encaminhado = request.headers.get("x-forwarded-for")
+    if encaminhado:
+        return encaminhado.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+async def duracao_da_midia(caminho):
+    """Duração do áudio em segundos (ffprobe ou tamanho do PCM), ou None se não der para saber"""
+    try:
+        if caminho.endswith(EXTENSAO_PCM):
+            return os.path.getsize(caminho) / 4 / TAXA_AMOSTRAGEM
+        return (await asyncio.to_thread(sondar_midia, caminho))["duracao"]
+    except (OSError, RuntimeError) as e:
+        print(f"Não foi possível obter a duração de {caminho}: {e}")
+        return None
+
+def exigir_vaga_na_fila():
+    """Recusa o job com 429 (e Retry-After) se a fila estiver cheia"""
+    try:
+        fila_jobs.verificar_admissao()
+    except FilaCheia as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def fila_cheia_ao_enfileirar(e: FilaCheia):
+    """503 (e Retry-After) para quando a fila encheu entre a admissão e o enfileiramento (ex.: durante o upload)"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def enfileirar_job(transcricao_id, duracao_audio=None, modelo=None, origem=None, verificar_vaga=True):
+    """
+    Coloca o job na fila com a duração prevista e retorna o ETA (a fila avisa a posição a quem acompanha)
+
+    A vaga é conferida de novo aqui: a fila pode ter enchido enquanto o upload chegava.
+    Sem vaga, o job fica como falha e a requisição recebe 503.
+    """
+    modelo = modelo or modelo_atual_nome
+    previsto = previsor_duracao.prever(modelo, duracao_audio)
+    armazem_jobs.atualizar(transcricao_id, duracao_audio=duracao_audio, duracao_prevista_s=round(previsto),
+                           origem=origem)
+    try:
+        await fila_jobs.enfileirar(transcricao_id, previsto, origem, verificar_vaga=verificar_vaga)
+    except FilaCheia as e:
+        armazem_jobs.atualizar(transcricao_id, status="falha", erro=str(e))
+        raise fila_cheia_ao_enfileirar(e)
+    return eta_do_job(transcricao_id)
+
+def retrato_do_job(transcricao_id):
+    """Mensagens que reconstroem o estado atual do job, para quem não tem os eventos anteriores"""
+    info = armazem_jobs.obter(transcricao_id, com_texto=True) or {}
+    status = info.get("status")
+    # Job encerrado: as mesmas mensagens que o caminho ao vivo publica no fim
+    if status == "concluida":
+        mensagens = []
+        if info.get("texto") is not None:
+            mensagens.append({
+                "tipo": "transcricao_parcial",
+                "texto": info["texto"],
+                "progresso": 100,
+                "transcricao_id": transcricao_id
+            })
+        mensagens.append({"tipo": "transcricao_concluida", "transcricao_id": transcricao_id,
+                          "titulo": info.get("titulo")})
+        return mensagens
+    if status == "falha":
+        return [{"tipo": "erro", "mensagem": info.get("erro") or "A transcrição falhou",
+                 "transcricao_id": transcricao_id}]
+    if status == "cancelada":
+        return [{"tipo": "cancelada", "transcricao_id": transcricao_id}]
+    
+    previsao = fila_jobs.previsao(transcricao_id)
+    if previsao and previsao["posicao"]:
+        return [mensagem_na_fila(transcricao_id, previsao["posicao"], previsao)]
+    
+    # Job em execução neste servidor: o texto está em memória, no canal de eventos
+    em_memoria = barramento_eventos.retrato(transcricao_id)
+    if em_memoria:
+        return [{**em_memoria, "transcricao_id": transcricao_id, **eta_do_job(transcricao_id)}]
+    
+    parcial = carregar_transcricao_parcial(transcricao_id)
+    if parcial and parcial.get("texto"):
+        duracao = parcial.get("duracao") or 0
+        return [{
+            "tipo": "transcricao_parcial",
+            "texto": parcial["texto"],
+            "progresso": min(99, 30 + int(69 * parcial.get("posicao", 0) / duracao)) if duracao else 30,
+            "transcricao_id": transcricao_id,
+            "titulo": parcial.get("titulo"),
+            "etapa": "Transcrição em andamento...",
+            **eta_do_job(transcricao_id)
+        }]
+    return []
+
+async def acompanhar_job(websocket: WebSocket, transcricao_id: str, canal: Optional[str],
+                         desde: Optional[int], protocolo: int):
+    """
+    Envia ao WebSocket os eventos do job: primeiro os que o cliente perdeu (ou um
+    retrato do estado atual), depois os publicados ao vivo. O job roda na fila, não aqui.
+    """
+    assinatura, perdidos = barramento_eventos.assinar(transcricao_id, canal, desde, protocolo)
+    print(f"Assinante conectado ao job {transcricao_id} "
+          f"({'retrato do estado' if perdidos is None else f'{len(perdidos)} eventos reenviados'})")
+    
+    async def enviar_retrato():
+        for mensagem in retrato_do_job(transcricao_id):
+            await websocket.send_text(serializar({**mensagem, "seq": assinatura.ultimo_seq}))
+    
+    async def enviar_eventos():
+        while True:
+            eventos = await assinatura.proximos()
+            if eventos is None:
+                await enviar_retrato()
                 continue
-            except WebSocketDisconnect:
-                print(f"Cliente {client_id} desconectou durante loop de comandos")
-                break
+            for _, texto in eventos:
+                await websocket.send_text(texto)
     
+    async def receber_comandos():
+        while True:
+            cmd = json.loads(await websocket.receive_text())
+            if cmd.get("acao") == "retrato":
+                # Cliente detectou uma lacuna nos deltas e pede o texto completo
+                await enviar_retrato()
+            elif cmd.get("acao") == "cancelar":
+                # Cancela a transcrição (tira da fila ou interrompe na próxima janela)
+                armazem_jobs.atualizar(transcricao_id, status="cancelada")
+                await fila_jobs.remover(transcricao_id)
+                await publicar(transcricao_id, {
+                    "tipo": "cancelada",
+                    "transcricao_id": transcricao_id
+                })
+    
+    tarefas = []
+    try:
+        # O canal identifica a sequência de eventos: o cliente o informa ao reconectar
+        await websocket.send_text(json.dumps({
+            "tipo": "inscrito",
+            "transcricao_id": transcricao_id,
+            "canal": assinatura.canal.id,
+            "protocolo": assinatura.protocolo,
+            "retrato": perdidos is None
+        }))
+        if perdidos is None:
+            await enviar_retrato()
+        else:
+            for _, texto in perdidos:
+                await websocket.send_text(texto)
+        
+        tarefas = [asyncio.create_task(enviar_eventos()), asyncio.create_task(receber_comandos())]
+        concluidas, _ = await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+        for tarefa in concluidas:
+            tarefa.result()
     except WebSocketDisconnect:
-        print(f"Cliente {client_id} desconectou")
-        # Cliente desconectou mas a transcrição pode continuar em background
-        if transcricao_id and transcricao_id in transcricoes_ativas:
-            if transcricoes_ativas[transcricao_id]["status"] in ["em_andamento", "processando"]:
-                print(f"Transcrição {transcricao_id} continua em background após desconexão")
+        # Cliente desconectou mas a transcrição continua na fila
+        print(f"Assinante do job {transcricao_id} desconectou")
     except Exception as e:
-        print(f"Erro no WebSocket para {client_id}: {e}")
-        # Qualquer erro, tenta enviar ao cliente se possível
+        print(f"Erro no WebSocket do job {transcricao_id}: {e}")
         try:
-            await manager.send_message(json.dumps({
-                "tipo": "erro",
-                "mensagem": str(e)
-            }), client_id)
-        except:
+            await websocket.send_text(json.dumps({"tipo": "erro", "mensagem": str(e)}))
+        except Exception:
             pass
     finally:
-        print(f"Finalizando conexão WebSocket: {client_id}")
-        manager.disconnect(client_id)
+        for tarefa in tarefas:
+            tarefa.cancel()
+        barramento_eventos.cancelar(transcricao_id, assinatura)
+
+@app.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: str, canal: Optional[str] = None,
+                             desde: Optional[int] = None, protocolo: int = 1):
+    """Acompanha o job associado ao client_id (reconexões informam canal e último seq; protocolo=2 recebe deltas)"""
+    await websocket.accept()
+    transcricao_id, _ = armazem_jobs.por_cliente(client_id)
+    if not transcricao_id:
+        await websocket.send_text(json.dumps({
+            "tipo": "erro",
+            "mensagem": "Nenhuma transcrição associada a este cliente"
+        }))
+        await websocket.close()
+        return
+    await acompanhar_job(websocket, transcricao_id, canal, desde, min(protocolo, PROTOCOLO_ATUAL))
+
+@app.websocket("/ws/transcricoes/{transcricao_id}")
+async def websocket_transcricao(websocket: WebSocket, transcricao_id: str, canal: Optional[str] = None,
+                                desde: Optional[int] = None, protocolo: int = 1):
+    """Acompanha um job pelo ID: qualquer número de assinantes (abas, painéis) por job"""
+    await websocket.accept()
+    if not armazem_jobs.existe(transcricao_id):
+        await websocket.send_text(json.dumps({
+            "tipo": "erro",
+            "mensagem": "Transcrição não encontrada"
+        }))
+        await websocket.close()
+        return
+    await acompanhar_job(websocket, transcricao_id, canal, desde, min(protocolo, PROTOCOLO_ATUAL))
 
 # Rotas antigas para compatibilidade
+async def transcrever_na_fila(tarefa, request: Request, duracao_audio=None, modelo=None):
+    """Executa a transcrição de uma rota antiga como job da fila, com o mesmo limite de vagas das rotas novas"""
+    previsto = previsor_duracao.prever(modelo or modelo_atual_nome, duracao_audio)
+    try:
+        return await fila_jobs.executar_na_fila(tarefa, previsto, origem_requisicao(request))
+    except FilaCheia as e:
+        raise fila_cheia_ao_enfileirar(e)
+
 @app.post("/transcribe-youtube")
-async def transcribe_youtube(url: str = Form(...)):
+async def transcribe_youtube(request: Request, url: str = Form(...)):
+    exigir_vaga_na_fila()
+
+    async def tarefa():
+        audio, _ = await asyncio.to_thread(baixar_audio_youtube, url)
+        return await transcrever_com_cache(audio)
+
     try:
-        audio, _ = baixar_audio_youtube(url)
-        texto = transcrever_audio(audio)
+        texto = await transcrever_na_fila(tarefa, request)
         global ultima_transcricao
         ultima_transcricao = texto
         return {"transcription": texto}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/transcribe-file")
-async def transcribe_file(file: UploadFile = File(...)):
+async def transcribe_file(request: Request):
+    exigir_vaga_na_fila()
+    upload = await receber_upload(request, "videos", str(uuid.uuid4()))
     try:
-        # Salva o arquivo temporariamente
-        temp_path = f"videos/{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Extrai o áudio
-        audio, _ = extrair_audio_video(temp_path)
-        texto = transcrever_audio(audio)
-        
-        # Limpa arquivos temporários
-        os.remove(temp_path)
-        if os.path.exists(audio):
-            os.remove(audio)
+        # Usa o áudio extraído durante o upload; se o ffmpeg não conseguiu ler
+        # pelo pipe (ex.: MP4 com o índice no fim), decodifica o arquivo salvo
+        async def tarefa():
+            audio = upload["caminho_audio"]
+            if not audio:
+                audio, _ = await asyncio.to_thread(extrair_audio_video, upload["caminho"])
+            return await transcrever_com_cache(audio)
+
+        duracao_audio = await duracao_da_midia(upload["caminho_audio"] or upload["caminho"])
+        texto = await transcrever_na_fila(tarefa, request, duracao_audio)
             
         global ultima_transcricao
         ultima_transcricao = texto
         return {"transcription": texto}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Limpa arquivos temporários
+        remover_upload(upload)
 
 @app.post("/transcribe/")
-async def transcribe_file(file: UploadFile = File(...)):
+async def transcribe_file(request: Request, file: UploadFile = File(...)):
     """
     Endpoint para transcrever um arquivo de áudio/vídeo
     """
+    exigir_vaga_na_fila()
     # Salva o arquivo enviado
     file_path = UPLOAD_DIR / file.filename
     try:
@@ -1148,17 +1493,22 @@ async def transcribe_file(file: UploadFile = File(...)):
     transcription_path = TRANSCRIPTION_DIR / f"{file_path.stem}.txt"
     
     try:
-        # Transcreve o arquivo
-        text = audio_manager.transcribe_and_save(
-            str(file_path),
-            str(transcription_path)
-        )
+        # Transcreve o arquivo como job da fila (ou devolve do cache)
+        text = await transcrever_na_fila(
+            lambda: transcrever_com_cache(str(file_path), 'pt', audio_manager.model_size),
+            request, await duracao_da_midia(str(file_path)), audio_manager.model_size)
+        with open(transcription_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        await asyncio.to_thread(indice_busca.indexar, f"arquivo:{transcription_path.stem}", transcription_path.stem,
+                                texto=text, origem="arquivo", versao=transcription_path.stat().st_mtime)
         
         return {
             "message": "Transcrição concluída com sucesso",
             "text": text,
             "transcription_file": transcription_path.name
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na transcrição: {str(e)}")
     finally:
@@ -1194,10 +1544,11 @@ async def text_to_speech(request: Request):
         raise HTTPException(status_code=500, detail=f"Erro na geração de áudio: {str(e)}")
 
 @app.post("/transcribe-and-speak/")
-async def transcribe_and_speak(file: UploadFile = File(...)):
+async def transcribe_and_speak(request: Request, file: UploadFile = File(...)):
     """
     Endpoint para transcrever um arquivo e gerar áudio da transcrição usando edge-tts
     """
+    exigir_vaga_na_fila()
     # Salva o arquivo enviado
     file_path = UPLOAD_DIR / file.filename
     try:
@@ -1207,8 +1558,10 @@ async def transcribe_and_speak(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
     
     try:
-        # Transcreve o arquivo
-        text = audio_manager.transcribe_and_save(str(file_path))
+        # Transcreve o arquivo como job da fila (ou devolve do cache)
+        text = await transcrever_na_fila(
+            lambda: transcrever_com_cache(str(file_path), 'pt', audio_manager.model_size),
+            request, await duracao_da_midia(str(file_path)), audio_manager.model_size)
         
         # Gera um nome único para o arquivo de áudio
         audio_path = AUDIO_DIR / f"audio_{len(os.listdir(AUDIO_DIR))}.mp3"
@@ -1221,6 +1574,8 @@ async def transcribe_and_speak(file: UploadFile = File(...)):
             "transcription": text,
             "audio_file": audio_path.name
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
     finally:
@@ -0,0 +1,57 @@
+"""
+Ingestão de áudio
+
+A faixa de áudio de qualquer mídia (vídeo enviado, download do YouTube no
+contêiner original) é demultiplexada e decodificada uma única vez, direto para
+PCM mono 16 kHz em float32, e entregue ao Whisper como array NumPy. Não há
+arquivo intermediário nem recodificação com perdas (MP3).
+"""
+
+import json
+import subprocess
+
+import numpy as np
+
+TAXA_AMOSTRAGEM = 16000
+EXTENSAO_PCM = ".f32"
+
+
+def carregar_audio(caminho_midia: str):
+    """Decodifica a primeira faixa de áudio para PCM mono 16 kHz (float32), como o Whisper espera"""
+    if caminho_midia.endswith(EXTENSAO_PCM):
+        # PCM já decodificado durante o upload (upload_stream)
+        return np.fromfile(caminho_midia, dtype=np.float32)
+    comando = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", caminho_midia,
+        "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(TAXA_AMOSTRAGEM),
+        "-f", "f32le", "-acodec", "pcm_f32le", "-",
+    ]
+    try:
+        saida = subprocess.run(comando, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Falha ao decodificar áudio: {e.stderr.decode(errors='ignore')[-500:]}") from e
+    return np.frombuffer(saida, np.float32)
+
+
+def sondar_midia(caminho_midia: str) -> dict:
+    """
+    Lê os metadados da mídia com o ffprobe, sem decodificar nada
+
+    Returns:
+        Dict com 'duracao' (segundos ou None) e 'tem_audio'
+    """
+    comando = [
+        "ffprobe", "-v", "error", "-print_format", "json",
+        "-show_entries", "format=duration:stream=codec_type", caminho_midia,
+    ]
+    try:
+        saida = subprocess.run(comando, capture_output=True, check=True, timeout=30).stdout
+        dados = json.loads(saida or b"{}")
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        raise RuntimeError(f"Não foi possível ler a mídia: {e}") from e
+
+    duracao = dados.get("format", {}).get("duration")
+    return {
+        "duracao": float(duracao) if duracao not in (None, "N/A") else None,
+        "tem_audio": any(s.get("codec_type") == "audio" for s in dados.get("streams", [])),
+    }
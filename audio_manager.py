@@ -1,8 +1,8 @@
 import asyncio
 import os
 from typing import Optional
-import whisper
 from edge_tts import Communicate
+from model_registry import registro_modelos
 
 class AudioManager:
     def __init__(self, model_size: str = "base", voice: str = "pt-BR-FranciscaNeural"):
@@ -13,8 +13,18 @@ class AudioManager:
             model_size: Tamanho do modelo Whisper ('tiny', 'base', 'small', 'medium', 'large')
             voice: Voz a ser usada para TTS (ex: 'pt-BR-FranciscaNeural')
         """
-        self.model = whisper.load_model(model_size)
+        self.model_size = model_size
         self.voice = voice
+    
+    @property
+    def model(self):
+        """
+        Modelo Whisper do registro deste processo (carregado só no primeiro uso)
+
+        Só para uso fora do servidor (ex.: scripts): no servidor as transcrições
+        rodam no pool de inferência e este modelo nunca é carregado.
+        """
+        return registro_modelos.obter(self.model_size)
         
     def transcribe_audio(self, audio_path: str) -> dict:
         """
@@ -0,0 +1,249 @@
+"""
+Checkpoints das transcrições em diário (journal) de segmentos
+
+Em vez de regravar transcricoes/{id}.json inteiro a cada janela, cada
+checkpoint acrescenta uma linha a transcricoes/{id}.jsonl só com os segmentos
+novos. O .json passa a ser um retrato compactado, gravado de forma atômica
+(arquivo temporário + fsync + rename) no fim da transcrição e a cada
+COMPACTAR_CHECKPOINT_A_CADA registros; depois de compactado, o diário recomeça
+vazio. O fsync do diário é feito em lote (no máximo um a cada
+INTERVALO_FSYNC_CHECKPOINT_SEGUNDOS).
+
+Cada registro traz 'base', o número de segmentos anteriores a ele, então
+reaplicar um registro já incluído no retrato não duplica nada. Na leitura, o
+diário é aplicado até o último registro válido: uma linha truncada por uma
+queda no meio da escrita é ignorada (e removida antes da próxima escrita).
+
+As escritas podem ser chamadas de threads (fora do event loop do servidor):
+salvar, compactar e fechar são serializados por um lock.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+INTERVALO_FSYNC_CHECKPOINT_SEGUNDOS = float(os.getenv("INTERVALO_FSYNC_CHECKPOINT_SEGUNDOS", "1"))
+COMPACTAR_CHECKPOINT_A_CADA = int(os.getenv("COMPACTAR_CHECKPOINT_A_CADA", "200"))
+
+
+def texto_dos_segmentos(segmentos) -> str:
+    return "".join(s["texto"] for s in segmentos).strip()
+
+
+class DiarioCheckpoints:
+    def __init__(self, diretorio: str = "transcricoes",
+                 intervalo_fsync: float = INTERVALO_FSYNC_CHECKPOINT_SEGUNDOS,
+                 compactar_a_cada: int = COMPACTAR_CHECKPOINT_A_CADA):
+        """
+        Inicializa o diário
+
+        Args:
+            diretorio: Onde ficam o retrato ({id}.json) e o diário ({id}.jsonl) de cada job
+            intervalo_fsync: Segundos mínimos entre dois fsync do diário de um job
+            compactar_a_cada: Registros no diário até compactá-lo em um novo retrato
+        """
+        self.diretorio = diretorio
+        self.intervalo_fsync = intervalo_fsync
+        self.compactar_a_cada = max(1, compactar_a_cada)
+        # transcricao_id -> {"arquivo", "registros", "segmentos" (quantos), "ultimo_segmento", "metadados", "ultimo_fsync"}
+        self._abertos = {}
+        # Reentrante: salvar e compactar chamam fechar
+        self._lock = threading.RLock()
+
+    def _caminho_retrato(self, transcricao_id: str) -> str:
+        return os.path.join(self.diretorio, f"{transcricao_id}.json")
+
+    def _caminho_diario(self, transcricao_id: str) -> str:
+        return os.path.join(self.diretorio, f"{transcricao_id}.jsonl")
+
+    def existe(self, transcricao_id: str) -> bool:
+        return (os.path.exists(self._caminho_retrato(transcricao_id))
+                or os.path.exists(self._caminho_diario(transcricao_id)))
+
+    def ids(self) -> list:
+        """IDs de todos os jobs com checkpoint no diretório"""
+        nomes = glob.glob(os.path.join(self.diretorio, "*.json")) + glob.glob(os.path.join(self.diretorio, "*.jsonl"))
+        return sorted({os.path.splitext(os.path.basename(nome))[0] for nome in nomes})
+
+    def _ler(self, transcricao_id: str):
+        """Retorna (estado, registros válidos no diário, bytes válidos do diário), estado None se não há nada"""
+        estado = None
+        try:
+            with open(self._caminho_retrato(transcricao_id), "r", encoding="utf-8") as f:
+                estado = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            # Retrato antigo, gravado sem rename atômico e interrompido no meio
+            print(f"Retrato de checkpoint corrompido para {transcricao_id}, usando só o diário: {e}")
+
+        registros = 0
+        valido = 0
+        try:
+            with open(self._caminho_diario(transcricao_id), "rb") as f:
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break
+                    try:
+                        registro = json.loads(linha)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        break
+                    estado = self._aplicar(estado, registro)
+                    registros += 1
+                    valido += len(linha)
+        except FileNotFoundError:
+            pass
+        return estado, registros, valido
+
+    @staticmethod
+    def _aplicar(estado, registro) -> dict:
+        estado = estado or {"texto": "", "segmentos": [], "posicao": 0.0, "concluido": False}
+        segmentos = estado.get("segmentos", [])[:registro["base"]] + registro.get("segmentos", [])
+        estado.update(registro.get("metadados", {}))
+        estado["segmentos"] = segmentos
+        estado["texto"] = texto_dos_segmentos(segmentos) if segmentos else estado.get("texto", "")
+        estado["posicao"] = registro["posicao"]
+        estado["timestamp"] = registro["timestamp"]
+        estado["concluido"] = registro.get("concluido", False)
+        return estado
+
+    def carregar(self, transcricao_id: str):
+        """Estado do checkpoint (retrato + diário até o último registro válido) ou None"""
+        estado, _, _ = self._ler(transcricao_id)
+        return estado
+
+    def _abrir(self, transcricao_id: str) -> dict:
+        aberto = self._abertos.get(transcricao_id)
+        if aberto is not None:
+            return aberto
+        os.makedirs(self.diretorio, exist_ok=True)
+        estado, registros, valido = self._ler(transcricao_id)
+        caminho = self._caminho_diario(transcricao_id)
+        if os.path.exists(caminho) and os.path.getsize(caminho) > valido:
+            # Descarta a cauda inválida, senão os registros novos ficariam depois dela
+            with open(caminho, "r+b") as f:
+                f.truncate(valido)
+        metadados = {chave: valor for chave, valor in (estado or {}).items()
+                     if chave not in ("texto", "segmentos", "posicao", "timestamp", "concluido")}
+        segmentos = (estado or {}).get("segmentos", [])
+        aberto = self._abertos[transcricao_id] = {
+            "arquivo": open(caminho, "ab"),
+            "registros": registros,
+            "segmentos": len(segmentos),
+            "ultimo_segmento": segmentos[-1] if segmentos else None,
+            "metadados": metadados,
+            "ultimo_fsync": time.time(),
+        }
+        return aberto
+
+    def salvar(self, transcricao_id: str, texto: str, concluido: bool = False, segmentos=None,
+               posicao: float = 0.0, **metadados):
+        """
+        Registra o checkpoint: acrescenta ao diário os segmentos novos e os metadados alterados
+
+        No fim (concluido=True) ou a cada 'compactar_a_cada' registros, o diário é
+        compactado em um retrato.
+        """
+        with self._lock:
+            self._salvar(transcricao_id, texto, concluido, segmentos, posicao, metadados)
+
+    def _salvar(self, transcricao_id, texto, concluido, segmentos, posicao, metadados):
+        segmentos = segmentos or []
+        aberto = self._abrir(transcricao_id)
+        base = aberto["segmentos"]
+        if base > len(segmentos) or (base and segmentos[base - 1] != aberto["ultimo_segmento"]):
+            # Os segmentos não continuam os já registrados (ex.: transcrição recomeçada): regrava todos
+            base = 0
+        registro = {
+            "base": base,
+            "segmentos": segmentos[base:],
+            "posicao": posicao,
+            "timestamp": datetime.now().isoformat(),
+        }
+        alterados = {chave: valor for chave, valor in metadados.items() if aberto["metadados"].get(chave) != valor}
+        if alterados:
+            registro["metadados"] = alterados
+            aberto["metadados"].update(alterados)
+        if concluido:
+            registro["concluido"] = True
+        aberto["segmentos"] = len(segmentos)
+        aberto["ultimo_segmento"] = segmentos[-1] if segmentos else None
+
+        if concluido or aberto["registros"] + 1 >= self.compactar_a_cada or (not segmentos and texto):
+            # Sem segmentos (ex.: texto vindo do cache) o texto só existe no retrato
+            self._compactar(transcricao_id, aberto, {
+                **aberto["metadados"],
+                "texto": texto,
+                "segmentos": segmentos,
+                "posicao": posicao,
+                "timestamp": registro["timestamp"],
+                "concluido": concluido,
+            })
+            if concluido:
+                # Transcrição terminada: o retrato basta
+                self.fechar(transcricao_id)
+                os.remove(self._caminho_diario(transcricao_id))
+            return
+
+        arquivo = aberto["arquivo"]
+        arquivo.write(json.dumps(registro, ensure_ascii=False).encode("utf-8") + b"\n")
+        arquivo.flush()
+        aberto["registros"] += 1
+        if time.time() - aberto["ultimo_fsync"] >= self.intervalo_fsync:
+            os.fsync(arquivo.fileno())
+            aberto["ultimo_fsync"] = time.time()
+
+    def _compactar(self, transcricao_id: str, aberto: dict, estado: dict):
+        """Grava o retrato de forma atômica e esvazia o diário"""
+        caminho = self._caminho_retrato(transcricao_id)
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+        # Só depois do rename: uma queda aqui deixa registros já incluídos no retrato, que a 'base' torna inofensivos
+        aberto["arquivo"].truncate(0)
+        aberto["registros"] = 0
+        aberto["ultimo_fsync"] = time.time()
+
+    def compactar(self, transcricao_id: str):
+        """Compacta o diário de um job em um retrato (ex.: checkpoints deixados por uma queda)"""
+        with self._lock:
+            estado = self.carregar(transcricao_id)
+            if estado is None or not os.path.exists(self._caminho_diario(transcricao_id)):
+                return
+            aberto = self._abrir(transcricao_id)
+            self._compactar(transcricao_id, aberto, estado)
+            self.fechar(transcricao_id)
+            os.remove(self._caminho_diario(transcricao_id))
+
+    def compactar_todos(self) -> int:
+        """Compacta os diários de todos os jobs; retorna quantos foram compactados"""
+        compactados = 0
+        for caminho in glob.glob(os.path.join(self.diretorio, "*.jsonl")):
+            transcricao_id = os.path.splitext(os.path.basename(caminho))[0]
+            try:
+                self.compactar(transcricao_id)
+                compactados += 1
+            except OSError as e:
+                print(f"Erro ao compactar checkpoint de {transcricao_id}: {e}")
+        return compactados
+
+    def fechar(self, transcricao_id: str):
+        """Grava em disco (fsync) e fecha o diário do job, se estiver aberto; os arquivos são mantidos"""
+        with self._lock:
+            aberto = self._abertos.pop(transcricao_id, None)
+            if aberto is not None:
+                try:
+                    aberto["arquivo"].flush()
+                    os.fsync(aberto["arquivo"].fileno())
+                finally:
+                    aberto["arquivo"].close()
+
+    def fechar_todos(self):
+        for transcricao_id in list(self._abertos):
+            self.fechar(transcricao_id)
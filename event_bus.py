@@ -0,0 +1,228 @@
+"""
+Barramento de eventos dos jobs de transcrição
+
+Cada job tem um canal com um buffer circular de eventos numerados (seq) e
+qualquer número de assinantes (várias abas, painéis). Um cliente que reconecta
+informa o canal e o último seq recebido e recebe só os eventos que perdeu,
+direto da memória; se o buffer já não cobre o intervalo (ou o canal é outro,
+ex.: após reiniciar o servidor), quem assina precisa de um retrato do estado
+atual antes de seguir com os eventos ao vivo.
+
+Assinantes lentos não seguram o job: se a fila de um assinante enche, ela é
+descartada e o assinante volta a ler do buffer a partir do último seq enviado.
+
+Protocolo 2: o progresso vai em eventos transcricao_delta, só com os segmentos
+e o texto novos (e a posição do texto novo no texto completo); o texto inteiro
+só é enviado no retrato, ao conectar ou ressincronizar. Assinantes do
+protocolo 1 continuam recebendo transcricao_parcial com o texto completo,
+montado aqui a partir dos deltas. Cada evento é serializado uma única vez
+(com orjson, se instalado) e o mesmo texto vai para todos os assinantes.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TAMANHO_BUFFER_EVENTOS = int(os.getenv("TAMANHO_BUFFER_EVENTOS", "256"))
+# Por quanto tempo o canal de um job encerrado continua disponível para reconexões
+RETENCAO_CANAL_SEGUNDOS = float(os.getenv("RETENCAO_CANAL_SEGUNDOS", "600"))
+
+# Eventos após os quais o job não publica mais nada (até uma eventual retomada),
+# com os tipos que o app publica ao concluir, falhar ou cancelar um job
+TIPOS_FINAIS = ("transcricao_concluida", "erro", "cancelada")
+
+TIPO_DELTA = "transcricao_delta"
+TIPO_PARCIAL = "transcricao_parcial"
+# Campos de um evento de progresso que não fazem parte do estado do job
+CAMPOS_INCREMENTAIS = ("tipo", "seq", "texto", "texto_novo", "inicio_texto", "segmentos")
+
+PROTOCOLO_ATUAL = 2
+
+
+def serializar(mensagem: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(mensagem, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    return json.dumps(mensagem, ensure_ascii=False)
+
+
+def delta_texto(anterior: str, atual: str) -> dict:
+    """Campos de um transcricao_delta que levam o texto 'anterior' ao 'atual'"""
+    if atual.startswith(anterior):
+        inicio = len(anterior)
+    else:
+        inicio = len(os.path.commonprefix([anterior, atual]))
+    return {"inicio_texto": inicio, "texto_novo": atual[inicio:]}
+
+
+class Assinatura:
+    def __init__(self, canal: "CanalJob", capacidade: int, protocolo: int):
+        self.canal = canal
+        self.protocolo = protocolo
+        self.fila = asyncio.Queue(maxsize=capacidade)
+        self.ultimo_seq = 0
+        self.atrasada = False
+
+    def _entregar(self, seq: int, mensagem: str):
+        if self.atrasada:
+            return
+        try:
+            self.fila.put_nowait((seq, mensagem))
+        except asyncio.QueueFull:
+            # Descarta o que estava pendente: o assinante relê do buffer ao acordar
+            self.atrasada = True
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(None)
+
+    async def proximos(self):
+        """
+        Aguarda e retorna os próximos eventos [(seq, mensagem JSON)], ou None se o
+        assinante ficou para trás além do buffer e precisa de um novo retrato do estado
+        """
+        item = await self.fila.get()
+        if item is None:
+            self.atrasada = False
+            # O buffer guarda os eventos no protocolo 2; no protocolo 1 o retrato já traz tudo
+            eventos = self.canal.desde(self.ultimo_seq) if self.protocolo >= 2 else None
+            if eventos is None:
+                self.ultimo_seq = self.canal.seq
+                return None
+        else:
+            eventos = [item]
+        eventos = [(seq, mensagem) for seq, mensagem in eventos if seq > self.ultimo_seq]
+        if eventos:
+            self.ultimo_seq = eventos[-1][0]
+        return eventos
+
+
+class CanalJob:
+    def __init__(self, tamanho_buffer: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.eventos = deque(maxlen=tamanho_buffer)  # (seq, mensagem JSON)
+        self.assinantes = set()
+        self.texto = None  # Texto completo da transcrição, mantido a partir dos deltas
+        self.estado = {}  # Último progresso publicado (progresso, etapa, título...)
+        self.remocao = None  # Handle do call_later que remove o canal encerrado
+
+    def desde(self, seq: int):
+        """Eventos posteriores a 'seq', ou None se o buffer já descartou parte deles"""
+        if seq > self.seq:
+            return None
+        primeiro = self.eventos[0][0] if self.eventos else self.seq + 1
+        if seq + 1 < primeiro:
+            return None
+        return [evento for evento in self.eventos if evento[0] > seq]
+
+
+class BarramentoEventos:
+    def __init__(self, tamanho_buffer: int = TAMANHO_BUFFER_EVENTOS,
+                 retencao_segundos: float = RETENCAO_CANAL_SEGUNDOS):
+        """
+        Inicializa o barramento
+
+        Args:
+            tamanho_buffer: Eventos guardados por job para reenvio
+            retencao_segundos: Tempo que o canal de um job encerrado é mantido
+        """
+        self.tamanho_buffer = tamanho_buffer
+        self.retencao = retencao_segundos
+        self._canais = {}
+
+    def _canal(self, transcricao_id: str) -> CanalJob:
+        canal = self._canais.get(transcricao_id)
+        if canal is None:
+            canal = self._canais[transcricao_id] = CanalJob(self.tamanho_buffer)
+        return canal
+
+    def publicar(self, transcricao_id: str, mensagem: dict) -> int:
+        """Numera o evento, guarda no buffer do job e entrega aos assinantes; retorna quantos receberam"""
+        canal = self._canal(transcricao_id)
+        if canal.remocao is not None:
+            # Job retomado depois de encerrado: o canal volta a ficar ativo
+            canal.remocao.cancel()
+            canal.remocao = None
+        canal.seq += 1
+        mensagem = {**mensagem, "seq": canal.seq}
+        texto = serializar(mensagem)
+        texto_v1 = texto
+        if mensagem.get("tipo") == TIPO_DELTA:
+            canal.texto = (canal.texto or "")[:mensagem["inicio_texto"]] + mensagem["texto_novo"]
+            canal.estado = {k: v for k, v in mensagem.items() if k not in CAMPOS_INCREMENTAIS}
+            if any(assinatura.protocolo < 2 for assinatura in canal.assinantes):
+                texto_v1 = serializar({**mensagem, **self.retrato(transcricao_id),
+                                       "segmentos": mensagem.get("segmentos", [])})
+        elif mensagem.get("tipo") == TIPO_PARCIAL and "texto" in mensagem:
+            canal.texto = mensagem["texto"]
+            canal.estado = {k: v for k, v in mensagem.items() if k not in CAMPOS_INCREMENTAIS}
+        canal.eventos.append((canal.seq, texto))
+        for assinatura in list(canal.assinantes):
+            assinatura._entregar(canal.seq, texto if assinatura.protocolo >= 2 else texto_v1)
+        if mensagem.get("tipo") in TIPOS_FINAIS:
+            canal.remocao = asyncio.get_running_loop().call_later(
+                self.retencao, self._remover_canal, transcricao_id, canal)
+        return len(canal.assinantes)
+
+    def _remover_canal(self, transcricao_id: str, canal: CanalJob):
+        if self._canais.get(transcricao_id) is canal and not canal.assinantes:
+            del self._canais[transcricao_id]
+        elif canal.remocao is not None:
+            # Ainda há quem acompanhe: tenta de novo mais tarde
+            canal.remocao = asyncio.get_running_loop().call_later(
+                self.retencao, self._remover_canal, transcricao_id, canal)
+
+    def assinar(self, transcricao_id: str, canal_id: str = None, desde: int = None, protocolo: int = 1):
+        """
+        Assina os eventos de um job
+
+        Args:
+            canal_id: Canal informado pelo cliente na reconexão
+            desde: Último seq que o cliente recebeu nesse canal
+            protocolo: 1 (texto completo a cada progresso) ou 2 (deltas)
+
+        Returns:
+            (assinatura, eventos perdidos a reenviar ou None se é preciso enviar um retrato do estado)
+        """
+        canal = self._canal(transcricao_id)
+        assinatura = Assinatura(canal, self.tamanho_buffer, protocolo)
+        canal.assinantes.add(assinatura)
+        if protocolo < 2:
+            perdidos = None
+        elif canal_id == canal.id and desde is not None:
+            perdidos = canal.desde(desde)
+        elif canal.eventos and canal.eventos[0][0] == 1:
+            # Cliente novo e o buffer ainda tem a história completa do job
+            perdidos = list(canal.eventos)
+        else:
+            perdidos = None
+        assinatura.ultimo_seq = canal.seq if perdidos is None else (perdidos[-1][0] if perdidos else desde or 0)
+        return assinatura, perdidos
+
+    def retrato(self, transcricao_id: str):
+        """Texto completo e último progresso do job mantidos em memória, ou None se o canal não os tem"""
+        canal = self._canais.get(transcricao_id)
+        if canal is None or canal.texto is None:
+            return None
+        return {**canal.estado, "tipo": TIPO_PARCIAL, "texto": canal.texto}
+
+    def cancelar(self, transcricao_id: str, assinatura: Assinatura):
+        canal = assinatura.canal
+        canal.assinantes.discard(assinatura)
+        # Canal aberto só para esta assinatura (job sem eventos desde o início do servidor)
+        if not canal.assinantes and not canal.eventos and self._canais.get(transcricao_id) is canal:
+            del self._canais[transcricao_id]
+
+    def estatisticas(self) -> dict:
+        return {
+            "canais": len(self._canais),
+            "assinantes": sum(len(canal.assinantes) for canal in self._canais.values()),
+            "eventos_em_buffer": sum(len(canal.eventos) for canal in self._canais.values()),
+            "tamanho_buffer": self.tamanho_buffer,
+        }
@@ -0,0 +1,574 @@
+"""
+Pool de processos para inferência do Whisper
+
+Cada processo do pool mantém os seus próprios modelos carregados (ver
+model_registry), de modo que a transcrição nunca roda dentro do event loop do
+servidor: as rotas enviam o trabalho para o pool e aguardam o resultado sem
+bloquear as demais conexões.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from audio_decoder import TAXA_AMOSTRAGEM, carregar_audio
+from model_registry import ORCAMENTO_MEMORIA_MODELOS_MB, TAMANHO_ESTIMADO_MB, registro_modelos
+
+# Quantidade de processos de inferência (configurável via .env)
+WORKERS_INFERENCIA = int(os.getenv("WORKERS_INFERENCIA", "2"))
+
+# Tamanho da janela decodificada por vez no modo streaming (o Whisper trabalha com 30s)
+JANELA_STREAMING_SEGUNDOS = float(os.getenv("JANELA_STREAMING_SEGUNDOS", "30"))
+
+# Lotes entre jobs: até TAMANHO_MAXIMO_LOTE janelas, esperando no máximo ESPERA_MAXIMA_LOTE_MS
+# para juntar janelas de outros jobs (TAMANHO_MAXIMO_LOTE=1 desativa o agrupamento)
+TAMANHO_MAXIMO_LOTE = int(os.getenv("TAMANHO_MAXIMO_LOTE", "8"))
+ESPERA_MAXIMA_LOTE_MS = float(os.getenv("ESPERA_MAXIMA_LOTE_MS", "50"))
+
+# Arquivos longos são divididos em shards (um por processo) cortados em trechos de silêncio
+DURACAO_MINIMA_SHARDS_SEGUNDOS = float(os.getenv("DURACAO_MINIMA_SHARDS_SEGUNDOS", "1200"))
+SOBREPOSICAO_SHARDS_SEGUNDOS = float(os.getenv("SOBREPOSICAO_SHARDS_SEGUNDOS", "2"))
+BUSCA_SILENCIO_SEGUNDOS = 15.0
+
+JANELA_WHISPER_SEGUNDOS = 30
+
+# Tempo máximo que os processos esperam uns pelos outros em uma tarefa executada em todos
+# (ex.: carregar um modelo; inclui esperar um processo ocupado com outra transcrição)
+ESPERA_MAXIMA_TODOS_SEGUNDOS = 900
+
+# Limiares do Whisper para considerar uma decodificação ruim (refeita com fallback de temperatura)
+LIMITE_TAXA_COMPRESSAO = 2.4
+LIMITE_LOGPROB = -1.0
+LIMITE_SEM_FALA = 0.6
+
+# Barreira compartilhada pelos processos do pool (ver _executar_em_todos)
+_barreira = None
+
+
+def _registrar_barreira(barreira):
+    global _barreira
+    _barreira = barreira
+
+
+def _inicializar_worker(threads_por_worker, modelo_inicial, barreira, orcamento_mb):
+    """Configura o processo de inferência (threads e sua parte do orçamento de memória) e pré-carrega o modelo inicial"""
+    import torch
+    torch.set_num_threads(threads_por_worker)
+    _registrar_barreira(barreira)
+    registro_modelos.ajustar_orcamento(orcamento_mb)
+
+    if modelo_inicial:
+        _obter_modelo(modelo_inicial)
+
+
+def _obter_modelo(nome_modelo):
+    """Retorna o modelo do processo atual, carregando-o se necessário"""
+    return registro_modelos.obter(nome_modelo)
+
+
+def _carregar_modelo(nome_modelo):
+    _obter_modelo(nome_modelo)
+    return nome_modelo
+
+
+def _executar_e_esperar_os_demais(funcao, *args):
+    """
+    Executa a função e espera na barreira até todos os processos do pool a terem executado
+
+    Um processo parado na barreira não recebe outra tarefa, então as N cópias
+    da tarefa rodam em N processos diferentes.
+    """
+    try:
+        return funcao(*args)
+    finally:
+        _barreira.wait(ESPERA_MAXIMA_TODOS_SEGUNDOS)
+
+
+def _executar_no_worker(funcao, *args):
+    """Executa a tarefa e anexa o relatório de memória dos modelos deste processo"""
+    resultado = funcao(*args)
+    return os.getpid(), registro_modelos.relatorio(), resultado
+
+
+def _transcrever_janela(audio_janela, idioma, nome_modelo, prompt):
+    """Transcreve uma janela de áudio e retorna os segmentos com tempos relativos à janela"""
+    modelo = _obter_modelo(nome_modelo)
+    resultado = modelo.transcribe(audio_janela, language=idioma, initial_prompt=prompt)
+    return [
+        {"inicio": s["start"], "fim": s["end"], "texto": s["text"]}
+        for s in resultado.get("segments", [])
+    ]
+
+
+def _segmentos_dos_tokens(tokens, tokenizer, duracao_janela):
+    """Converte os tokens com timestamps de uma janela em segmentos (tempos relativos)"""
+    inicio_timestamps = tokenizer.timestamp_begin
+    segmentos = []
+    texto_tokens = []
+    inicio = None
+    for token in tokens:
+        if token >= inicio_timestamps:
+            tempo = (token - inicio_timestamps) * 0.02
+            if inicio is not None and texto_tokens:
+                segmentos.append({"inicio": inicio, "fim": min(tempo, duracao_janela),
+                                  "texto": tokenizer.decode(texto_tokens)})
+                texto_tokens = []
+                inicio = None
+            else:
+                inicio = tempo
+        else:
+            texto_tokens.append(token)
+    if texto_tokens:
+        # Último segmento sem timestamp final: vai até o fim da janela
+        segmentos.append({"inicio": inicio or 0.0, "fim": duracao_janela,
+                          "texto": tokenizer.decode(texto_tokens)})
+    return segmentos
+
+
+def _transcrever_lote(janelas, prompts, idioma, nome_modelo):
+    """
+    Decodifica várias janelas (de jobs diferentes) em lotes
+
+    Cada janela mantém o seu prompt (o texto anterior do seu job). As janelas
+    sem prompt (início de cada job ou shard) e as com prompt formam dois lotes,
+    e cada lote roda o encoder e o decoder uma vez.
+    """
+    if any(len(j) > JANELA_WHISPER_SEGUNDOS * TAXA_AMOSTRAGEM for j in janelas):
+        return [_transcrever_janela(j, idioma, nome_modelo, p) for j, p in zip(janelas, prompts)]
+
+    sem_prompt = [i for i, p in enumerate(prompts) if not p]
+    com_prompt = [i for i, p in enumerate(prompts) if p]
+    saida = [None] * len(janelas)
+    for indices in (sem_prompt, com_prompt):
+        if len(indices) == 1:
+            i = indices[0]
+            saida[i] = _transcrever_janela(janelas[i], idioma, nome_modelo, prompts[i])
+        elif indices:
+            resultados = _decodificar_lote([janelas[i] for i in indices], [prompts[i] for i in indices],
+                                           idioma, nome_modelo)
+            for i, segmentos in zip(indices, resultados):
+                saida[i] = segmentos
+    return saida
+
+
+def _alinhar_prompts(prompts_tokens, limite):
+    """
+    Corta os prompts (tokens) de um lote para o mesmo tamanho, mantendo o fim de cada um
+
+    Todas as linhas do decode em lote começam com a mesma quantidade de tokens;
+    o fim do texto anterior é a parte mais próxima da janela.
+    """
+    tamanho = min(limite, *(len(t) for t in prompts_tokens))
+    return [list(t[len(t) - tamanho:]) for t in prompts_tokens] if tamanho > 0 else None
+
+
+def _decodificar_lote(janelas, prompts, idioma, nome_modelo):
+    """
+    Roda o encoder e o decoder uma vez para o lote inteiro, cada janela com o seu prompt
+
+    Janelas cuja decodificação gulosa ficou ruim são refeitas individualmente com
+    o fallback de temperatura do transcribe().
+    """
+    import torch
+    from whisper.audio import log_mel_spectrogram, pad_or_trim
+    from whisper.decoding import DecodingOptions, DecodingTask
+    from whisper.tokenizer import get_tokenizer
+
+    class TarefaPromptsPorJanela(DecodingTask):
+        """DecodingTask que troca o prompt repetido em todas as linhas pelo prompt de cada janela"""
+
+        def _detect_language(self, audio_features, tokens):
+            # Os tokens iniciais de cada linha são [sot_prev, prompt..., sot, idioma, tarefa]
+            tokens[:, 1:1 + len(prompts_tokens[0])] = torch.tensor(prompts_tokens)
+            return super()._detect_language(audio_features, tokens)
+
+    modelo = _obter_modelo(nome_modelo)
+    mel = torch.stack([
+        log_mel_spectrogram(pad_or_trim(torch.from_numpy(np.ascontiguousarray(j))), modelo.dims.n_mels)
+        for j in janelas
+    ]).to(modelo.device)
+    tokenizer = get_tokenizer(modelo.is_multilingual, num_languages=modelo.num_languages,
+                              language=idioma, task="transcribe")
+
+    prompts_tokens = None
+    if all(prompts):
+        # Mesmo limite do Whisper para o prompt: metade do contexto do decoder
+        prompts_tokens = _alinhar_prompts([tokenizer.encode(" " + p.strip()) for p in prompts],
+                                          modelo.dims.n_text_ctx // 2 - 1)
+    opcoes = DecodingOptions(language=idioma, task="transcribe", temperature=0.0,
+                             prompt=prompts_tokens[0] if prompts_tokens else None,
+                             fp16=modelo.device.type == "cuda")
+    if prompts_tokens:
+        resultados = TarefaPromptsPorJanela(modelo, opcoes).run(mel)
+    else:
+        resultados = modelo.decode(mel, opcoes)
+
+    saida = []
+    for janela, prompt, resultado in zip(janelas, prompts, resultados):
+        if resultado.no_speech_prob > LIMITE_SEM_FALA and resultado.avg_logprob < LIMITE_LOGPROB:
+            saida.append([])
+        elif resultado.compression_ratio > LIMITE_TAXA_COMPRESSAO or resultado.avg_logprob < LIMITE_LOGPROB:
+            saida.append(_transcrever_janela(janela, idioma, nome_modelo, prompt))
+        else:
+            saida.append(_segmentos_dos_tokens(resultado.tokens, tokenizer, len(janela) / TAXA_AMOSTRAGEM))
+    return saida
+
+
+def pontos_de_corte(audio, inicio, n_shards, busca=BUSCA_SILENCIO_SEGUNDOS):
+    """
+    Divide [inicio, fim do áudio] em n_shards trechos, cortando no ponto de menor
+    energia (silêncio) a até 'busca' segundos de cada divisão uniforme
+
+    Returns:
+        Lista crescente com n_shards + 1 tempos (inicio, cortes..., duração)
+    """
+    duracao = len(audio) / TAXA_AMOSTRAGEM
+    quadro = TAXA_AMOSTRAGEM // 10  # 100 ms
+    passo = (duracao - inicio) / n_shards
+    cortes = [inicio]
+    for k in range(1, n_shards):
+        alvo = inicio + k * passo
+        a = max(cortes[-1] + 1.0, alvo - busca)
+        b = min(duracao, alvo + busca)
+        trecho = audio[int(a * TAXA_AMOSTRAGEM):int(b * TAXA_AMOSTRAGEM)]
+        n_quadros = len(trecho) // quadro
+        if n_quadros == 0:
+            cortes.append(alvo)
+            continue
+        energia = np.square(trecho[:n_quadros * quadro].reshape(n_quadros, quadro)).mean(axis=1)
+        # Corta no meio do quadro mais silencioso
+        cortes.append(a + (int(np.argmin(energia)) + 0.5) * quadro / TAXA_AMOSTRAGEM)
+    cortes.append(duracao)
+    return cortes
+
+
+class AgendadorLotes:
+    def __init__(self, executar, tamanho_maximo: int = TAMANHO_MAXIMO_LOTE,
+                 espera_maxima_ms: float = ESPERA_MAXIMA_LOTE_MS, paralelismo: int = 1):
+        """
+        Agrupa as janelas de todos os jobs ativos em lotes por (modelo, idioma)
+
+        Args:
+            executar: Corrotina que executa uma função no pool (PoolInferencia._executar)
+            tamanho_maximo: Janelas por lote; o lote sai assim que enche
+            espera_maxima_ms: Tempo máximo que a primeira janela espera por companhia
+            paralelismo: Número de processos; com processos ociosos o grupo é dividido entre eles
+        """
+        self._executar = executar
+        self.tamanho_maximo = max(1, tamanho_maximo)
+        self.espera_maxima = espera_maxima_ms / 1000
+        self.paralelismo = max(1, paralelismo)
+        self._pendentes = {}  # (modelo, idioma) -> [(janela, prompt, future)]
+        self._timers = {}
+        self._tarefas = set()  # Referências às tarefas dos lotes em execução (o loop guarda só referências fracas)
+        self._em_execucao = 0
+
+    async def transcrever_janela(self, janela, idioma, modelo, prompt):
+        loop = asyncio.get_running_loop()
+        chave = (modelo, idioma)
+        futuro = loop.create_future()
+        fila = self._pendentes.setdefault(chave, [])
+        fila.append((janela, prompt, futuro))
+
+        if len(fila) >= self.tamanho_maximo:
+            self._despachar(chave)
+        elif chave not in self._timers:
+            self._timers[chave] = loop.call_later(self.espera_maxima, self._despachar, chave)
+        return await futuro
+
+    def _despachar(self, chave):
+        timer = self._timers.pop(chave, None)
+        if timer is not None:
+            timer.cancel()
+        lote = self._pendentes.pop(chave, [])
+        if not lote:
+            return
+        # Processos ociosos recebem partes do grupo (paralelismo entre processos);
+        # com o pool ocupado, o grupo inteiro vira um lote só (paralelismo dentro do lote)
+        ociosos = max(1, self.paralelismo - self._em_execucao)
+        tamanho = -(-len(lote) // min(ociosos, len(lote)))
+        for i in range(0, len(lote), tamanho):
+            self._em_execucao += 1
+            tarefa = asyncio.create_task(self._processar(chave, lote[i:i + tamanho]))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _processar(self, chave, lote):
+        modelo, idioma = chave
+        try:
+            resultados = await self._executar(
+                _transcrever_lote, [j for j, _, _ in lote], [p for _, p, _ in lote], idioma, modelo)
+        except Exception as e:
+            for _, _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        finally:
+            self._em_execucao -= 1
+        for (_, _, futuro), segmentos in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(segmentos)
+
+
+class PoolInferencia:
+    def __init__(self, workers: int = WORKERS_INFERENCIA, modelo_inicial: str = None,
+                 orcamento_mb: float = ORCAMENTO_MEMORIA_MODELOS_MB):
+        """
+        Inicializa o pool de inferência
+
+        Args:
+            workers: Número de processos de inferência
+            modelo_inicial: Modelo pré-carregado em cada processo (opcional)
+            orcamento_mb: Memória máxima dos modelos somando todos os processos (cada um fica com uma parte igual)
+        """
+        self.workers = max(1, workers)
+        self.modelo_inicial = modelo_inicial
+        self.orcamento_mb = orcamento_mb
+        self.orcamento_por_worker_mb = orcamento_mb / self.workers
+        self._executor = None
+        self._barreira = None
+        self._lock_todos = asyncio.Lock()
+        self.reinicios = 0
+        self.relatorios = {}  # pid -> último relatório de memória enviado pelo processo
+        self.agendador = (AgendadorLotes(self._executar, paralelismo=self.workers)
+                          if TAMANHO_MAXIMO_LOTE > 1 else None)
+
+    def iniciar(self):
+        """Cria os processos do pool, dividindo os núcleos entre eles"""
+        if self._executor is not None:
+            return
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # 'spawn' evita herdar o estado do torch/threads do processo do servidor
+        contexto = multiprocessing.get_context("spawn")
+        self._barreira = contexto.Barrier(self.workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=contexto,
+            initializer=_inicializar_worker,
+            initargs=(threads, self.modelo_inicial, self._barreira, self.orcamento_por_worker_mb),
+        )
+        print(f"Pool de inferência iniciado com {self.workers} processos ({threads} threads cada, "
+              f"{self.orcamento_por_worker_mb:.0f}MB de modelos cada)")
+        if TAMANHO_ESTIMADO_MB.get(self.modelo_inicial, 0) > self.orcamento_por_worker_mb:
+            print(f"Aviso: o modelo {self.modelo_inicial} não cabe na parte do orçamento de cada processo; "
+                  f"aumente ORCAMENTO_MEMORIA_MODELOS_MB ou reduza WORKERS_INFERENCIA")
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _reiniciar(self, executor_quebrado):
+        """Recria o pool depois que um processo morreu (ex.: falta de memória, modelo que não carregou)"""
+        if self._executor is not executor_quebrado:
+            # Outra tarefa afetada pela mesma queda já recriou o pool
+            return
+        print("Processo de inferência encerrado inesperadamente; recriando o pool")
+        executor_quebrado.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.relatorios.clear()
+        self.reinicios += 1
+        self.iniciar()
+
+    async def _executar(self, funcao, *args):
+        """
+        Executa a função em um processo do pool
+
+        Se um processo morre, o ProcessPoolExecutor fica quebrado para sempre: o pool
+        é recriado (rodando de novo o inicializador) e a tarefa é repetida uma vez.
+        Uma tarefa que derruba o pool também na repetição falha com BrokenProcessPool.
+        """
+        loop = asyncio.get_running_loop()
+        for tentativa in range(2):
+            if self._executor is None:
+                self.iniciar()
+            executor = self._executor
+            try:
+                pid, relatorio, resultado = await loop.run_in_executor(
+                    executor, _executar_no_worker, funcao, *args)
+            except BrokenProcessPool:
+                self._reiniciar(executor)
+                if tentativa:
+                    raise
+                continue
+            self.relatorios[pid] = relatorio
+            return resultado
+
+    async def _executar_em_todos(self, funcao, *args) -> list:
+        """
+        Executa a função uma vez em cada processo do pool e retorna os resultados
+
+        Raises:
+            A primeira exceção de um dos processos (ou BrokenBarrierError se algum
+            não chegou à barreira a tempo): a função pode não ter rodado em todos
+        """
+        # Duas execuções simultâneas dividiriam a barreira entre si
+        async with self._lock_todos:
+            if self._executor is None:
+                self.iniciar()
+            barreira = self._barreira
+            resultados = await asyncio.gather(*(
+                self._executar(_executar_e_esperar_os_demais, funcao, *args) for _ in range(self.workers)
+            ), return_exceptions=True)
+            erros = [r for r in resultados if isinstance(r, BaseException)]
+            if erros:
+                # Uma barreira quebrada precisa ser reiniciada antes da próxima execução
+                barreira.reset()
+                raise next((e for e in erros if not isinstance(e, threading.BrokenBarrierError)), erros[0])
+            return resultados
+
+    async def carregar_modelo(self, nome_modelo: str) -> str:
+        """Carrega o modelo em todos os processos do pool; retorna só quando todos o têm"""
+        await self._executar_em_todos(_carregar_modelo, nome_modelo)
+        return nome_modelo
+
+    async def _transcrever_janela(self, janela, idioma, modelo, prompt):
+        """Ponto de entrada das janelas: em lote com outros jobs, se o agrupamento estiver ativo"""
+        if self.agendador is not None:
+            return await self.agendador.transcrever_janela(janela, idioma, modelo, prompt)
+        return await self._executar(_transcrever_janela, janela, idioma, modelo, prompt)
+
+    async def carregar_audio(self, caminho_audio: str):
+        """Decodifica o áudio em uma thread (o ffmpeg roda fora do event loop)"""
+        return await asyncio.to_thread(carregar_audio, caminho_audio)
+
+    async def transcrever_stream(self, audio, idioma: str = "pt", modelo: str = "small",
+                                 inicio: float = 0.0, prompt: str = None):
+        """
+        Transcreve o áudio janela a janela, produzindo os segmentos assim que são decodificados
+
+        Áudios com mais de DURACAO_MINIMA_SHARDS_SEGUNDOS a decodificar são divididos
+        em shards transcritos em paralelo (ver _transcrever_em_shards).
+
+        Args:
+            audio: PCM mono 16 kHz (ver carregar_audio)
+            inicio: Posição (em segundos) a partir da qual decodificar
+            prompt: Texto anterior usado como contexto da primeira janela
+
+        Yields:
+            Tupla (segmentos novos com tempos absolutos e em ordem, posição até onde todos
+            os segmentos já foram produzidos, duração total, fração do áudio já decodificada)
+        """
+        duracao = len(audio) / TAXA_AMOSTRAGEM
+        if self.workers > 1 and duracao - inicio >= DURACAO_MINIMA_SHARDS_SEGUNDOS:
+            async for item in self._transcrever_em_shards(audio, idioma, modelo, inicio, prompt):
+                yield item
+            return
+
+        async for novos, posicao in self._transcrever_intervalo(audio, idioma, modelo, inicio, duracao, prompt):
+            yield novos, posicao, duracao, posicao / duracao
+
+    async def _transcrever_intervalo(self, audio, idioma, modelo, inicio, fim, prompt=None):
+        """Decodifica [inicio, fim) janela a janela, produzindo (segmentos novos, posição)"""
+        posicao = inicio
+        while fim - posicao > 0.1:
+            fim_janela = min(posicao + JANELA_STREAMING_SEGUNDOS, fim)
+            janela = audio[int(posicao * TAXA_AMOSTRAGEM):int(fim_janela * TAXA_AMOSTRAGEM)]
+            segmentos = await self._transcrever_janela(janela, idioma, modelo, prompt)
+
+            avanco = fim_janela - posicao
+            if fim_janela < fim and len(segmentos) > 1:
+                # O último segmento pode ter sido cortado no fim da janela:
+                # ele é descartado e decodificado de novo no início da próxima
+                descartado = segmentos.pop()
+                if descartado["inicio"] > 0:
+                    avanco = descartado["inicio"]
+
+            novos = [
+                {"inicio": posicao + s["inicio"], "fim": posicao + s["fim"], "texto": s["texto"]}
+                for s in segmentos
+            ]
+            posicao += avanco
+            if novos:
+                prompt = "".join(s["texto"] for s in novos)[-200:]
+            yield novos, posicao
+
+    async def _transcrever_em_shards(self, audio, idioma, modelo, inicio, prompt):
+        """
+        Transcreve um áudio longo em shards paralelos, um por processo do pool
+
+        Os shards são cortados em trechos de silêncio e se sobrepõem em
+        SOBREPOSICAO_SHARDS_SEGUNDOS. Cada segmento pertence ao shard em cujo
+        trecho nominal cai o seu ponto médio; as cópias da sobreposição são
+        descartadas. Os segmentos saem em ordem: os de um shard só são
+        produzidos depois que todos os shards anteriores terminaram.
+        """
+        duracao = len(audio) / TAXA_AMOSTRAGEM
+        n_shards = self.workers
+        cortes = pontos_de_corte(audio, inicio, n_shards)
+        limites = [
+            (max(inicio, cortes[k] - SOBREPOSICAO_SHARDS_SEGUNDOS),
+             min(duracao, cortes[k + 1] + SOBREPOSICAO_SHARDS_SEGUNDOS))
+            for k in range(n_shards)
+        ]
+        print(f"Transcrição em {n_shards} shards: " +
+              ", ".join(f"{a:.1f}-{b:.1f}s" for a, b in limites))
+
+        eventos = asyncio.Queue()
+
+        async def processar_shard(k):
+            a, b = limites[k]
+            try:
+                async for novos, posicao in self._transcrever_intervalo(
+                        audio, idioma, modelo, a, b, prompt if k == 0 else None):
+                    await eventos.put((k, novos, posicao, None))
+                await eventos.put((k, [], b, True))
+            except Exception as e:
+                await eventos.put((k, [], a, e))
+
+        tarefas = [asyncio.create_task(processar_shard(k)) for k in range(n_shards)]
+        try:
+            pendentes = [[] for _ in range(n_shards)]
+            posicoes = [a for a, _ in limites]
+            concluidos = set()
+            proximo = 0
+            while proximo < n_shards:
+                k, novos, posicao, fim = await eventos.get()
+                if isinstance(fim, Exception):
+                    raise fim
+                posicoes[k] = posicao
+                ultimo = k == n_shards - 1
+                pendentes[k].extend(
+                    s for s in novos
+                    if cortes[k] <= (s["inicio"] + s["fim"]) / 2 and (ultimo or (s["inicio"] + s["fim"]) / 2 < cortes[k + 1])
+                )
+                if fim:
+                    concluidos.add(k)
+
+                # Libera os segmentos do shard da frente (e dos seguintes, se ele terminou)
+                emitir = []
+                while proximo < n_shards:
+                    emitir.extend(pendentes[proximo])
+                    pendentes[proximo] = []
+                    if proximo not in concluidos:
+                        break
+                    proximo += 1
+
+                if proximo < n_shards:
+                    posicao_contigua = min(max(cortes[proximo], posicoes[proximo]), cortes[proximo + 1])
+                else:
+                    posicao_contigua = duracao
+                decodificado = sum(p - a for p, (a, _) in zip(posicoes, limites))
+                fracao = min(1.0, (inicio + decodificado) / duracao)
+                yield emitir, posicao_contigua, duracao, fracao
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    def relatorio_memoria(self) -> dict:
+        """Memória usada pelos modelos de cada processo (último estado conhecido)"""
+        return {str(pid): relatorio for pid, relatorio in self.relatorios.items()}
+
+    def resumo_memoria(self) -> dict:
+        """Orçamento total, memória somada de todos os processos e o relatório de cada um"""
+        return {
+            "orcamento_mb": round(self.orcamento_mb, 1),
+            "orcamento_por_worker_mb": round(self.orcamento_por_worker_mb, 1),
+            "total_mb": round(sum(r["total_mb"] for r in self.relatorios.values()), 1),
+            "workers": self.relatorio_memoria(),
+        }
@@ -0,0 +1,128 @@
+"""
+Cache das respostas de insights
+
+A chave é formada pelo SHA-256 do texto da transcrição, a pergunta normalizada
+(sem diferença de maiúsculas, espaços e pontuação final), o modelo e a versão
+do prompt. A mesma pergunta sobre a mesma transcrição é respondida sem chamar
+a API de LLM; mudar o prompt (VERSAO_PROMPT_INSIGHTS) ou o modelo invalida as
+respostas antigas sem precisar apagar nada.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+DIRETORIO_CACHE_INSIGHTS = os.getenv("DIRETORIO_CACHE_INSIGHTS", "cache/insights")
+CACHE_INSIGHTS_MAX_MB = float(os.getenv("CACHE_INSIGHTS_MAX_MB", "50"))
+CACHE_INSIGHTS_TTL_HORAS = float(os.getenv("CACHE_INSIGHTS_TTL_HORAS", "168"))
+
+_ESPACOS = re.compile(r"\s+")
+
+
+def hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """'  Resuma o texto? ' e 'resuma o texto' viram a mesma chave"""
+    pergunta = unicodedata.normalize("NFC", pergunta).casefold()
+    return _ESPACOS.sub(" ", pergunta).strip().rstrip("?!.;: ").strip()
+
+
+class CacheInsights:
+    def __init__(self, diretorio: str = DIRETORIO_CACHE_INSIGHTS, max_mb: float = CACHE_INSIGHTS_MAX_MB,
+                 ttl_horas: float = CACHE_INSIGHTS_TTL_HORAS):
+        """
+        Inicializa o cache
+
+        Args:
+            diretorio: Onde cada resposta é guardada como {chave}.json
+            max_mb: Tamanho máximo; as respostas usadas há mais tempo saem primeiro
+            ttl_horas: Validade de cada resposta
+        """
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = ttl_horas * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chave(hash_do_texto: str, pergunta: str, modelo: str, versao_prompt) -> str:
+        conteudo = json.dumps(
+            {"texto": hash_do_texto, "pergunta": normalizar_pergunta(pergunta),
+             "modelo": modelo, "prompt": versao_prompt},
+            sort_keys=True,
+        )
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _caminho(self, chave: str) -> Path:
+        return self.diretorio / f"{chave}.json"
+
+    def obter(self, chave: str):
+        """Retorna a resposta salva (dict com 'resposta') ou None se não existe ou venceu"""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if time.time() - dados.get("salvo_em", 0) > self.ttl:
+                caminho.unlink(missing_ok=True)
+                dados = None
+            else:
+                # O mtime marca o último acesso, usado na remoção LRU
+                os.utime(caminho, None)
+        except (FileNotFoundError, json.JSONDecodeError):
+            dados = None
+        with self._lock:
+            if dados is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return dados
+
+    def salvar(self, chave: str, resposta: str, **metadados):
+        dados = {"resposta": resposta, "salvo_em": time.time()}
+        dados.update(metadados)
+        caminho = self._caminho(chave)
+        temporario = caminho.with_suffix(".tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        self._remover_excedente()
+
+    def _remover_excedente(self):
+        """Remove as respostas usadas há mais tempo até o cache caber no limite"""
+        with self._lock:
+            entradas = []
+            for caminho in self.diretorio.glob("*.json"):
+                try:
+                    info = caminho.stat()
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, caminho))
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                caminho.unlink(missing_ok=True)
+                total -= tamanho
+
+    def estatisticas(self) -> dict:
+        arquivos = list(self.diretorio.glob("*.json"))
+        total = sum(c.stat().st_size for c in arquivos if c.exists())
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taxa_acerto": round(self.hits / consultas, 3) if consultas else 0.0,
+            "entradas": len(arquivos),
+            "tamanho_mb": round(total / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            "ttl_horas": round(self.ttl / 3600, 2),
+        }
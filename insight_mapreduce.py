@@ -0,0 +1,188 @@
+"""
+Insights de transcrições longas em map-reduce
+
+Transcrições que não cabem em um prompt (LIMITE_TOKENS_INSIGHTS) são divididas
+em partes de até TOKENS_POR_PARTE_INSIGHTS tokens, em fronteiras de frase. Cada
+parte vira, em uma chamada à API, anotações detalhadas que não dependem da
+pergunta (map, com no máximo CONCORRENCIA_PARTES_INSIGHTS chamadas simultâneas
+por pergunta); uma chamada final responde à pergunta a partir das anotações de
+todas as partes (reduce). Se as anotações ainda forem grandes demais, são
+condensadas de novo da mesma forma.
+
+As anotações de cada parte ficam no cache de insights, pelo hash da parte:
+outras perguntas sobre a mesma transcrição só pagam a chamada final.
+
+Os tokens são estimados pelo número de caracteres (sem tokenizador do modelo).
+"""
+
+import asyncio
+import os
+import re
+
+from insight_cache import CacheInsights, hash_texto
+from llm_client import ClienteLLM
+
+LIMITE_TOKENS_INSIGHTS = int(os.getenv("LIMITE_TOKENS_INSIGHTS", "60000"))
+TOKENS_POR_PARTE_INSIGHTS = int(os.getenv("TOKENS_POR_PARTE_INSIGHTS", "12000"))
+CONCORRENCIA_PARTES_INSIGHTS = int(os.getenv("CONCORRENCIA_PARTES_INSIGHTS", "4"))
+
+CARACTERES_POR_TOKEN = 4
+# Rodadas de condensação das anotações antes de desistir de caber no limite
+RODADAS_MAXIMAS = 3
+
+# Mudar quando o prompt das partes mudar, para não reaproveitar anotações antigas
+VERSAO_PROMPT_PARTES = "parte-1"
+
+PROMPT_PARTE = """
+Abaixo está a parte {numero} de {total} de uma transcrição longa.
+Escreva anotações detalhadas desta parte, em tópicos, preservando fatos, nomes,
+números, datas, argumentos, conclusões e citações importantes, na ordem em que
+aparecem. Não comente sobre a transcrição nem sobre as outras partes.
+
+Parte {numero} de {total}:
+---
+{texto}
+---
+
+Anotações:
+"""
+
+PROMPT_FINAL = """
+As anotações abaixo foram extraídas, em ordem, das partes de uma transcrição longa.
+Com base nelas, responda à pergunta do usuário da melhor forma possível.
+
+Anotações:
+---
+{anotacoes}
+---
+
+Pergunta do Usuário:
+{pergunta}
+
+Resposta:
+"""
+
+_FRASES = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def estimar_tokens(texto: str) -> int:
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def dividir_em_partes(texto: str, tokens_por_parte: int = TOKENS_POR_PARTE_INSIGHTS) -> list:
+    """Divide o texto em partes de até 'tokens_por_parte' tokens, sem quebrar frases (exceto frases enormes)"""
+    limite = max(1, tokens_por_parte) * CARACTERES_POR_TOKEN
+    partes = []
+    atual = ""
+    for frase in _FRASES.split(texto):
+        frase = frase.strip()
+        if not frase:
+            continue
+        while len(frase) > limite:
+            # Frase maior que uma parte (ex.: transcrição sem pontuação): corta no último espaço
+            corte = frase.rfind(" ", 0, limite)
+            corte = corte if corte > 0 else limite
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(frase[:corte].strip())
+            frase = frase[corte:].strip()
+        if atual and len(atual) + 1 + len(frase) > limite:
+            partes.append(atual)
+            atual = ""
+        atual = f"{atual} {frase}" if atual else frase
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+class InsightsLongos:
+    def __init__(self, cliente: ClienteLLM, cache: CacheInsights,
+                 tokens_por_parte: int = TOKENS_POR_PARTE_INSIGHTS,
+                 limite_tokens: int = LIMITE_TOKENS_INSIGHTS,
+                 concorrencia: int = CONCORRENCIA_PARTES_INSIGHTS):
+        """
+        Args:
+            cliente: Cliente da API de LLM
+            cache: Cache onde ficam as anotações de cada parte
+            tokens_por_parte: Tamanho de cada parte no map
+            limite_tokens: Tamanho máximo das anotações enviadas na chamada final
+            concorrencia: Partes processadas ao mesmo tempo em uma pergunta
+        """
+        self.cliente = cliente
+        self.cache = cache
+        self.tokens_por_parte = tokens_por_parte
+        self.limite_tokens = limite_tokens
+        self.concorrencia = max(1, concorrencia)
+
+    def precisa(self, texto: str) -> bool:
+        """O texto é grande demais para um único prompt"""
+        return estimar_tokens(texto) > self.limite_tokens
+
+    async def _anotar(self, parte: str, numero: int, total: int, semaforo: asyncio.Semaphore,
+                      contagem: dict) -> str:
+        # Numeração fora da chave: a mesma parte em outra posição reaproveita as anotações
+        chave = self.cache.chave(hash_texto(parte), "", self.cliente.modelo, VERSAO_PROMPT_PARTES)
+        em_cache = await asyncio.to_thread(self.cache.obter, chave)
+        if em_cache:
+            contagem["em_cache"] += 1
+            return em_cache["resposta"]
+        async with semaforo:
+            anotacoes = await self.cliente.completar([{
+                "role": "user",
+                "content": PROMPT_PARTE.format(numero=numero, total=total, texto=parte),
+            }])
+        contagem["chamadas"] += 1
+        try:
+            await asyncio.to_thread(self.cache.salvar, chave, anotacoes, modelo=self.cliente.modelo,
+                                    versao_prompt=VERSAO_PROMPT_PARTES)
+        except OSError as e:
+            print(f"Erro ao salvar anotações de parte no cache: {e}")
+        return anotacoes
+
+    async def _mapear(self, texto: str, contagem: dict) -> list:
+        partes = dividir_em_partes(texto, self.tokens_por_parte)
+        contagem["partes"] += len(partes)
+        semaforo = asyncio.Semaphore(self.concorrencia)
+        # Uma parte que falha não cancela as outras: cancelar a chamada de teste do disjuntor
+        # (meio aberto) deixaria o circuito sem teste, e as partes concluídas ficam no cache
+        # para a próxima pergunta. Se a pergunta for cancelada, o gather cancela todas.
+        resultados = await asyncio.gather(
+            *(self._anotar(parte, i + 1, len(partes), semaforo, contagem) for i, parte in enumerate(partes)),
+            return_exceptions=True,
+        )
+        for resultado in resultados:
+            if isinstance(resultado, BaseException):
+                raise resultado
+        return resultados
+
+    async def responder(self, texto: str, pergunta: str):
+        """
+        Responde à pergunta sobre um texto longo
+
+        Returns:
+            (resposta, metadados: partes, partes_em_cache, chamadas e rodadas)
+
+        Raises:
+            ErroLLM: Falha em alguma das chamadas
+        """
+        contagem = {"partes": 0, "em_cache": 0, "chamadas": 0}
+        anotacoes = texto
+        rodadas = 0
+        while rodadas == 0 or (self.precisa(anotacoes) and rodadas < RODADAS_MAXIMAS):
+            anotacoes = "\n\n".join(await self._mapear(anotacoes, contagem))
+            rodadas += 1
+        print(f"Insights em map-reduce: {contagem['partes']} parte(s) em {rodadas} rodada(s), "
+              f"{contagem['em_cache']} do cache")
+
+        resposta = await self.cliente.completar([{
+            "role": "user",
+            "content": PROMPT_FINAL.format(anotacoes=anotacoes, pergunta=pergunta),
+        }])
+        contagem["chamadas"] += 1
+        return resposta, {
+            "partes": contagem["partes"],
+            "partes_em_cache": contagem["em_cache"],
+            "chamadas": contagem["chamadas"],
+            "rodadas": rodadas,
+        }
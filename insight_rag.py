@@ -0,0 +1,128 @@
+"""
+Insights a partir dos trechos relevantes da transcrição (retrieval-augmented)
+
+Em vez de colar a transcrição inteira no prompt, as passagens mais relevantes
+para a pergunta são buscadas no índice de busca (BM25 sobre os segmentos com
+tempo, indexados quando a transcrição termina) e entram no prompt até
+TOKENS_TRECHOS_INSIGHTS tokens, em ordem cronológica e marcadas com o tempo.
+O tamanho do prompt (e a latência e o custo) não cresce com a transcrição, e a
+resposta cita os tempos dos trechos usados.
+
+Perguntas sobre a transcrição inteira ("resuma", "principais pontos") não têm
+trechos mais relevantes que outros; essas continuam usando o texto completo.
+"""
+
+import os
+import re
+
+from insight_mapreduce import CARACTERES_POR_TOKEN, estimar_tokens
+from llm_client import ClienteLLM
+from search_index import IndiceBusca, formatar_tempo
+
+TOKENS_TRECHOS_INSIGHTS = int(os.getenv("TOKENS_TRECHOS_INSIGHTS", "4000"))
+# Trechos mais relevantes buscados e segmentos vizinhos incluídos em cada um, para dar contexto
+CANDIDATOS_TRECHOS_INSIGHTS = int(os.getenv("CANDIDATOS_TRECHOS_INSIGHTS", "20"))
+VIZINHOS_TRECHOS_INSIGHTS = int(os.getenv("VIZINHOS_TRECHOS_INSIGHTS", "2"))
+
+PERGUNTAS_GERAIS = re.compile(
+    r"\b(resum\w*|sumari\w*|principais|pontos[- ]chave|vis[aã]o geral|do que se trata|sobre o que|"
+    r"tema\w*|t[oó]picos?|conclus\w*)\b",
+    re.IGNORECASE,
+)
+
+PROMPT_TRECHOS = """
+Abaixo estão os trechos de uma transcrição mais relevantes para a pergunta do usuário,
+em ordem cronológica, cada um marcado com o tempo em que aparece no áudio.
+Responda à pergunta com base apenas nesses trechos. Cite o tempo dos trechos
+usados entre colchetes, como [12:34], para que o usuário possa conferir no áudio.
+Se os trechos não bastarem para responder, diga isso.
+
+Trechos:
+---
+{trechos}
+---
+
+Pergunta do Usuário:
+{pergunta}
+
+Resposta:
+"""
+
+
+def pergunta_geral(pergunta: str) -> bool:
+    """A pergunta é sobre a transcrição inteira, não sobre um assunto dentro dela"""
+    return bool(PERGUNTAS_GERAIS.search(pergunta or ""))
+
+
+def selecionar_passagens(passagens: list, limite_tokens: int = TOKENS_TRECHOS_INSIGHTS) -> list:
+    """As passagens mais relevantes que cabem no orçamento de tokens, em ordem cronológica"""
+    escolhidas = []
+    tokens = 0
+    for passagem in passagens:
+        custo = estimar_tokens(passagem["texto"])
+        if tokens + custo > limite_tokens:
+            if escolhidas:
+                continue
+            # Nem a mais relevante cabe inteira: vai cortada
+            passagem = {**passagem, "texto": passagem["texto"][:limite_tokens * CARACTERES_POR_TOKEN]}
+            custo = limite_tokens
+        escolhidas.append(passagem)
+        tokens += custo
+    return sorted(escolhidas, key=lambda passagem: passagem["inicio"] if passagem["inicio"] is not None else 0)
+
+
+class InsightsTrechos:
+    def __init__(self, cliente: ClienteLLM, indice: IndiceBusca,
+                 limite_tokens: int = TOKENS_TRECHOS_INSIGHTS,
+                 candidatos: int = CANDIDATOS_TRECHOS_INSIGHTS,
+                 vizinhos: int = VIZINHOS_TRECHOS_INSIGHTS):
+        """
+        Args:
+            cliente: Cliente da API de LLM
+            indice: Índice de busca com os segmentos das transcrições
+            limite_tokens: Tokens de trechos enviados em cada pergunta
+            candidatos: Segmentos mais relevantes buscados
+            vizinhos: Segmentos incluídos antes e depois de cada um
+        """
+        self.cliente = cliente
+        self.indice = indice
+        self.limite_tokens = limite_tokens
+        self.candidatos = candidatos
+        self.vizinhos = vizinhos
+
+    def buscar(self, documento_id: str, pergunta: str) -> list:
+        """Passagens a enviar para a pergunta (vazio se nenhuma é relevante)"""
+        passagens = self.indice.passagens(documento_id, pergunta, self.candidatos, self.vizinhos)
+        return selecionar_passagens(passagens, self.limite_tokens)
+
+    async def responder(self, passagens: list, pergunta: str):
+        """
+        Responde à pergunta a partir das passagens escolhidas por buscar()
+
+        Returns:
+            (resposta, metadados com os tempos das passagens usadas)
+
+        Raises:
+            ErroLLM: Falha na chamada
+        """
+        trechos = []
+        for passagem in passagens:
+            if passagem["inicio"] is not None:
+                trechos.append(f"[{formatar_tempo(passagem['inicio'])}] {passagem['texto']}")
+            else:
+                trechos.append(passagem["texto"])
+        resposta = await self.cliente.completar([{
+            "role": "user",
+            "content": PROMPT_TRECHOS.format(trechos="\n\n".join(trechos), pergunta=pergunta),
+        }])
+        return resposta, {
+            "trechos": [
+                {
+                    "inicio": passagem["inicio"],
+                    "fim": passagem["fim"],
+                    "inicio_formatado": formatar_tempo(passagem["inicio"]) if passagem["inicio"] is not None else None,
+                }
+                for passagem in passagens
+            ],
+            "tokens_trechos": sum(estimar_tokens(passagem["texto"]) for passagem in passagens),
+        }
@@ -0,0 +1,349 @@
+"""
+Fila de jobs de transcrição
+
+Os jobs criados pelas rotas de início entram em uma fila atendida por um
+número fixo de workers (tarefas asyncio), independente de haver um cliente
+conectado. Com a fila cheia, novos jobs são recusados (429) com uma estimativa
+de quando tentar de novo. A cada mudança na fila, os jobs que esperam recebem
+sua nova posição.
+
+A ordem de atendimento depende da política (POLITICA_FILA_JOBS):
+- fifo: ordem de chegada;
+- sjf: menor duração prevista primeiro, com envelhecimento (quem espera há
+  muito tempo sobe na fila, então jobs longos não ficam parados para sempre);
+- justa: divide os workers entre os clientes, atendendo primeiro quem usou
+  menos tempo de processamento na última hora.
+
+A duração de cada job é prevista pela duração do áudio vezes o fator de tempo
+real (RTF) histórico do modelo neste host, o que dá início e fim previstos
+(ETA) para cada job da fila.
+"""
+
+import asyncio
+import math
+import os
+import socket
+import statistics
+import time
+import uuid
+from collections import deque
+
+WORKERS_JOBS = int(os.getenv("WORKERS_JOBS", "2"))
+CAPACIDADE_FILA_JOBS = int(os.getenv("CAPACIDADE_FILA_JOBS", "20"))
+POLITICA_FILA_JOBS = os.getenv("POLITICA_FILA_JOBS", "fifo")
+# Segundos de prioridade ganhos por segundo de espera na política sjf
+ENVELHECIMENTO_SJF = float(os.getenv("ENVELHECIMENTO_SJF", "0.5"))
+# Janela de uso considerada na política justa
+JANELA_JUSTICA_SEGUNDOS = 3600
+# Duração assumida para áudios cuja duração ainda não se conhece (ex.: YouTube fora do cache)
+DURACAO_PADRAO_AUDIO_SEGUNDOS = float(os.getenv("DURACAO_PADRAO_AUDIO_SEGUNDOS", "600"))
+
+POLITICAS = ("fifo", "sjf", "justa")
+
+# Jobs das rotas antigas (executar_na_fila): não estão no histórico e ninguém acompanha sua posição
+PREFIXO_DIRETO = "direto-"
+
+# RTF inicial por modelo (CPU), usado até haver histórico
+RTF_PADRAO = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.3,
+    "medium": 0.8,
+    "large": 1.6,
+}
+
+
+class FilaCheia(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Fila de transcrições cheia, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PrevisorDuracao:
+    def __init__(self, historico, host: str = None, amostras: int = 20):
+        """
+        Prevê quanto tempo uma transcrição vai levar
+
+        Args:
+            historico: Objeto com rtfs_recentes(modelo, host, limite) e registrar_rtf(...) (ArmazemJobs)
+            host: Nome do host (o RTF depende da máquina)
+            amostras: Quantas execuções recentes entram na mediana
+        """
+        self.historico = historico
+        self.host = host or socket.gethostname()
+        self.amostras = amostras
+
+    def rtf(self, modelo: str) -> float:
+        """Mediana dos RTFs recentes do modelo neste host, depois em qualquer host, depois o padrão"""
+        for host in (self.host, None):
+            rtfs = self.historico.rtfs_recentes(modelo, host, self.amostras)
+            if rtfs:
+                return statistics.median(rtfs)
+        return RTF_PADRAO.get(modelo, 1.0)
+
+    def prever(self, modelo: str, duracao_audio: float = None) -> float:
+        """Segundos previstos para transcrever 'duracao_audio' segundos de áudio"""
+        return (duracao_audio or DURACAO_PADRAO_AUDIO_SEGUNDOS) * self.rtf(modelo)
+
+    def registrar(self, modelo: str, duracao_audio: float, tempo: float):
+        if duracao_audio and duracao_audio >= 30 and tempo > 0:
+            self.historico.registrar_rtf(modelo, self.host, duracao_audio, tempo)
+
+
+class FilaJobs:
+    def __init__(self, executar, workers: int = WORKERS_JOBS, capacidade: int = CAPACIDADE_FILA_JOBS,
+                 ao_mudar_posicao=None, politica: str = POLITICA_FILA_JOBS):
+        """
+        Inicializa a fila
+
+        Args:
+            executar: Corrotina (transcricao_id) que processa um job
+            workers: Jobs processados ao mesmo tempo
+            capacidade: Jobs aguardando na fila além dos que estão em execução
+            ao_mudar_posicao: Corrotina (transcricao_id, posicao, previsao) chamada quando a fila muda
+            politica: 'fifo', 'sjf' ou 'justa'
+        """
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de fila desconhecida: {politica} (use {', '.join(POLITICAS)})")
+        self.executar = executar
+        self.workers = max(1, workers)
+        self.capacidade = capacidade
+        self.ao_mudar_posicao = ao_mudar_posicao
+        self.politica = politica
+        self._fila = []  # Entradas {"id", "previsto", "cliente", "enfileirado_em", "executar"}
+        self._em_execucao = {}  # transcricao_id -> {"previsto", "inicio", "fracao", "cliente"}
+        self._uso_clientes = deque()  # (momento, cliente, segundos previstos), para a política justa
+        self._disponivel = asyncio.Condition()
+        self._tarefas = []
+        self._duracao_media = None  # Média móvel da duração dos jobs, usada no Retry-After
+        self.concluidos = 0
+        self.recusados = 0
+
+    def iniciar(self):
+        self._tarefas = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"Fila de jobs iniciada com {self.workers} workers "
+              f"(capacidade {self.capacidade}, política {self.politica})")
+
+    async def encerrar(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+
+    def cheia(self) -> bool:
+        return len(self._fila) >= self.capacidade
+
+    def retry_after(self) -> int:
+        """Segundos estimados até abrir uma vaga na fila"""
+        restantes = [self._restante(job) for job in self._em_execucao.values()]
+        if restantes:
+            return max(1, math.ceil(min(restantes)))
+        duracao = self._duracao_media or 60
+        return max(1, math.ceil(duracao * (len(self._fila) - self.capacidade + 1) / self.workers))
+
+    def verificar_admissao(self):
+        """Levanta FilaCheia se não houver vaga (para recusar antes de receber um upload)"""
+        if self.cheia():
+            self.recusados += 1
+            raise FilaCheia(self.retry_after())
+
+    async def enfileirar(self, transcricao_id: str, previsto: float = None, cliente: str = None,
+                         verificar_vaga: bool = True, executar=None) -> int:
+        """
+        Coloca o job na fila e retorna sua posição (1 = próximo a ser atendido)
+
+        Args:
+            previsto: Segundos de processamento previstos (ver PrevisorDuracao)
+            cliente: Quem enviou o job (usado na política justa)
+            verificar_vaga: False para jobs já admitidos (ex.: retomados no início do servidor)
+            executar: Corrotina (transcricao_id) usada no lugar da padrão da fila
+
+        Raises:
+            FilaCheia: verificar_vaga e não há vaga
+        """
+        if verificar_vaga:
+            self.verificar_admissao()
+        async with self._disponivel:
+            self._fila.append({
+                "id": transcricao_id,
+                "previsto": previsto or self._duracao_media or 60,
+                "cliente": cliente,
+                "enfileirado_em": time.time(),
+                "executar": executar or self.executar,
+            })
+            self._disponivel.notify()
+        await self._notificar_posicoes()
+        return self.posicao(transcricao_id)
+
+    async def executar_na_fila(self, tarefa, previsto: float = None, cliente: str = None):
+        """
+        Espera um worker livre, executa a corrotina 'tarefa()' e retorna seu resultado
+        (rotas que só respondem ao final, sem job no histórico)
+
+        Raises:
+            FilaCheia: Não há vaga na fila
+        """
+        resultado = asyncio.get_running_loop().create_future()
+
+        async def executar(_):
+            try:
+                valor = await tarefa()
+            except Exception as e:
+                if not resultado.done():
+                    resultado.set_exception(e)
+            else:
+                if not resultado.done():
+                    resultado.set_result(valor)
+
+        job_id = f"{PREFIXO_DIRETO}{uuid.uuid4()}"
+        await self.enfileirar(job_id, previsto, cliente, executar=executar)
+        try:
+            return await resultado
+        except asyncio.CancelledError:
+            # Quem pediu desistiu: se o job ainda não começou, sai da fila
+            await self.remover(job_id)
+            raise
+
+    def _ordem(self) -> list:
+        """Entradas da fila na ordem em que seriam atendidas agora"""
+        agora = time.time()
+        if self.politica == "sjf":
+            return sorted(self._fila, key=lambda e: e["previsto"] - ENVELHECIMENTO_SJF * (agora - e["enfileirado_em"]))
+        if self.politica == "justa":
+            # Simula a escolha sucessiva: cada job escolhido soma ao uso do seu cliente
+            uso = self._uso_por_cliente()
+            pendentes = list(self._fila)
+            ordem = []
+            while pendentes:
+                escolhida = min(pendentes, key=lambda e: (uso.get(e["cliente"], 0.0), e["enfileirado_em"]))
+                uso[escolhida["cliente"]] = uso.get(escolhida["cliente"], 0.0) + escolhida["previsto"]
+                pendentes.remove(escolhida)
+                ordem.append(escolhida)
+            return ordem
+        return list(self._fila)
+
+    def _uso_por_cliente(self) -> dict:
+        limite = time.time() - JANELA_JUSTICA_SEGUNDOS
+        while self._uso_clientes and self._uso_clientes[0][0] < limite:
+            self._uso_clientes.popleft()
+        uso = {}
+        for _, cliente, segundos in self._uso_clientes:
+            uso[cliente] = uso.get(cliente, 0.0) + segundos
+        return uso
+
+    def posicao(self, transcricao_id: str):
+        """Posição do job na fila (1 = próximo), 0 se está em execução, None se não está na fila"""
+        if transcricao_id in self._em_execucao:
+            return 0
+        for posicao, entrada in enumerate(self._ordem(), start=1):
+            if entrada["id"] == transcricao_id:
+                return posicao
+        return None
+
+    @staticmethod
+    def _restante(job) -> float:
+        """Segundos que faltam para um job em execução, pelo progresso real quando já há algum"""
+        decorrido = time.time() - job["inicio"]
+        if job["fracao"] >= 0.05:
+            return decorrido * (1 - job["fracao"]) / job["fracao"]
+        return max(0.0, job["previsto"] - decorrido)
+
+    def previsoes(self) -> dict:
+        """Início e fim previstos (epoch) de cada job, simulando os workers sobre a ordem atual"""
+        agora = time.time()
+        resultado = {}
+        livres = []
+        for transcricao_id, job in self._em_execucao.items():
+            fim = agora + self._restante(job)
+            livres.append(fim)
+            resultado[transcricao_id] = {"inicio_previsto": job["inicio"], "fim_previsto": fim,
+                                         "duracao_prevista_s": job["previsto"], "posicao": 0}
+        livres += [agora] * (self.workers - len(livres))
+        livres.sort()
+        for posicao, entrada in enumerate(self._ordem(), start=1):
+            inicio = livres.pop(0)
+            fim = inicio + entrada["previsto"]
+            livres.append(fim)
+            livres.sort()
+            resultado[entrada["id"]] = {"inicio_previsto": inicio, "fim_previsto": fim,
+                                        "duracao_prevista_s": entrada["previsto"], "posicao": posicao}
+        return resultado
+
+    def previsao(self, transcricao_id: str):
+        return self.previsoes().get(transcricao_id)
+
+    def registrar_progresso(self, transcricao_id: str, fracao: float):
+        """Atualiza a fração já processada de um job em execução (refina o ETA)"""
+        job = self._em_execucao.get(transcricao_id)
+        if job is not None:
+            job["fracao"] = fracao
+
+    def atualizar_previsao(self, transcricao_id: str, previsto: float):
+        """Corrige a duração prevista quando ela passa a ser conhecida (ex.: após o download)"""
+        job = self._em_execucao.get(transcricao_id)
+        if job is not None:
+            job["previsto"] = previsto
+            return
+        for entrada in self._fila:
+            if entrada["id"] == transcricao_id:
+                entrada["previsto"] = previsto
+
+    async def remover(self, transcricao_id: str) -> bool:
+        """Tira da fila um job que ainda não começou"""
+        entrada = next((e for e in self._fila if e["id"] == transcricao_id), None)
+        if entrada is None:
+            return False
+        self._fila.remove(entrada)
+        await self._notificar_posicoes()
+        return True
+
+    async def _notificar_posicoes(self):
+        if self.ao_mudar_posicao is None:
+            return
+        for transcricao_id, previsao in self.previsoes().items():
+            if previsao["posicao"] == 0 or transcricao_id.startswith(PREFIXO_DIRETO):
+                continue
+            try:
+                await self.ao_mudar_posicao(transcricao_id, previsao["posicao"], previsao)
+            except Exception as e:
+                print(f"Erro ao notificar posição na fila de {transcricao_id}: {e}")
+
+    async def _worker(self, indice: int):
+        while True:
+            async with self._disponivel:
+                await self._disponivel.wait_for(lambda: self._fila)
+                entrada = self._ordem()[0]
+                self._fila.remove(entrada)
+            transcricao_id = entrada["id"]
+            self._em_execucao[transcricao_id] = {
+                "previsto": entrada["previsto"], "inicio": time.time(), "fracao": 0.0, "cliente": entrada["cliente"],
+            }
+            self._uso_clientes.append((time.time(), entrada["cliente"], entrada["previsto"]))
+            await self._notificar_posicoes()
+
+            inicio = time.time()
+            print(f"[worker {indice}] Iniciando job {transcricao_id} ({len(self._fila)} na fila, "
+                  f"previsto {entrada['previsto']:.0f}s)")
+            try:
+                await entrada["executar"](transcricao_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[worker {indice}] Erro não tratado no job {transcricao_id}: {e}")
+            finally:
+                self._em_execucao.pop(transcricao_id, None)
+            duracao = time.time() - inicio
+            self._duracao_media = duracao if self._duracao_media is None else 0.8 * self._duracao_media + 0.2 * duracao
+            self.concluidos += 1
+
+    def estatisticas(self) -> dict:
+        return {
+            "workers": self.workers,
+            "capacidade": self.capacidade,
+            "politica": self.politica,
+            "na_fila": len(self._fila),
+            "em_execucao": len(self._em_execucao),
+            "concluidos": self.concluidos,
+            "recusados": self.recusados,
+            "duracao_media_s": round(self._duracao_media, 1) if self._duracao_media else None,
+        }
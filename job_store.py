@@ -0,0 +1,235 @@
+"""
+Armazenamento persistente dos jobs de transcrição
+
+Substitui o dicionário transcricoes_ativas em memória por um banco SQLite.
+Os campos consultados com frequência (status, client_id, data de início) são
+colunas indexadas; o restante dos metadados do job fica em uma coluna JSON.
+O texto da transcrição fica em uma tabela à parte e só é lido quando pedido,
+então listar jobs não carrega transcrições e a memória do servidor não cresce
+com o número de jobs já executados.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+CAMINHO_BANCO_JOBS = os.getenv("CAMINHO_BANCO_JOBS", "transcricoes/jobs.db")
+
+# Campos guardados em colunas próprias; os demais vão para a coluna JSON 'dados'
+COLUNAS = ("client_id", "tipo", "status", "titulo", "modelo", "iniciado_em", "atualizado_em", "erro")
+
+# Status de jobs que não sobrevivem a um reinício do servidor
+# ("em_andamento" é um job aguardando na fila: volta para a fila no reinício)
+STATUS_EM_EXECUCAO = ("processando", "preparando_retomada")
+
+
+class ArmazemJobs:
+    def __init__(self, caminho: str = CAMINHO_BANCO_JOBS):
+        """
+        Abre (ou cria) o banco de jobs
+
+        Args:
+            caminho: Arquivo SQLite
+        """
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("PRAGMA foreign_keys=ON")
+            self._conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    client_id TEXT,
+                    tipo TEXT,
+                    status TEXT NOT NULL,
+                    titulo TEXT,
+                    modelo TEXT,
+                    iniciado_em TEXT NOT NULL,
+                    atualizado_em TEXT NOT NULL,
+                    erro TEXT,
+                    dados TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+                CREATE INDEX IF NOT EXISTS idx_jobs_client_id ON jobs (client_id);
+                CREATE INDEX IF NOT EXISTS idx_jobs_iniciado_em ON jobs (iniciado_em);
+                CREATE TABLE IF NOT EXISTS textos (
+                    id TEXT PRIMARY KEY REFERENCES jobs (id) ON DELETE CASCADE,
+                    texto TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS historico_rtf (
+                    modelo TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    duracao_audio REAL NOT NULL,
+                    tempo REAL NOT NULL,
+                    registrado_em REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_historico_rtf ON historico_rtf (modelo, host, registrado_em);
+            """)
+
+    @staticmethod
+    def _separar(campos: dict):
+        """Divide os campos do job em colunas, dados extras (JSON) e texto"""
+        campos = dict(campos)
+        texto = campos.pop("texto", None)
+        colunas = {nome: campos.pop(nome) for nome in COLUNAS if nome in campos}
+        return colunas, campos, texto
+
+    @staticmethod
+    def _job(linha) -> dict:
+        job = json.loads(linha["dados"])
+        job.update({nome: linha[nome] for nome in COLUNAS if linha[nome] is not None})
+        return job
+
+    def criar(self, transcricao_id: str, **campos):
+        """Registra um job (substituindo os campos de um registro anterior com o mesmo ID, mas não seu texto)"""
+        agora = datetime.now().isoformat()
+        campos.setdefault("iniciado_em", agora)
+        campos["atualizado_em"] = agora
+        colunas, dados, texto = self._separar(campos)
+        colunas = {nome: colunas.get(nome) for nome in COLUNAS}
+        with self._lock, self._conexao:
+            # Upsert em vez de INSERT OR REPLACE: o REPLACE apaga a linha antiga, e o
+            # ON DELETE CASCADE levaria junto o texto já salvo em 'textos'
+            self._conexao.execute(
+                f"INSERT INTO jobs (id, {', '.join(colunas)}, dados) "
+                f"VALUES (?, {', '.join('?' for _ in colunas)}, ?) "
+                f"ON CONFLICT (id) DO UPDATE SET "
+                f"{', '.join(f'{nome} = excluded.{nome}' for nome in colunas)}, dados = excluded.dados",
+                (transcricao_id, *colunas.values(), json.dumps(dados, ensure_ascii=False)),
+            )
+            if texto is not None:
+                self._salvar_texto(transcricao_id, texto)
+
+    def atualizar(self, transcricao_id: str, **campos) -> bool:
+        """Atualiza campos de um job existente; retorna False se o job não existe"""
+        campos["atualizado_em"] = datetime.now().isoformat()
+        colunas, dados, texto = self._separar(campos)
+        with self._lock, self._conexao:
+            linha = self._conexao.execute("SELECT dados FROM jobs WHERE id = ?", (transcricao_id,)).fetchone()
+            if linha is None:
+                return False
+            if dados:
+                extras = json.loads(linha["dados"])
+                extras.update(dados)
+                colunas["dados"] = json.dumps(extras, ensure_ascii=False)
+            self._conexao.execute(
+                f"UPDATE jobs SET {', '.join(f'{nome} = ?' for nome in colunas)} WHERE id = ?",
+                (*colunas.values(), transcricao_id),
+            )
+            if texto is not None:
+                self._salvar_texto(transcricao_id, texto)
+        return True
+
+    def _salvar_texto(self, transcricao_id: str, texto: str):
+        """Grava o texto da transcrição (chamar com o lock e a transação abertos)"""
+        self._conexao.execute("INSERT OR REPLACE INTO textos (id, texto) VALUES (?, ?)", (transcricao_id, texto))
+
+    def obter(self, transcricao_id: str, com_texto: bool = False):
+        """Retorna o job como dict (com 'texto' se pedido e disponível) ou None"""
+        with self._lock:
+            linha = self._conexao.execute("SELECT * FROM jobs WHERE id = ?", (transcricao_id,)).fetchone()
+            if linha is None:
+                return None
+            job = self._job(linha)
+            if com_texto:
+                texto = self._conexao.execute("SELECT texto FROM textos WHERE id = ?", (transcricao_id,)).fetchone()
+                if texto is not None:
+                    job["texto"] = texto["texto"]
+        return job
+
+    def status(self, transcricao_id: str):
+        with self._lock:
+            linha = self._conexao.execute("SELECT status FROM jobs WHERE id = ?", (transcricao_id,)).fetchone()
+        return linha["status"] if linha else None
+
+    def existe(self, transcricao_id: str) -> bool:
+        return self.status(transcricao_id) is not None
+
+    def por_cliente(self, client_id: str):
+        """Retorna (transcricao_id, job) do job mais recente associado ao client_id, ou (None, None)"""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT * FROM jobs WHERE client_id = ? ORDER BY iniciado_em DESC LIMIT 1", (client_id,)
+            ).fetchone()
+        if linha is None:
+            return None, None
+        return linha["id"], self._job(linha)
+
+    def listar(self, status: str = None, tipo: str = None, client_id: str = None,
+               desde: str = None, limite: int = 50, offset: int = 0):
+        """
+        Lista jobs, do mais recente para o mais antigo, sem o texto das transcrições
+
+        Returns:
+            (total de jobs que atendem aos filtros, lista de (transcricao_id, job))
+        """
+        condicoes, parametros = [], []
+        for coluna, valor in (("status", status), ("tipo", tipo), ("client_id", client_id)):
+            if valor:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        if desde:
+            condicoes.append("iniciado_em >= ?")
+            parametros.append(desde)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        with self._lock:
+            total = self._conexao.execute(f"SELECT COUNT(*) FROM jobs {where}", parametros).fetchone()[0]
+            linhas = self._conexao.execute(
+                f"SELECT * FROM jobs {where} ORDER BY iniciado_em DESC LIMIT ? OFFSET ?",
+                (*parametros, limite, offset),
+            ).fetchall()
+        return total, [(linha["id"], self._job(linha)) for linha in linhas]
+
+    def pendentes(self) -> list:
+        """IDs dos jobs aguardando na fila, do mais antigo para o mais recente"""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT id FROM jobs WHERE status = 'em_andamento' ORDER BY iniciado_em"
+            ).fetchall()
+        return [linha["id"] for linha in linhas]
+
+    def ids(self, status: str) -> list:
+        """IDs de todos os jobs com o status dado (sem ler os metadados)"""
+        with self._lock:
+            linhas = self._conexao.execute("SELECT id FROM jobs WHERE status = ?", (status,)).fetchall()
+        return [linha["id"] for linha in linhas]
+
+    def registrar_rtf(self, modelo: str, host: str, duracao_audio: float, tempo: float):
+        """Guarda quanto tempo uma transcrição levou para uma dada duração de áudio"""
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                "INSERT INTO historico_rtf (modelo, host, duracao_audio, tempo, registrado_em) VALUES (?, ?, ?, ?, ?)",
+                (modelo, host, duracao_audio, tempo, time.time()),
+            )
+
+    def rtfs_recentes(self, modelo: str, host: str = None, limite: int = 20) -> list:
+        """Fatores de tempo real (tempo / duração do áudio) mais recentes do modelo, opcionalmente por host"""
+        condicao, parametros = "modelo = ?", [modelo]
+        if host:
+            condicao += " AND host = ?"
+            parametros.append(host)
+        with self._lock:
+            linhas = self._conexao.execute(
+                f"SELECT tempo / duracao_audio AS rtf FROM historico_rtf WHERE {condicao} "
+                f"ORDER BY registrado_em DESC LIMIT ?", (*parametros, limite)
+            ).fetchall()
+        return [linha["rtf"] for linha in linhas]
+
+    def marcar_interrompidos(self) -> int:
+        """Marca como falha os jobs que estavam em execução quando o servidor parou (podem ser retomados)"""
+        with self._lock, self._conexao:
+            cursor = self._conexao.execute(
+                f"UPDATE jobs SET status = 'falha', erro = ?, atualizado_em = ? "
+                f"WHERE status IN ({', '.join('?' for _ in STATUS_EM_EXECUCAO)})",
+                ("Servidor reiniciado durante a transcrição", datetime.now().isoformat(), *STATUS_EM_EXECUCAO),
+            )
+        return cursor.rowcount
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
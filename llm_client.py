@@ -0,0 +1,254 @@
+"""
+Cliente assíncrono da API de LLM (OpenRouter, compatível com a API de chat da OpenAI)
+
+Substitui o requests.post bloqueante de gerar_insights, que segurava o event
+loop (e todos os WebSockets) enquanto a resposta não chegava. O cliente:
+- reaproveita conexões (pool keep-alive compartilhado, sem novo TCP/TLS a cada chamada);
+- tem timeout por chamada;
+- repete em 429/5xx e erros de rede, com backoff exponencial e jitter (respeitando Retry-After);
+- limita as chamadas simultâneas ao provedor;
+- abre um disjuntor (circuit breaker) após falhas seguidas, recusando chamadas
+  por um tempo em vez de acumular requisições presas em um provedor fora do ar.
+
+LLM_BASE_URL permite apontar o cliente para um servidor local de teste.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+LLM_MODELO = os.getenv("LLM_MODELO", "google/gemini-2.5-flash-preview")
+LLM_TIMEOUT_SEGUNDOS = float(os.getenv("LLM_TIMEOUT_SEGUNDOS", "60"))
+LLM_TIMEOUT_CONEXAO_SEGUNDOS = float(os.getenv("LLM_TIMEOUT_CONEXAO_SEGUNDOS", "10"))
+LLM_TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", "3"))
+LLM_CONCORRENCIA_MAXIMA = int(os.getenv("LLM_CONCORRENCIA_MAXIMA", "4"))
+LLM_FALHAS_PARA_ABRIR = int(os.getenv("LLM_FALHAS_PARA_ABRIR", "5"))
+LLM_CIRCUITO_ABERTO_SEGUNDOS = float(os.getenv("LLM_CIRCUITO_ABERTO_SEGUNDOS", "30"))
+
+# Backoff entre tentativas: até BASE * 2^tentativa segundos (jitter completo), limitado ao máximo
+BACKOFF_BASE_SEGUNDOS = 0.5
+BACKOFF_MAXIMO_SEGUNDOS = 8.0
+
+STATUS_REPETIVEIS = (429, 500, 502, 503, 504)
+
+
+class ErroLLM(Exception):
+    def __init__(self, mensagem: str, status: int = None):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class CircuitoAberto(ErroLLM):
+    def __init__(self, retry_after: float):
+        super().__init__(f"API de LLM indisponível, nova tentativa em {retry_after:.0f}s", status=503)
+        self.retry_after = retry_after
+
+
+class Disjuntor:
+    def __init__(self, falhas_para_abrir: int = LLM_FALHAS_PARA_ABRIR,
+                 tempo_aberto: float = LLM_CIRCUITO_ABERTO_SEGUNDOS):
+        """
+        Circuit breaker: fechado -> aberto após 'falhas_para_abrir' falhas seguidas;
+        depois de 'tempo_aberto' segundos deixa passar uma chamada de teste (meio aberto)
+
+        Args:
+            falhas_para_abrir: Falhas consecutivas que abrem o circuito
+            tempo_aberto: Segundos recusando chamadas antes de testar de novo
+        """
+        self.falhas_para_abrir = max(1, falhas_para_abrir)
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_em = None
+        self._testando = False
+
+    @property
+    def estado(self) -> str:
+        if self.aberto_em is None:
+            return "fechado"
+        if time.monotonic() - self.aberto_em < self.tempo_aberto:
+            return "aberto"
+        return "meio_aberto"
+
+    def permitir(self) -> bool:
+        """
+        Levanta CircuitoAberto se a chamada não deve ir ao provedor
+
+        Returns:
+            True se esta é a chamada de teste do circuito meio aberto
+        """
+        estado = self.estado
+        if estado == "aberto":
+            raise CircuitoAberto(self.tempo_aberto - (time.monotonic() - self.aberto_em))
+        if estado == "meio_aberto":
+            if self._testando:
+                # Só uma chamada de teste por vez enquanto o provedor não se recupera
+                raise CircuitoAberto(1)
+            self._testando = True
+            return True
+        return False
+
+    def liberar_teste(self):
+        self._testando = False
+
+    def sucesso(self):
+        self.falhas = 0
+        self.aberto_em = None
+        self._testando = False
+
+    def falha(self):
+        self.falhas += 1
+        if self._testando or self.falhas >= self.falhas_para_abrir:
+            if self.aberto_em is None or self._testando:
+                print(f"Circuito da API de LLM aberto após {self.falhas} falha(s) seguida(s)")
+            self.aberto_em = time.monotonic()
+        self._testando = False
+
+
+class ClienteLLM:
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: str = None, modelo: str = LLM_MODELO,
+                 timeout: float = LLM_TIMEOUT_SEGUNDOS, tentativas: int = LLM_TENTATIVAS,
+                 concorrencia: int = LLM_CONCORRENCIA_MAXIMA, disjuntor: Disjuntor = None,
+                 transport: httpx.AsyncBaseTransport = None):
+        """
+        Inicializa o cliente (a conexão é criada na primeira chamada, dentro do event loop)
+
+        Args:
+            base_url: URL base da API (…/v1)
+            api_key: Chave da API; se None, lida de OPENROUTER_API_KEY a cada chamada
+            modelo: Modelo padrão
+            timeout: Timeout padrão de cada chamada, em segundos
+            tentativas: Tentativas por chamada (inclui a primeira)
+            concorrencia: Chamadas simultâneas ao provedor, no servidor inteiro
+            transport: Transporte httpx alternativo (ex.: httpx.MockTransport em testes)
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.modelo = modelo
+        self.timeout = timeout
+        self.tentativas = max(1, tentativas)
+        self.concorrencia = max(1, concorrencia)
+        self.disjuntor = disjuntor or Disjuntor()
+        self._transport = transport
+        self._cliente = None
+        self._semaforo = asyncio.Semaphore(self.concorrencia)
+        self.em_andamento = 0
+        self.chamadas = 0
+        self.falhas = 0
+        self.repeticoes = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=LLM_TIMEOUT_CONEXAO_SEGUNDOS),
+                limits=httpx.Limits(max_connections=self.concorrencia,
+                                    max_keepalive_connections=self.concorrencia),
+                transport=self._transport,
+            )
+        return self._cliente
+
+    @staticmethod
+    def _espera(tentativa: int, resposta: httpx.Response = None) -> float:
+        """Segundos até a próxima tentativa: Retry-After do provedor ou backoff exponencial com jitter"""
+        if resposta is not None:
+            try:
+                return min(float(resposta.headers["retry-after"]), BACKOFF_MAXIMO_SEGUNDOS)
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0, min(BACKOFF_MAXIMO_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * 2 ** tentativa))
+
+    async def completar(self, mensagens: list, modelo: str = None, timeout: float = None, **parametros) -> str:
+        """
+        Envia as mensagens ao endpoint de chat e retorna o conteúdo da resposta
+
+        Raises:
+            CircuitoAberto: O provedor falhou seguidas vezes há pouco
+            ErroLLM: Chave ausente, erro do provedor ou resposta malformada
+        """
+        api_key = self.api_key or os.getenv("OPENROUTER_API_KEY")
+        if not api_key:
+            raise ErroLLM("Chave API do OpenRouter não configurada.")
+        teste = self.disjuntor.permitir()
+        corpo = {"model": modelo or self.modelo, "messages": mensagens, **parametros}
+
+        self.chamadas += 1
+        try:
+            async with self._semaforo:
+                self.em_andamento += 1
+                try:
+                    dados = await self._enviar(corpo, api_key, timeout or self.timeout)
+                except ErroLLM as e:
+                    self.falhas += 1
+                    # Erros do cliente (4xx exceto 429) não indicam provedor fora do ar
+                    if e.status is None or e.status in STATUS_REPETIVEIS:
+                        self.disjuntor.falha()
+                    else:
+                        self.disjuntor.sucesso()
+                    raise
+                finally:
+                    self.em_andamento -= 1
+            self.disjuntor.sucesso()
+        finally:
+            if teste:
+                # Chamada de teste cancelada (ou com erro inesperado) não conta como sucesso nem falha,
+                # mas libera o circuito meio aberto para a próxima chamada de teste
+                self.disjuntor.liberar_teste()
+
+        try:
+            conteudo = dados["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            print(f"Resposta da API malformada: {dados}")
+            raise ErroLLM("Resposta da API inválida.")
+        if not conteudo:
+            raise ErroLLM("Resposta da API inválida (conteúdo vazio).")
+        return conteudo
+
+    async def _enviar(self, corpo: dict, api_key: str, timeout: float) -> dict:
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            resposta = None
+            try:
+                resposta = await self._http().post(
+                    "/chat/completions", json=corpo, timeout=timeout,
+                    headers={"Authorization": f"Bearer {api_key}"},
+                )
+                if resposta.status_code not in STATUS_REPETIVEIS:
+                    if resposta.is_error:
+                        raise ErroLLM(f"{resposta.status_code} - {resposta.text[:500]}", status=resposta.status_code)
+                    try:
+                        return resposta.json()
+                    except ValueError:
+                        raise ErroLLM("Resposta da API não é JSON.", status=resposta.status_code)
+                ultimo_erro = ErroLLM(f"{resposta.status_code} - {resposta.text[:500]}", status=resposta.status_code)
+            except httpx.TimeoutException:
+                ultimo_erro = ErroLLM(f"Tempo esgotado após {timeout:.0f}s")
+            except httpx.TransportError as e:
+                ultimo_erro = ErroLLM(f"Erro de conexão: {e}")
+
+            if tentativa + 1 < self.tentativas:
+                espera = self._espera(tentativa, resposta)
+                print(f"Chamada à API de LLM falhou ({ultimo_erro}), nova tentativa em {espera:.1f}s")
+                self.repeticoes += 1
+                await asyncio.sleep(espera)
+        raise ultimo_erro
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    def estatisticas(self) -> dict:
+        return {
+            "modelo": self.modelo,
+            "circuito": self.disjuntor.estado,
+            "falhas_seguidas": self.disjuntor.falhas,
+            "em_andamento": self.em_andamento,
+            "concorrencia_maxima": self.concorrencia,
+            "chamadas": self.chamadas,
+            "falhas": self.falhas,
+            "repeticoes": self.repeticoes,
+        }
@@ -0,0 +1,164 @@
+"""
+Registro de modelos Whisper compartilhado
+
+Mantém vários tamanhos de modelo carregados ao mesmo tempo dentro de um
+orçamento de memória. Quando um novo modelo não cabe, o modelo usado há mais
+tempo (LRU) é descarregado.
+
+Cada processo tem o seu próprio registro. No servidor, os modelos só ficam nos
+processos do pool de inferência, e o orçamento ORCAMENTO_MEMORIA_MODELOS_MB é
+dividido igualmente entre eles (ver PoolInferencia), então a soma dos
+processos nunca passa do total. Fora do servidor (ex.: AudioManager em um
+script), o processo usa o orçamento inteiro.
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Orçamento de memória para os modelos, somando todos os processos de inferência (configurável via .env)
+ORCAMENTO_MEMORIA_MODELOS_MB = int(os.getenv("ORCAMENTO_MEMORIA_MODELOS_MB", "4096"))
+
+MB = 1024 * 1024
+
+# Tamanho aproximado dos pesos em fp32, usado para abrir espaço antes do carregamento
+TAMANHO_ESTIMADO_MB = {
+    "tiny": 150,
+    "base": 290,
+    "small": 970,
+    "medium": 3060,
+    "large": 6170,
+    "large-v2": 6170,
+    "large-v3": 6170,
+}
+
+
+def _carregar_whisper(nome_modelo):
+    import whisper
+    return whisper.load_model(nome_modelo)
+
+
+def memoria_modelo(modelo) -> int:
+    """Retorna os bytes ocupados pelos parâmetros e buffers do modelo"""
+    total = sum(p.numel() * p.element_size() for p in modelo.parameters())
+    total += sum(b.numel() * b.element_size() for b in modelo.buffers())
+    return total
+
+
+class RegistroModelos:
+    def __init__(self, orcamento_mb: int = ORCAMENTO_MEMORIA_MODELOS_MB, carregador=None):
+        """
+        Inicializa o registro
+
+        Args:
+            orcamento_mb: Memória máxima (MB) ocupada pelos modelos carregados
+            carregador: Função que carrega um modelo pelo nome (padrão: whisper.load_model)
+        """
+        self.orcamento = orcamento_mb * MB
+        self._carregador = carregador or _carregar_whisper
+        self._modelos = OrderedDict()  # nome -> entrada, do menos para o mais recente
+        self._carregando = {}  # nome -> threading.Event, evita carregar o mesmo modelo duas vezes
+        self._lock = threading.Lock()
+
+    def obter(self, nome_modelo: str):
+        """Retorna o modelo, carregando-o (e descarregando os menos usados) se necessário"""
+        while True:
+            with self._lock:
+                entrada = self._modelos.get(nome_modelo)
+                if entrada is not None:
+                    self._modelos.move_to_end(nome_modelo)
+                    entrada["ultimo_uso"] = time.time()
+                    entrada["usos"] += 1
+                    return entrada["modelo"]
+
+                evento = self._carregando.get(nome_modelo)
+                if evento is None:
+                    self._carregando[nome_modelo] = threading.Event()
+                    break
+            # Outro thread já está carregando este modelo: espera e tenta de novo
+            evento.wait()
+
+        try:
+            with self._lock:
+                self._liberar_espaco(TAMANHO_ESTIMADO_MB.get(nome_modelo, 0) * MB)
+
+            print(f"[{os.getpid()}] Carregando modelo Whisper {nome_modelo}...")
+            inicio = time.time()
+            modelo = self._carregador(nome_modelo)
+            tamanho = memoria_modelo(modelo)
+            print(f"[{os.getpid()}] Modelo {nome_modelo} carregado em {time.time() - inicio:.1f}s "
+                  f"({tamanho / MB:.0f}MB)")
+
+            with self._lock:
+                self._modelos[nome_modelo] = {
+                    "modelo": modelo,
+                    "bytes": tamanho,
+                    "carregado_em": time.time(),
+                    "ultimo_uso": time.time(),
+                    "usos": 1,
+                }
+                # Confere com o tamanho real, que pode diferir da estimativa
+                self._liberar_espaco(0, manter=nome_modelo)
+            return modelo
+        finally:
+            with self._lock:
+                self._carregando.pop(nome_modelo).set()
+
+    def _liberar_espaco(self, necessario: int, manter: str = None):
+        """Descarrega modelos LRU até caber 'necessario' bytes (chamar com o lock adquirido)"""
+        liberou = False
+        while self._memoria_total() + necessario > self.orcamento:
+            candidatos = [nome for nome in self._modelos if nome != manter]
+            if not candidatos:
+                break
+            nome = candidatos[0]
+            entrada = self._modelos.pop(nome)
+            print(f"[{os.getpid()}] Descarregando modelo {nome} ({entrada['bytes'] / MB:.0f}MB) "
+                  f"para respeitar o orçamento de {self.orcamento / MB:.0f}MB")
+            liberou = True
+        if liberou:
+            gc.collect()
+
+    def _memoria_total(self) -> int:
+        return sum(entrada["bytes"] for entrada in self._modelos.values())
+
+    def ajustar_orcamento(self, orcamento_mb: float):
+        """Troca o orçamento, descarregando modelos LRU se os carregados não couberem mais"""
+        with self._lock:
+            self.orcamento = orcamento_mb * MB
+            self._liberar_espaco(0)
+
+    def descarregar(self, nome_modelo: str) -> bool:
+        with self._lock:
+            entrada = self._modelos.pop(nome_modelo, None)
+        if entrada is None:
+            return False
+        gc.collect()
+        return True
+
+    def carregados(self):
+        with self._lock:
+            return list(self._modelos)
+
+    def relatorio(self) -> dict:
+        """Retorna a memória usada por cada modelo carregado, do menos para o mais recente"""
+        with self._lock:
+            return {
+                "orcamento_mb": round(self.orcamento / MB, 1),
+                "total_mb": round(self._memoria_total() / MB, 1),
+                "modelos": [
+                    {
+                        "nome": nome,
+                        "memoria_mb": round(entrada["bytes"] / MB, 1),
+                        "usos": entrada["usos"],
+                        "ultimo_uso": entrada["ultimo_uso"],
+                    }
+                    for nome, entrada in self._modelos.items()
+                ],
+            }
+
+
+# Registro do processo atual
+registro_modelos = RegistroModelos()
@@ -0,0 +1,245 @@
+"""
+Uploads retomáveis em partes
+
+Protocolo para arquivos grandes em conexões instáveis: o cliente cria o
+upload informando o tamanho total, envia partes em qualquer ordem (inclusive
+em paralelo) com PATCH no offset de cada uma, consulta o que já foi recebido
+e, ao final, finaliza o upload para criar a transcrição. Uma queda de conexão
+custa apenas a parte em trânsito.
+
+Cada upload parcial fica em uploads/parciais como {id}.parte (arquivo com o
+tamanho final, preenchido por offset) e {id}.meta (JSON com os intervalos já
+recebidos e os checksums).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from upload_stream import TAMANHO_MAXIMO_UPLOAD_MB
+
+DIRETORIO_UPLOADS_PARCIAIS = os.getenv("DIRETORIO_UPLOADS_PARCIAIS", "uploads/parciais")
+UPLOAD_PARCIAL_TTL_HORAS = float(os.getenv("UPLOAD_PARCIAL_TTL_HORAS", "24"))
+
+
+def _juntar_intervalos(intervalos: list) -> list:
+    """Ordena e funde intervalos [inicio, fim) que se tocam ou se sobrepõem"""
+    resultado = []
+    for inicio, fim in sorted(intervalos):
+        if resultado and inicio <= resultado[-1][1]:
+            resultado[-1][1] = max(resultado[-1][1], fim)
+        else:
+            resultado.append([inicio, fim])
+    return resultado
+
+
+class UploadsRetomaveis:
+    def __init__(self, diretorio: str = DIRETORIO_UPLOADS_PARCIAIS, max_mb: float = TAMANHO_MAXIMO_UPLOAD_MB,
+                 ttl_horas: float = UPLOAD_PARCIAL_TTL_HORAS):
+        """
+        Inicializa o gerenciador
+
+        Args:
+            diretorio: Onde ficam os uploads parciais ({id}.parte e {id}.meta)
+            max_mb: Tamanho máximo de um arquivo
+            ttl_horas: Uploads sem atividade por mais tempo que isso são descartados
+        """
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = ttl_horas * 3600
+        self._locks = {}  # upload_id -> asyncio.Lock, serializa as atualizações do .meta
+
+    def _caminho_parte(self, upload_id: str) -> Path:
+        return self.diretorio / f"{upload_id}.parte"
+
+    def _caminho_meta(self, upload_id: str) -> Path:
+        return self.diretorio / f"{upload_id}.meta"
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    def _ler_meta(self, upload_id: str) -> dict:
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Upload não encontrado")
+        try:
+            with open(self._caminho_meta(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise HTTPException(status_code=404, detail="Upload não encontrado")
+
+    def _salvar_meta(self, upload_id: str, meta: dict):
+        meta["atualizado_em"] = time.time()
+        caminho = self._caminho_meta(upload_id)
+        temporario = caminho.with_suffix(".meta.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    def criar(self, nome_arquivo: str, tamanho: int, sha256: str = None, **metadados) -> dict:
+        """
+        Cria um upload vazio com o tamanho final já reservado
+
+        Args:
+            nome_arquivo: Nome original do arquivo
+            tamanho: Tamanho total em bytes
+            sha256: Hash (hex) do arquivo inteiro, conferido na finalização (opcional)
+            **metadados: Dados guardados para a criação da transcrição (ex.: modelo)
+        """
+        if tamanho <= 0:
+            raise HTTPException(status_code=400, detail="Tamanho do arquivo inválido")
+        if tamanho > self.max_bytes:
+            raise HTTPException(status_code=413,
+                                detail=f"Arquivo maior que o limite de {self.max_bytes / 1024 / 1024:.0f}MB")
+        self.remover_expirados()
+
+        upload_id = str(uuid.uuid4())
+        with open(self._caminho_parte(upload_id), "wb") as f:
+            f.truncate(tamanho)
+        meta = {
+            "upload_id": upload_id,
+            "nome_arquivo": os.path.basename(nome_arquivo) or "upload",
+            "tamanho": tamanho,
+            "sha256": sha256.lower() if sha256 else None,
+            "recebidos": [],
+            "criado_em": time.time(),
+            "metadados": metadados,
+        }
+        self._salvar_meta(upload_id, meta)
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """Retorna o tamanho, os intervalos recebidos e o offset contíguo a partir do início"""
+        meta = self._ler_meta(upload_id)
+        recebidos = meta["recebidos"]
+        offset = recebidos[0][1] if recebidos and recebidos[0][0] == 0 else 0
+        faltando = []
+        anterior = 0
+        for inicio, fim in recebidos + [[meta["tamanho"], meta["tamanho"]]]:
+            if inicio > anterior:
+                faltando.append([anterior, inicio])
+            anterior = fim
+        return {
+            "upload_id": upload_id,
+            "nome_arquivo": meta["nome_arquivo"],
+            "tamanho": meta["tamanho"],
+            "offset": offset,
+            "recebidos": recebidos,
+            "faltando": faltando,
+            "completo": not faltando,
+        }
+
+    async def receber_parte(self, upload_id: str, offset: int, corpo, sha256: str = None) -> dict:
+        """
+        Grava uma parte do arquivo a partir de 'offset'
+
+        Args:
+            upload_id: ID do upload
+            offset: Posição (bytes) da parte no arquivo
+            corpo: Iterador assíncrono com os bytes da parte (request.stream())
+            sha256: Hash (hex) da parte; se não conferir, a parte é descartada
+
+        Returns:
+            Status atualizado do upload
+        """
+        meta = self._ler_meta(upload_id)
+        if offset < 0 or offset > meta["tamanho"]:
+            raise HTTPException(status_code=416, detail="Offset fora do arquivo")
+
+        hash_parte = hashlib.sha256()
+        posicao = offset
+        # Partes diferentes escrevem em regiões diferentes do mesmo arquivo, sem lock
+        f = await asyncio.to_thread(open, self._caminho_parte(upload_id), "r+b")
+
+        def gravar(bloco):
+            f.write(bloco)
+            hash_parte.update(bloco)
+
+        try:
+            f.seek(offset)
+            async for bloco in corpo:
+                if posicao + len(bloco) > meta["tamanho"]:
+                    raise HTTPException(status_code=413, detail="Parte ultrapassa o tamanho do arquivo")
+                # Escrita e hash fora do event loop, como o hash do arquivo em finalizar
+                await asyncio.to_thread(gravar, bloco)
+                posicao += len(bloco)
+        finally:
+            await asyncio.to_thread(f.close)
+
+        if sha256 and hash_parte.hexdigest() != sha256.lower():
+            # A região não é marcada como recebida: o cliente reenvia a parte
+            raise HTTPException(status_code=460, detail="Checksum da parte não confere")
+
+        if posicao > offset:
+            async with self._lock(upload_id):
+                meta = self._ler_meta(upload_id)
+                meta["recebidos"] = _juntar_intervalos(meta["recebidos"] + [[offset, posicao]])
+                self._salvar_meta(upload_id, meta)
+        return self.status(upload_id)
+
+    async def finalizar(self, upload_id: str, destino: str) -> dict:
+        """
+        Confere o upload completo e move o arquivo para 'destino'
+
+        Returns:
+            Dict com 'caminho', 'nome_arquivo', 'tamanho', 'sha256' e 'metadados'
+        """
+        async with self._lock(upload_id):
+            status = self.status(upload_id)
+            if not status["completo"]:
+                raise HTTPException(status_code=409, detail={"mensagem": "Upload incompleto",
+                                                             "faltando": status["faltando"]})
+            meta = self._ler_meta(upload_id)
+            caminho_parte = self._caminho_parte(upload_id)
+            sha256 = await asyncio.to_thread(self._hash_arquivo, caminho_parte)
+            if meta["sha256"] and sha256 != meta["sha256"]:
+                # Alguma parte chegou corrompida sem checksum: recomeça do zero
+                meta["recebidos"] = []
+                self._salvar_meta(upload_id, meta)
+                raise HTTPException(status_code=460, detail="Checksum do arquivo não confere")
+
+            os.replace(caminho_parte, destino)
+            self._caminho_meta(upload_id).unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+        return {
+            "caminho": destino,
+            "nome_arquivo": meta["nome_arquivo"],
+            "tamanho": meta["tamanho"],
+            "sha256": sha256,
+            "metadados": meta["metadados"],
+        }
+
+    @staticmethod
+    def _hash_arquivo(caminho) -> str:
+        sha256 = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(bloco)
+        return sha256.hexdigest()
+
+    def cancelar(self, upload_id: str):
+        self._ler_meta(upload_id)
+        self._remover(upload_id)
+
+    def _remover(self, upload_id: str):
+        self._caminho_parte(upload_id).unlink(missing_ok=True)
+        self._caminho_meta(upload_id).unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+
+    def remover_expirados(self):
+        """Descarta uploads parados há mais tempo que o TTL"""
+        for caminho_meta in self.diretorio.glob("*.meta"):
+            try:
+                if time.time() - caminho_meta.stat().st_mtime > self.ttl:
+                    print(f"Removendo upload parcial expirado: {caminho_meta.stem}")
+                    self._remover(caminho_meta.stem)
+            except FileNotFoundError:
+                continue
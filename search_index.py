@@ -0,0 +1,266 @@
+"""
+Índice de busca textual das transcrições
+
+Cada segmento de cada transcrição concluída é uma linha da tabela 'trechos'
+(com o início e o fim no áudio) e é indexado por uma tabela FTS5 de conteúdo
+externo, mantida por triggers. O índice é atualizado incrementalmente quando
+uma transcrição termina; a busca não lê nenhum arquivo de transcrição.
+
+A consulta aceita palavras (todas precisam aparecer), frases entre aspas e
+prefixos terminados em '*'. Acentos e maiúsculas são ignorados.
+
+Calcular o BM25 de todos os trechos de um termo muito comum custa centenas de
+milissegundos; por isso só os CANDIDATOS_BUSCA trechos mais recentes que
+atendem à consulta são ordenados por relevância (exato quando há menos que isso).
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+CAMINHO_INDICE_BUSCA = os.getenv("CAMINHO_INDICE_BUSCA", "transcricoes/busca.db")
+# Quantos trechos (os mais recentes) são ordenados por relevância em buscas muito amplas
+CANDIDATOS_BUSCA = int(os.getenv("CANDIDATOS_BUSCA", "2000"))
+
+# Marcadores do termo encontrado nos trechos devolvidos
+MARCA_INICIO = "**"
+MARCA_FIM = "**"
+PALAVRAS_TRECHO = 16
+
+_TERMOS = re.compile(r'"([^"]*)"|(\S+)')
+_PALAVRAS = re.compile(r"\w+")
+
+# Palavras que não ajudam a escolher trechos para uma pergunta
+PALAVRAS_VAZIAS = frozenset("""
+a ao aos aquela aquele aquilo as até com como da das de dela dele do dos e ela ele eles em entre
+era essa esse esta este eu foi for há isso isto já lhe mais mas me mesmo meu minha muito na nas
+nem no nos o os ou para pela pelo por qual quais quando que quem se sem ser seu sua são também
+te tem ter um uma umas uns você vocês sobre onde porque fala falou falam disse diz qual quanto
+quantos quantas explique explica descreva liste cite transcrição vídeo áudio
+""".split())
+
+
+def formatar_tempo(segundos) -> str:
+    """Formata segundos como mm:ss (ou h:mm:ss)"""
+    segundos = int(segundos)
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    if horas:
+        return f"{horas:d}:{minutos:02d}:{segundos:02d}"
+    return f"{minutos:02d}:{segundos:02d}"
+
+
+def montar_consulta(texto: str):
+    """Converte a busca do usuário em uma expressão FTS5 segura, ou None se não há termos"""
+    partes = []
+    for frase, palavra in _TERMOS.findall(texto or ""):
+        termo = frase if frase else palavra
+        prefixo = not frase and termo.endswith("*")
+        termo = termo.rstrip("*") if prefixo else termo
+        if not any(c.isalnum() for c in termo):
+            continue
+        termo = '"' + termo.replace('"', '""') + '"'
+        partes.append(termo + "*" if prefixo else termo)
+    return " ".join(partes) or None
+
+
+def montar_consulta_pergunta(pergunta: str):
+    """Expressão FTS5 com as palavras relevantes de uma pergunta em linguagem natural (qualquer uma basta)"""
+    termos = []
+    for palavra in _PALAVRAS.findall((pergunta or "").lower()):
+        if len(palavra) < 3 or palavra in PALAVRAS_VAZIAS or palavra in termos:
+            continue
+        termos.append(palavra)
+    return " OR ".join(f'"{termo}"' for termo in termos) or None
+
+
+class IndiceBusca:
+    def __init__(self, caminho: str = CAMINHO_INDICE_BUSCA):
+        """
+        Abre (ou cria) o índice
+
+        Args:
+            caminho: Arquivo SQLite do índice
+        """
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS documentos (
+                    id TEXT PRIMARY KEY,
+                    titulo TEXT,
+                    origem TEXT,
+                    versao REAL,
+                    indexado_em REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS trechos (
+                    id INTEGER PRIMARY KEY,
+                    documento TEXT NOT NULL REFERENCES documentos (id),
+                    inicio REAL,
+                    fim REAL,
+                    texto TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_trechos_documento ON trechos (documento);
+                CREATE VIRTUAL TABLE IF NOT EXISTS trechos_fts USING fts5(
+                    texto, content='trechos', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );
+                CREATE TRIGGER IF NOT EXISTS trechos_ai AFTER INSERT ON trechos BEGIN
+                    INSERT INTO trechos_fts (rowid, texto) VALUES (new.id, new.texto);
+                END;
+                CREATE TRIGGER IF NOT EXISTS trechos_ad AFTER DELETE ON trechos BEGIN
+                    INSERT INTO trechos_fts (trechos_fts, rowid, texto) VALUES ('delete', old.id, old.texto);
+                END;
+            """)
+
+    def indexar(self, documento_id: str, titulo: str = None, segmentos=None, texto: str = None,
+                origem: str = "transcricao", versao: float = None):
+        """
+        (Re)indexa um documento, substituindo o que havia para o mesmo ID
+
+        Args:
+            segmentos: Lista de {'texto', 'inicio', 'fim'}; sem segmentos, 'texto' vira um único trecho
+            versao: Marca da versão indexada (ex.: mtime do arquivo), para saber se precisa reindexar
+        """
+        trechos = [(s.get("inicio"), s.get("fim"), s["texto"].strip()) for s in segmentos or [] if s["texto"].strip()]
+        if not trechos and texto and texto.strip():
+            trechos = [(None, None, texto.strip())]
+        with self._lock, self._conexao:
+            self._conexao.execute("DELETE FROM trechos WHERE documento = ?", (documento_id,))
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO documentos (id, titulo, origem, versao, indexado_em) VALUES (?, ?, ?, ?, ?)",
+                (documento_id, titulo, origem, versao, time.time()),
+            )
+            self._conexao.executemany(
+                "INSERT INTO trechos (documento, inicio, fim, texto) VALUES (?, ?, ?, ?)",
+                [(documento_id, *trecho) for trecho in trechos],
+            )
+        return len(trechos)
+
+    def remover(self, documento_id: str):
+        with self._lock, self._conexao:
+            self._conexao.execute("DELETE FROM trechos WHERE documento = ?", (documento_id,))
+            self._conexao.execute("DELETE FROM documentos WHERE id = ?", (documento_id,))
+
+    def versoes(self, origem: str = None) -> dict:
+        """ID -> versão de cada documento indexado (opcionalmente só de uma origem)"""
+        with self._lock:
+            if origem:
+                linhas = self._conexao.execute("SELECT id, versao FROM documentos WHERE origem = ?", (origem,))
+            else:
+                linhas = self._conexao.execute("SELECT id, versao FROM documentos")
+            return {linha["id"]: linha["versao"] for linha in linhas.fetchall()}
+
+    def buscar(self, consulta: str, limite: int = 20, offset: int = 0, candidatos: int = CANDIDATOS_BUSCA):
+        """
+        Busca os trechos que atendem à consulta, dos mais relevantes (BM25) para os menos
+
+        Args:
+            candidatos: Trechos mais recentes considerados na ordenação por relevância
+
+        Returns:
+            (total de trechos encontrados, lista de dicts com documento, titulo, inicio, fim e trecho)
+
+        Raises:
+            ValueError: Consulta sem termos ou inválida
+        """
+        expressao = montar_consulta(consulta)
+        if expressao is None:
+            raise ValueError("Consulta sem termos")
+        try:
+            with self._lock:
+                total = self._conexao.execute(
+                    "SELECT COUNT(*) FROM trechos_fts WHERE trechos_fts MATCH ?", (expressao,)
+                ).fetchone()[0]
+                linhas = self._conexao.execute(
+                    f"""SELECT t.documento, d.titulo, t.inicio, t.fim, c.trecho
+                       FROM (
+                           SELECT rowid, rank, snippet(trechos_fts, 0, ?, ?, '…', {PALAVRAS_TRECHO}) AS trecho
+                           FROM trechos_fts WHERE trechos_fts MATCH ?
+                           ORDER BY rowid DESC LIMIT ?
+                       ) c
+                       JOIN trechos t ON t.id = c.rowid
+                       JOIN documentos d ON d.id = t.documento
+                       ORDER BY c.rank LIMIT ? OFFSET ?""",
+                    (MARCA_INICIO, MARCA_FIM, expressao, max(candidatos, offset + limite), limite, offset),
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Consulta inválida: {e}")
+        return total, [dict(linha) for linha in linhas]
+
+    def existe(self, documento_id: str) -> bool:
+        with self._lock:
+            return self._conexao.execute(
+                "SELECT 1 FROM documentos WHERE id = ?", (documento_id,)
+            ).fetchone() is not None
+
+    def passagens(self, documento_id: str, pergunta: str, candidatos: int = 20, vizinhos: int = 2) -> list:
+        """
+        Passagens de um documento mais relevantes (BM25) para uma pergunta
+
+        Os 'candidatos' trechos mais relevantes são estendidos com 'vizinhos' trechos
+        de cada lado, para dar contexto, e janelas que se sobrepõem são unidas.
+
+        Returns:
+            Lista de dicts com inicio, fim, texto e relevancia, da mais relevante para a menos
+        """
+        expressao = montar_consulta_pergunta(pergunta)
+        if expressao is None:
+            return []
+        try:
+            with self._lock:
+                encontrados = self._conexao.execute(
+                    """SELECT t.id, -bm25(trechos_fts) AS relevancia
+                       FROM trechos_fts JOIN trechos t ON t.id = trechos_fts.rowid
+                       WHERE trechos_fts MATCH ? AND t.documento = ?
+                       ORDER BY rank LIMIT ?""",
+                    (expressao, documento_id, candidatos),
+                ).fetchall()
+                if not encontrados:
+                    return []
+                # Os trechos de um documento são inseridos juntos, então os IDs são consecutivos
+                janelas = sorted((linha["id"] - vizinhos, linha["id"] + vizinhos, linha["relevancia"])
+                                 for linha in encontrados)
+                unidas = []
+                for inicio, fim, relevancia in janelas:
+                    if unidas and inicio <= unidas[-1][1] + 1:
+                        unidas[-1][1] = max(unidas[-1][1], fim)
+                        unidas[-1][2] = max(unidas[-1][2], relevancia)
+                    else:
+                        unidas.append([inicio, fim, relevancia])
+                ids = [i for inicio, fim, _ in unidas for i in range(inicio, fim + 1)]
+                trechos = self._conexao.execute(
+                    f"SELECT id, inicio, fim, texto FROM trechos WHERE documento = ? AND id IN ({','.join('?' * len(ids))})",
+                    (documento_id, *ids),
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Erro ao buscar passagens de {documento_id}: {e}")
+            return []
+
+        passagens = []
+        for inicio, fim, relevancia in unidas:
+            linhas = sorted((t for t in trechos if inicio <= t["id"] <= fim), key=lambda t: t["id"])
+            if linhas:
+                passagens.append({
+                    "inicio": linhas[0]["inicio"],
+                    "fim": linhas[-1]["fim"],
+                    "texto": " ".join(t["texto"] for t in linhas),
+                    "relevancia": relevancia,
+                })
+        passagens.sort(key=lambda passagem: passagem["relevancia"], reverse=True)
+        return passagens
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            documentos = self._conexao.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+            trechos = self._conexao.execute("SELECT COUNT(*) FROM trechos").fetchone()[0]
+        return {"documentos": documentos, "trechos": trechos}
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
@@ -45,6 +45,11 @@ document.addEventListener('DOMContentLoaded', function() {
     let transcricoesAtivas = {};
     let socket = null;
     let currentAiRequestId = 0; // Para evitar condições de corrida nas respostas da IA
+    // Canal de eventos do job e último seq recebido, enviados ao reconectar para receber só o que foi perdido
+    let estadoEventos = { clientId: null, canal: null, seq: 0 };
+    let tentativasReconexao = 0;
+    let textoTranscricao = ''; // Texto completo montado a partir dos deltas recebidos
+    const MAX_TENTATIVAS_RECONEXAO = 5;
 
     // Variável para armazenar o nome do arquivo de áudio atual
     let currentAudioFile = null;
@@ -202,7 +207,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             // Se a transcrição estiver em andamento, conecta ao WebSocket
-            if (data.status === 'em_andamento' && data.client_id) {
+            if ((data.status === 'em_andamento' || data.status === 'processando') && data.client_id) {
                 clientId = data.client_id;
                 conectarWebSocket();
             }
@@ -296,6 +301,41 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Atualiza a tela e os dados locais com o progresso da transcrição (texto em textoTranscricao)
+    function atualizarProgressoTranscricao(data) {
+        toggleProgress(true, data.progresso);
+        transcricaoTexto.textContent = textoTranscricao;
+        transcricaoTitulo.textContent = data.titulo || 'Transcrição em Andamento';
+        statusText.textContent = data.etapa || `Progresso: ${data.progresso}%`;
+        if (data.fim_previsto) {
+            const fim = new Date(data.fim_previsto);
+            statusText.textContent += ` - término previsto às ${fim.toLocaleTimeString([], {hour: '2-digit', minute: '2-digit'})}`;
+        }
+        transcricaoId = data.transcricao_id;
+        
+        // Atualiza dados locais com validação melhorada
+        if (!transcricoesAtivas[data.transcricao_id]) {
+             transcricoesAtivas[data.transcricao_id] = { 
+                 iniciado_em: new Date().toISOString(),
+                 client_id: clientId
+             };
+        }
+        
+        // Atualiza status baseado no progresso
+        if (data.progresso >= 100) {
+            transcricoesAtivas[data.transcricao_id].status = 'concluida';
+        } else {
+            transcricoesAtivas[data.transcricao_id].status = 'em_andamento';
+        }
+        
+        transcricoesAtivas[data.transcricao_id].titulo = data.titulo;
+        transcricoesAtivas[data.transcricao_id].texto = textoTranscricao;
+        transcricoesAtivas[data.transcricao_id].progresso = data.progresso;
+        transcricoesAtivas[data.transcricao_id].etapa = data.etapa;
+        
+        salvarTranscricoesLocais();
+    }
+
     // Função para conectar ao WebSocket
     function conectarWebSocket() {
         if (ws && ws.readyState === WebSocket.OPEN) {
@@ -309,14 +349,23 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
+        if (estadoEventos.clientId !== clientId) {
+            estadoEventos = { clientId: clientId, canal: null, seq: 0 };
+            textoTranscricao = '';
+        }
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/${clientId}`;
+        // Protocolo 2: o progresso chega em deltas (só o texto novo)
+        let wsUrl = `${protocol}//${window.location.host}/ws/${clientId}?protocolo=2`;
+        if (estadoEventos.canal) {
+            wsUrl += `&canal=${encodeURIComponent(estadoEventos.canal)}&desde=${estadoEventos.seq}`;
+        }
         ws = new WebSocket(wsUrl);
         console.log(`Tentando conectar a: ${wsUrl}`);
         adicionarStatusHistorico("Conectando para receber atualizações...", "info");
 
         ws.onopen = function() {
             console.log("WebSocket conectado!");
+            tentativasReconexao = 0;
             transcricaoEmAndamento = true;
             adicionarStatusHistorico("Conectado! Aguardando progresso da transcrição.", "success");
             btnCancelar.classList.remove('d-none');
@@ -326,9 +375,28 @@ document.addEventListener('DOMContentLoaded', function() {
             try {
                 const data = JSON.parse(event.data);
                 console.log("Mensagem recebida:", data);
+                if (data.tipo === 'inscrito') {
+                    // Canal novo ou sem continuidade: o servidor envia um retrato do estado atual
+                    if (data.retrato || data.canal !== estadoEventos.canal) {
+                        estadoEventos.seq = 0;
+                    }
+                    estadoEventos.canal = data.canal;
+                    return;
+                }
+                if (typeof data.seq === 'number') {
+                    if (data.seq < estadoEventos.seq) {
+                        return; // Evento já recebido antes da reconexão
+                    }
+                    estadoEventos.seq = data.seq;
+                }
                 adicionarStatusHistorico(`Mensagem: ${data.tipo} - ${data.mensagem || data.etapa || ''}`, 'debug');
 
                 switch (data.tipo) {
+                    case 'na_fila':
+                        toggleProgress(true, 5);
+                        statusText.textContent = data.mensagem;
+                        adicionarStatusHistorico(`Fila: ${data.mensagem}`, 'info');
+                        break;
                     case 'status':
                         statusText.textContent = data.mensagem;
                         adicionarStatusHistorico(`Status: ${data.mensagem}`, 'info');
@@ -339,34 +407,19 @@ document.addEventListener('DOMContentLoaded', function() {
                         statusText.textContent = data.mensagem;
                         adicionarStatusHistorico(`Progresso: ${data.mensagem}`, 'info');
                         break;
-                    case 'transcricao_parcial':
-                        toggleProgress(true, data.progresso);
-                        transcricaoTexto.textContent = data.texto;
-                        transcricaoTitulo.textContent = data.titulo || 'Transcrição em Andamento';
-                        statusText.textContent = data.etapa || `Progresso: ${data.progresso}%`;
-                        transcricaoId = data.transcricao_id;
-                        
-                        // Atualiza dados locais com validação melhorada
-                        if (!transcricoesAtivas[data.transcricao_id]) {
-                             transcricoesAtivas[data.transcricao_id] = { 
-                                 iniciado_em: new Date().toISOString(),
-                                 client_id: clientId
-                             };
-                        }
-                        
-                        // Atualiza status baseado no progresso
-                        if (data.progresso >= 100) {
-                            transcricoesAtivas[data.transcricao_id].status = 'concluida';
-                        } else {
-                            transcricoesAtivas[data.transcricao_id].status = 'em_andamento';
+                    case 'transcricao_delta':
+                        if (data.inicio_texto > textoTranscricao.length) {
+                            // Lacuna nos deltas (evento perdido): pede o texto completo ao servidor
+                            ws.send(JSON.stringify({ acao: 'retrato' }));
+                            break;
                         }
-                        
-                        transcricoesAtivas[data.transcricao_id].titulo = data.titulo;
-                        transcricoesAtivas[data.transcricao_id].texto = data.texto;
-                        transcricoesAtivas[data.transcricao_id].progresso = data.progresso;
-                        transcricoesAtivas[data.transcricao_id].etapa = data.etapa;
-                        
-                        salvarTranscricoesLocais();
+                        textoTranscricao = textoTranscricao.slice(0, data.inicio_texto) + data.texto_novo;
+                        atualizarProgressoTranscricao(data);
+                        break;
+
+                    case 'transcricao_parcial':
+                        textoTranscricao = data.texto;
+                        atualizarProgressoTranscricao(data);
                         break;
                         
                     case 'transcricao_concluida':
@@ -443,19 +496,8 @@ document.addEventListener('DOMContentLoaded', function() {
         ws.onerror = function(error) {
             console.error("Erro no WebSocket:", error);
             transcricaoEmAndamento = false;
+            // O onclose em seguida decide entre reconectar e oferecer a retomada
             adicionarStatusHistorico("Erro na conexão WebSocket.", "error");
-            
-            // Marca como falha apenas se estava realmente em andamento
-            if (transcricaoId && transcricoesAtivas[transcricaoId] && 
-                transcricoesAtivas[transcricaoId].status === 'em_andamento') {
-                 transcricoesAtivas[transcricaoId].status = 'falha';
-                 transcricoesAtivas[transcricaoId].erro = "Erro de conexão WebSocket";
-                 transcricoesAtivas[transcricaoId].erro_em = new Date().toISOString();
-                 salvarTranscricoesLocais();
-                 
-                 // Mostra botão de retomar
-                 btnRetomar.classList.remove('d-none');
-            }
         };
 
         ws.onclose = function(event) {
@@ -467,7 +509,12 @@ document.addEventListener('DOMContentLoaded', function() {
             const isTranscriptionActive = transcricaoId && transcricoesAtivas[transcricaoId] && 
                                          transcricoesAtivas[transcricaoId].status === 'em_andamento';
             
-            if (isUnexpectedClose && isTranscriptionActive) {
+            if (isUnexpectedClose && isTranscriptionActive && tentativasReconexao < MAX_TENTATIVAS_RECONEXAO) {
+                // O job continua no servidor: reconecta e recebe só os eventos perdidos
+                const espera = 1000 * Math.pow(2, tentativasReconexao++);
+                adicionarStatusHistorico(`Conexão perdida, reconectando em ${espera / 1000}s...`, "warning");
+                setTimeout(conectarWebSocket, espera);
+            } else if (isUnexpectedClose && isTranscriptionActive) {
                 adicionarStatusHistorico("Conexão WebSocket fechada inesperadamente.", "warning");
                 
                 // Marca como falha por desconexão
@@ -501,7 +548,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Erro ao carregar modelo');
             }
 
-            statusText.textContent = 'Modelo carregado com sucesso!';
+            const data = await response.json();
+            // O servidor carrega o modelo em background; as próximas transcrições já o usam
+            statusText.textContent = data.status === 'carregando'
+                ? `Modelo ${nomeModelo} sendo carregado em segundo plano.`
+                : 'Modelo carregado com sucesso!';
             
             setTimeout(() => {
                 toggleProgress(false);
@@ -524,12 +575,16 @@ document.addEventListener('DOMContentLoaded', function() {
             
             const formData = new FormData();
             formData.append('url', url);
+            formData.append('modelo', modeloSelect.value);
             
             const response = await fetch('/iniciar-transcricao-youtube', {
                 method: 'POST',
                 body: formData
             });
 
+            if (response.status === 429) {
+                throw new Error(`Servidor ocupado, tente novamente em ${response.headers.get('Retry-After')}s`);
+            }
             if (!response.ok) {
                 throw new Error('Erro ao iniciar transcrição');
             }
@@ -561,6 +616,86 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Upload retomável: arquivos acima do limite são enviados em partes paralelas
+    const LIMITE_UPLOAD_RETOMAVEL = 64 * 1024 * 1024;
+    const TAMANHO_PARTE = 8 * 1024 * 1024;
+    const ENVIOS_PARALELOS = 3;
+
+    async function enviarArquivoEmPartes(file) {
+        // Reaproveita um upload interrompido do mesmo arquivo, se o servidor ainda o tiver
+        const chave = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let uploadId = localStorage.getItem(chave);
+        let status = null;
+        if (uploadId) {
+            const resposta = await fetch(`/uploads/${uploadId}`);
+            if (resposta.ok) {
+                status = await resposta.json();
+                adicionarStatusHistorico('Retomando upload interrompido', 'info');
+            }
+        }
+        if (!status) {
+            const formData = new FormData();
+            formData.append('nome_arquivo', file.name);
+            formData.append('tamanho', file.size);
+            formData.append('modelo', modeloSelect.value);
+            const resposta = await fetch('/uploads', { method: 'POST', body: formData });
+            if (!resposta.ok) {
+                throw new Error('Erro ao criar upload');
+            }
+            status = await resposta.json();
+            uploadId = status.upload_id;
+            localStorage.setItem(chave, uploadId);
+        }
+
+        // Divide o que falta em partes e envia com no máximo ENVIOS_PARALELOS ao mesmo tempo
+        const partes = [];
+        for (const [inicio, fim] of status.faltando) {
+            for (let offset = inicio; offset < fim; offset += TAMANHO_PARTE) {
+                partes.push([offset, Math.min(offset + TAMANHO_PARTE, fim)]);
+            }
+        }
+        let enviados = file.size - partes.reduce((total, [inicio, fim]) => total + fim - inicio, 0);
+
+        async function enviarParte(inicio, fim) {
+            for (let tentativa = 1; ; tentativa++) {
+                try {
+                    const resposta = await fetch(`/uploads/${uploadId}`, {
+                        method: 'PATCH',
+                        headers: { 'Upload-Offset': String(inicio) },
+                        body: file.slice(inicio, fim)
+                    });
+                    if (resposta.ok) return;
+                    if (resposta.status < 500) throw new Error(`Parte rejeitada (${resposta.status})`);
+                } catch (error) {
+                    if (tentativa >= 5) throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** tentativa));
+            }
+        }
+
+        async function trabalhador() {
+            while (partes.length) {
+                const [inicio, fim] = partes.shift();
+                await enviarParte(inicio, fim);
+                enviados += fim - inicio;
+                const progresso = Math.round(enviados / file.size * 100);
+                statusText.textContent = `Enviando arquivo... ${progresso}%`;
+            }
+        }
+        await Promise.all(Array.from({ length: ENVIOS_PARALELOS }, trabalhador));
+
+        const resposta = await fetch(`/uploads/${uploadId}/finalizar`, { method: 'POST' });
+        if (resposta.status === 429) {
+            // O upload fica guardado no servidor: basta enviar o arquivo de novo mais tarde
+            throw new Error(`Servidor ocupado, tente novamente em ${resposta.headers.get('Retry-After')}s`);
+        }
+        if (!resposta.ok) {
+            throw new Error('Erro ao finalizar upload');
+        }
+        localStorage.removeItem(chave);
+        return await resposta.json();
+    }
+
     // Função para iniciar transcrição de arquivo local
     async function iniciarTranscricaoArquivo(file) {
         adicionarStatusHistorico(`Iniciando transcrição do arquivo: ${file.name}`, 'info');
@@ -570,19 +705,29 @@ document.addEventListener('DOMContentLoaded', function() {
             statusText.textContent = 'Enviando arquivo...';
             adicionarStatusHistorico(`Iniciando upload de ${file.name} (${(file.size/1024/1024).toFixed(2)} MB)`, 'info');
             
-            const formData = new FormData();
-            formData.append('file', file);
-            
-            const response = await fetch('/iniciar-transcricao-arquivo', {
-                method: 'POST',
-                body: formData
-            });
+            let data;
+            if (file.size > LIMITE_UPLOAD_RETOMAVEL) {
+                // Arquivos grandes vão em partes: uma queda de conexão não recomeça o envio
+                data = await enviarArquivoEmPartes(file);
+            } else {
+                const formData = new FormData();
+                formData.append('modelo', modeloSelect.value);
+                formData.append('file', file);
+                
+                const response = await fetch('/iniciar-transcricao-arquivo', {
+                    method: 'POST',
+                    body: formData
+                });
 
-            if (!response.ok) {
-                throw new Error('Erro ao iniciar transcrição');
-            }
+                if (response.status === 429) {
+                    throw new Error(`Servidor ocupado, tente novamente em ${response.headers.get('Retry-After')}s`);
+                }
+                if (!response.ok) {
+                    throw new Error('Erro ao iniciar transcrição');
+                }
 
-            const data = await response.json();
+                data = await response.json();
+            }
             clientId = data.client_id;
             transcricaoId = data.transcricao_id;
             
@@ -1071,7 +1216,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 const data = await response.json();
                 aiResponseArea.textContent = data.insights || 'Nenhuma resposta recebida.';
-                adicionarStatusHistorico(`Resposta da IA recebida.`, 'success');
+                const doCache = data.metadados && data.metadados.cache === 'hit';
+                adicionarStatusHistorico(doCache ? `Resposta da IA recebida (cache).` : `Resposta da IA recebida.`, 'success');
+                const trechos = (data.metadados && data.metadados.trechos) || [];
+                if (trechos.length) {
+                    const tempos = trechos.map(t => t.inicio_formatado).filter(Boolean).join(', ');
+                    adicionarStatusHistorico(`Resposta baseada em ${trechos.length} trecho(s) da transcrição${tempos ? ` (${tempos})` : ''}.`, 'info');
+                }
             } else {
                  console.log("Resposta da IA ignorada (requisição antiga).");
                  adicionarStatusHistorico(`Resposta da IA ignorada (requisição antiga ID ${thisRequestId}).`, 'warning');
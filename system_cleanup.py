@@ -5,12 +5,13 @@ Ajuda a resolver problemas comuns e limpar arquivos temporários
 """
 
 import os
-import json
 import glob
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from checkpoint_journal import DiarioCheckpoints
+
 def limpar_arquivos_antigos(dias=7):
     """Remove arquivos de áudio e vídeo mais antigos que X dias"""
     print(f"\n=== Limpando arquivos com mais de {dias} dias ===")
@@ -38,27 +39,30 @@ def verificar_transcricoes_orfas():
     """Verifica transcrições salvas sem referência ativa"""
     print("\n=== Verificando transcrições órfãs ===")
     
-    arquivos_json = glob.glob("transcricoes/*.json")
+    diario = DiarioCheckpoints()
     orfas_encontradas = 0
     
-    for arquivo in arquivos_json:
+    for transcricao_id in diario.ids():
         try:
-            with open(arquivo, 'r', encoding='utf-8') as f:
-                dados = json.load(f)
+            # Retrato + diário até o último registro válido (um registro truncado não impede a leitura)
+            dados = diario.carregar(transcricao_id)
+            if dados is None:
+                print(f"  ❌ Checkpoint ilegível: {transcricao_id}")
+                continue
             
             # Verifica se tem timestamp muito antigo (mais de 24h)
             if 'timestamp' in dados:
                 timestamp = datetime.fromisoformat(dados['timestamp'].replace('Z', '+00:00'))
                 if datetime.now() - timestamp.replace(tzinfo=None) > timedelta(hours=24):
                     if not dados.get('concluido', False):
-                        print(f"  ⚠️  Transcrição órfã: {arquivo}")
+                        print(f"  ⚠️  Transcrição órfã: {transcricao_id}")
                         print(f"      Timestamp: {dados['timestamp']}")
                         print(f"      Concluída: {dados.get('concluido', False)}")
                         print(f"      Texto: {len(dados.get('texto', ''))} caracteres")
                         orfas_encontradas += 1
                         
         except Exception as e:
-            print(f"  ❌ Erro ao verificar {arquivo}: {e}")
+            print(f"  ❌ Erro ao verificar {transcricao_id}: {e}")
     
     if orfas_encontradas == 0:
         print("  ✅ Nenhuma transcrição órfã encontrada")
@@ -103,14 +107,13 @@ def relatorio_sistema():
             print(f"📁 {diretorio}: {len(arquivos)} arquivos, {tamanho_total/1024/1024:.1f}MB")
     
     # Transcrições ativas
-    arquivos_json = glob.glob("transcricoes/*.json")
+    diario = DiarioCheckpoints()
     concluidas = 0
     pendentes = 0
     
-    for arquivo in arquivos_json:
+    for transcricao_id in diario.ids():
         try:
-            with open(arquivo, 'r', encoding='utf-8') as f:
-                dados = json.load(f)
+            dados = diario.carregar(transcricao_id) or {}
             if dados.get('concluido', False):
                 concluidas += 1
             else:
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Os módulos do projeto ficam na raiz do repositório, fora de um pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Bancos criados ao importar o app ficam fora do repositório
+_DIRETORIO_TESTES = tempfile.mkdtemp(prefix="testes-")
+os.environ.setdefault("CAMINHO_BANCO_JOBS", os.path.join(_DIRETORIO_TESTES, "jobs.db"))
+os.environ.setdefault("CAMINHO_INDICE_BUSCA", os.path.join(_DIRETORIO_TESTES, "busca.db"))
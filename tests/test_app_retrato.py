@@ -0,0 +1,37 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import app as servidor
+
+# Tipos tratados por static/script.js ao receber mensagens do WebSocket
+TIPOS_DO_CLIENTE = {"na_fila", "status", "baixando", "preparando", "transcricao_delta", "transcricao_parcial",
+                    "transcricao_concluida", "erro", "cancelada"}
+
+
+def criar_job(**campos):
+    transcricao_id = str(uuid.uuid4())
+    servidor.armazem_jobs.criar(transcricao_id, tipo="arquivo", titulo="Aula", **campos)
+    return transcricao_id
+
+
+def test_retrato_de_job_concluido_envia_texto_e_conclusao():
+    transcricao_id = criar_job(status="concluida", texto="olá mundo")
+    mensagens = servidor.retrato_do_job(transcricao_id)
+    assert [m["tipo"] for m in mensagens] == ["transcricao_parcial", "transcricao_concluida"]
+    assert mensagens[0]["texto"] == "olá mundo" and mensagens[0]["progresso"] == 100
+    assert mensagens[1]["titulo"] == "Aula"
+
+
+def test_retrato_de_job_com_falha_envia_erro():
+    transcricao_id = criar_job(status="falha", erro="áudio inválido")
+    assert servidor.retrato_do_job(transcricao_id) == [
+        {"tipo": "erro", "mensagem": "áudio inválido", "transcricao_id": transcricao_id}]
+
+
+@pytest.mark.parametrize("status", ["concluida", "falha", "cancelada"])
+def test_retrato_de_job_encerrado_usa_tipos_conhecidos_pelo_cliente(status):
+    transcricao_id = criar_job(status=status, texto="texto")
+    assert {m["tipo"] for m in servidor.retrato_do_job(transcricao_id)} <= TIPOS_DO_CLIENTE
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import httpx
+
+import app as servidor
+from resumable_upload import UploadsRetomaveis
+
+
+@pytest.fixture
+def servidor_teste(tmp_path, monkeypatch):
+    # Sem o evento de startup: o pool de inferência e os workers da fila não são iniciados
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "videos").mkdir()
+    monkeypatch.setattr(servidor, "uploads_retomaveis", UploadsRetomaveis(str(tmp_path / "parciais")))
+    return servidor
+
+
+def cliente_http():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=servidor.app), base_url="http://teste")
+
+
+def test_finalizar_upload_com_fila_cheia_responde_503_e_remove_o_arquivo(servidor_teste, tmp_path, monkeypatch):
+    async def cenario():
+        conteudo = b"\x00" * 1024
+        async with cliente_http() as cliente:
+            criado = await cliente.post("/uploads", data={"nome_arquivo": "aula.mp4", "tamanho": len(conteudo)})
+            assert criado.status_code == 201
+            upload_id = criado.json()["upload_id"]
+            enviado = await cliente.patch(f"/uploads/{upload_id}", content=conteudo,
+                                          headers={"Upload-Offset": "0"})
+            assert enviado.status_code == 200
+
+            # A fila enche entre a admissão (antes de montar o arquivo) e o enfileiramento
+            monkeypatch.setattr(servidor_teste, "exigir_vaga_na_fila", lambda: None)
+            monkeypatch.setattr(servidor_teste.fila_jobs, "capacidade", 0)
+            return await cliente.post(f"/uploads/{upload_id}/finalizar")
+
+    resposta = asyncio.run(cenario())
+
+    assert resposta.status_code == 503
+    assert int(resposta.headers["retry-after"]) >= 1
+    assert list((tmp_path / "videos").iterdir()) == []
+    erros = [servidor_teste.armazem_jobs.obter(i).get("erro", "") for i in servidor_teste.armazem_jobs.ids("falha")]
+    assert any(erro.startswith("Fila de transcrições cheia") for erro in erros)
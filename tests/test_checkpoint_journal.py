@@ -0,0 +1,65 @@
+from checkpoint_journal import DiarioCheckpoints
+
+
+def segmentos(n):
+    return [{"inicio": i, "fim": i + 1, "texto": f" parte {i}."} for i in range(n)]
+
+
+def test_fechar_mantem_checkpoint_para_retomada(tmp_path):
+    diario = DiarioCheckpoints(str(tmp_path), intervalo_fsync=3600)
+    diario.salvar("job", "", False, segmentos(2), 2.0, modelo="small")
+    diario.salvar("job", "", False, segmentos(3), 3.0, modelo="small")
+    diario.fechar("job")
+
+    assert "job" not in diario._abertos
+    estado = DiarioCheckpoints(str(tmp_path)).carregar("job")
+    assert len(estado["segmentos"]) == 3
+    assert estado["posicao"] == 3.0
+    assert estado["modelo"] == "small"
+    assert not estado["concluido"]
+
+    # Retomada: o diário é reaberto e continua de onde parou
+    diario.salvar("job", "", False, segmentos(4), 4.0, modelo="small")
+    assert len(diario.carregar("job")["segmentos"]) == 4
+    diario.fechar_todos()
+
+
+def test_linha_truncada_e_ignorada(tmp_path):
+    diario = DiarioCheckpoints(str(tmp_path))
+    diario.salvar("job", "", False, segmentos(2), 2.0)
+    diario.fechar("job")
+    with open(tmp_path / "job.jsonl", "ab") as f:
+        f.write(b'{"base": 2, "segm')
+
+    assert len(diario.carregar("job")["segmentos"]) == 2
+    diario.salvar("job", "", False, segmentos(3), 3.0)
+    assert len(diario.carregar("job")["segmentos"]) == 3
+    diario.fechar_todos()
+
+
+def test_salvar_em_threads_enquanto_o_diario_e_fechado(tmp_path):
+    import threading
+
+    diario = DiarioCheckpoints(str(tmp_path), intervalo_fsync=0, compactar_a_cada=20)
+    erros = []
+
+    def gravar(job):
+        try:
+            for n in range(1, 61):
+                diario.salvar(job, "", False, segmentos(n), float(n), modelo="small")
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=gravar, args=(f"job{k}",)) for k in range(4)]
+    for t in threads:
+        t.start()
+    # Fechar (ex.: fim do servidor ou cancelamento) no meio das escritas não pode quebrar um salvar em andamento
+    while any(t.is_alive() for t in threads):
+        diario.fechar_todos()
+    for t in threads:
+        t.join()
+    diario.fechar_todos()
+
+    assert erros == []
+    for k in range(4):
+        assert len(DiarioCheckpoints(str(tmp_path)).carregar(f"job{k}")["segmentos"]) == 60
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from event_bus import TIPO_DELTA, BarramentoEventos
+
+
+@pytest.mark.parametrize("tipo_final", ["transcricao_concluida", "erro", "cancelada"])
+def test_canal_encerrado_e_removido_apos_retencao(tipo_final):
+    async def cenario():
+        barramento = BarramentoEventos(tamanho_buffer=8, retencao_segundos=0.05)
+        barramento.publicar("job", {"tipo": TIPO_DELTA, "inicio_texto": 0, "texto_novo": "olá", "progresso": 50})
+        barramento.publicar("job", {"tipo": tipo_final})
+        assert barramento.estatisticas()["canais"] == 1
+        await asyncio.sleep(0.1)
+        assert barramento.estatisticas()["canais"] == 0
+        assert barramento.retrato("job") is None
+
+    asyncio.run(cenario())
+
+
+def test_canal_com_assinante_e_mantido_ate_o_assinante_sair():
+    async def cenario():
+        barramento = BarramentoEventos(tamanho_buffer=8, retencao_segundos=0.05)
+        barramento.publicar("job", {"tipo": "progresso", "progresso": 10})
+        assinatura, _ = barramento.assinar("job", protocolo=2)
+        barramento.publicar("job", {"tipo": "transcricao_concluida"})
+        await asyncio.sleep(0.08)
+        assert barramento.estatisticas()["canais"] == 1
+        barramento.cancelar("job", assinatura)
+        await asyncio.sleep(0.08)
+        assert barramento.estatisticas()["canais"] == 0
+
+    asyncio.run(cenario())
+
+
+def test_replay_dos_eventos_perdidos():
+    async def cenario():
+        barramento = BarramentoEventos(tamanho_buffer=8, retencao_segundos=60)
+        for progresso in range(3):
+            barramento.publicar("job", {"tipo": "progresso", "progresso": progresso})
+        canal = barramento._canais["job"].id
+        _, perdidos = barramento.assinar("job", canal, desde=1, protocolo=2)
+        assert [seq for seq, _ in perdidos] == [2, 3]
+
+    asyncio.run(cenario())
@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import inference_pool
+from inference_pool import AgendadorLotes, PoolInferencia, _alinhar_prompts
+
+
+def dobrar(x):
+    return 2 * x
+
+
+def derrubar_processo(x):
+    os._exit(1)
+
+
+def falhar_no_primeiro(marcador):
+    # Só o primeiro processo a criar o marcador falha
+    try:
+        os.close(os.open(marcador, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return os.getpid()
+    raise ZeroDivisionError("falha em um dos processos")
+
+
+class PoolSemModelo(PoolInferencia):
+    """Pool sem o inicializador do Whisper (torch não é necessário nos testes)"""
+
+    def iniciar(self):
+        if self._executor is None:
+            contexto = multiprocessing.get_context("spawn")
+            self._barreira = contexto.Barrier(self.workers)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto,
+                                                 initializer=inference_pool._registrar_barreira,
+                                                 initargs=(self._barreira,))
+
+
+def test_pool_e_recriado_depois_que_um_processo_morre():
+    async def cenario():
+        pool = PoolSemModelo(workers=1)
+        try:
+            assert await pool._executar(dobrar, 2) == 4
+            # A tarefa que derruba o processo também derruba a repetição: só ela falha
+            with pytest.raises(BrokenProcessPool):
+                await pool._executar(derrubar_processo, 1)
+            assert pool.reinicios == 2
+            # As tarefas seguintes rodam no pool recriado
+            assert await pool._executar(dobrar, 21) == 42
+        finally:
+            pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_executar_em_todos_roda_uma_vez_em_cada_processo():
+    async def cenario():
+        pool = PoolSemModelo(workers=3)
+        try:
+            pids = await pool._executar_em_todos(os.getpid)
+            assert len(set(pids)) == 3
+            # A barreira é reaproveitada na execução seguinte
+            assert set(await pool._executar_em_todos(os.getpid)) == set(pids)
+        finally:
+            pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_executar_em_todos_falha_se_um_processo_falha(tmp_path):
+    async def cenario():
+        pool = PoolSemModelo(workers=2)
+        try:
+            with pytest.raises(ZeroDivisionError):
+                await pool._executar_em_todos(falhar_no_primeiro, str(tmp_path / "marcador"))
+            # Depois da falha a barreira volta a funcionar
+            assert len(set(await pool._executar_em_todos(os.getpid))) == 2
+        finally:
+            pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+def _registrar_decodificacoes(monkeypatch):
+    """Substitui o decode do Whisper, registrando os lotes e os decodes individuais"""
+    chamadas = {"lotes": [], "individuais": []}
+
+    def janela_individual(janela, idioma, modelo, prompt):
+        chamadas["individuais"].append(prompt)
+        return [{"texto": f"individual:{prompt}"}]
+
+    def lote(janelas, prompts, idioma, modelo):
+        chamadas["lotes"].append(list(prompts))
+        return [[{"texto": f"lote:{prompt}"}] for prompt in prompts]
+
+    monkeypatch.setattr(inference_pool, "_transcrever_janela", janela_individual)
+    monkeypatch.setattr(inference_pool, "_decodificar_lote", lote)
+    return chamadas
+
+
+def test_lote_mantem_o_prompt_de_cada_janela(monkeypatch):
+    import numpy as np
+
+    chamadas = _registrar_decodificacoes(monkeypatch)
+    janelas = [np.zeros(16000, dtype=np.float32)] * 4
+    prompts = [None, "texto anterior do job A", None, "texto anterior do job B"]
+
+    saida = inference_pool._transcrever_lote(janelas, prompts, "pt", "small")
+    # Cada janela recebe o resultado decodificado com o seu próprio prompt
+    assert [s[0]["texto"] for s in saida] == [f"lote:{p}" for p in prompts]
+    assert chamadas["lotes"] == [[None, None], ["texto anterior do job A", "texto anterior do job B"]]
+    assert chamadas["individuais"] == []
+
+
+def test_agendador_junta_janelas_com_contexto_de_jobs_diferentes(monkeypatch):
+    import numpy as np
+
+    chamadas = _registrar_decodificacoes(monkeypatch)
+    despachos = []
+
+    async def executar(funcao, janelas, prompts, idioma, modelo):
+        despachos.append(len(janelas))
+        return funcao(janelas, prompts, idioma, modelo)
+
+    async def cenario():
+        # Configuração padrão de lote; cada job já está no meio do áudio (janela com o texto anterior)
+        agendador = AgendadorLotes(executar, tamanho_maximo=8, espera_maxima_ms=50, paralelismo=1)
+        janela = np.zeros(16000, dtype=np.float32)
+        return await asyncio.gather(*(
+            agendador.transcrever_janela(janela, "pt", "small", f"texto anterior do job {k}") for k in range(8)
+        ))
+
+    resultados = asyncio.run(cenario())
+    assert [r[0]["texto"] for r in resultados] == [f"lote:texto anterior do job {k}" for k in range(8)]
+    # As 8 janelas vão em um único despacho e em um único decode em lote
+    assert despachos == [8]
+    assert [len(prompts) for prompts in chamadas["lotes"]] == [8]
+    assert chamadas["individuais"] == []
+
+
+def test_prompts_do_lote_ficam_com_o_mesmo_tamanho():
+    assert _alinhar_prompts([[1, 2, 3, 4], [5, 6], [7, 8, 9]], limite=223) == [[3, 4], [5, 6], [8, 9]]
+    assert _alinhar_prompts([[1, 2, 3, 4], [5, 6, 7]], limite=2) == [[3, 4], [6, 7]]
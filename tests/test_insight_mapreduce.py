@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from insight_cache import CacheInsights
+from insight_mapreduce import InsightsLongos, dividir_em_partes
+from llm_client import CircuitoAberto, ClienteLLM, Disjuntor
+
+TEXTO = " ".join(f"Frase número {i} fala do assunto {i % 7}." for i in range(2000))
+
+
+def test_dividir_em_partes_preserva_o_texto():
+    partes = dividir_em_partes(TEXTO, 500)
+    assert len(partes) > 1
+    assert " ".join(partes) == TEXTO
+    assert all(len(parte) <= 500 * 4 for parte in partes)
+
+
+def test_parte_recusada_no_circuito_meio_aberto_nao_trava_o_cliente(tmp_path):
+    async def handler(request):
+        conteudo = json.loads(request.content)["messages"][0]["content"]
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"choices": [{"message": {"content": conteudo[:20]}}]})
+
+    async def cenario():
+        disjuntor = Disjuntor(falhas_para_abrir=1, tempo_aberto=0.05)
+        cliente = ClienteLLM("http://llm.local/v1", api_key="chave", tentativas=1,
+                             disjuntor=disjuntor, transport=httpx.MockTransport(handler))
+        longos = InsightsLongos(cliente, CacheInsights(str(tmp_path)), tokens_por_parte=500,
+                                limite_tokens=1000, concorrencia=4)
+        disjuntor.falha()
+        await asyncio.sleep(0.06)
+
+        # Só a primeira parte passa como chamada de teste; as outras são recusadas
+        with pytest.raises(CircuitoAberto):
+            await longos.responder(TEXTO, "do que se fala?")
+        # A chamada de teste terminou (não foi cancelada) e fechou o circuito
+        assert disjuntor.estado == "fechado"
+        resposta, metadados = await longos.responder(TEXTO, "do que se fala?")
+        assert metadados["partes_em_cache"] >= 1
+        await cliente.fechar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from job_queue import FilaCheia, FilaJobs
+
+
+def test_executar_na_fila_respeita_workers_e_capacidade():
+    async def cenario():
+        executados = []
+        posicoes = []
+
+        async def executar(transcricao_id):
+            executados.append(transcricao_id)
+
+        async def ao_mudar_posicao(transcricao_id, posicao, previsao):
+            posicoes.append(transcricao_id)
+
+        fila = FilaJobs(executar, workers=1, capacidade=1, ao_mudar_posicao=ao_mudar_posicao)
+        fila.iniciar()
+        liberar = asyncio.Event()
+
+        async def lenta():
+            await liberar.wait()
+            return "primeira"
+
+        primeira = asyncio.create_task(fila.executar_na_fila(lenta))
+        await asyncio.sleep(0.01)
+        segunda = asyncio.create_task(fila.executar_na_fila(lambda: asyncio.sleep(0, "segunda")))
+        await asyncio.sleep(0.01)
+        # Um job em execução e um aguardando: a fila está cheia para qualquer rota
+        with pytest.raises(FilaCheia):
+            await fila.executar_na_fila(lambda: asyncio.sleep(0, "terceira"))
+        with pytest.raises(FilaCheia):
+            await fila.enfileirar("job")
+
+        liberar.set()
+        assert await primeira == "primeira"
+        assert await segunda == "segunda"
+        # Jobs das rotas antigas não passam pela corrotina padrão nem recebem avisos de posição
+        assert executados == [] and posicoes == []
+        await fila.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_executar_na_fila_propaga_erro_e_segue_atendendo():
+    async def cenario():
+        async def executar(transcricao_id):
+            pass
+
+        fila = FilaJobs(executar, workers=1, capacidade=2)
+        fila.iniciar()
+
+        async def falha():
+            raise RuntimeError("áudio inválido")
+
+        with pytest.raises(RuntimeError, match="áudio inválido"):
+            await fila.executar_na_fila(falha)
+        assert await fila.executar_na_fila(lambda: asyncio.sleep(0, "ok")) == "ok"
+        await fila.encerrar()
+
+    asyncio.run(cenario())
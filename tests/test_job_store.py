@@ -0,0 +1,24 @@
+from job_store import ArmazemJobs
+
+
+def test_criar_de_novo_mantem_o_texto(tmp_path):
+    armazem = ArmazemJobs(str(tmp_path / "jobs.db"))
+    armazem.criar("job", tipo="arquivo", status="concluida", titulo="Aula", caminho="a.mp4", texto="olá mundo")
+
+    armazem.criar("job", tipo="arquivo", status="em_andamento", modelo="small")
+
+    job = armazem.obter("job", com_texto=True)
+    assert job["texto"] == "olá mundo"
+    assert job["status"] == "em_andamento"
+    assert job["modelo"] == "small"
+    # Os demais campos são substituídos, como antes
+    assert "titulo" not in job and "caminho" not in job
+    armazem.fechar()
+
+
+def test_criar_job_novo():
+    armazem = ArmazemJobs(":memory:")
+    armazem.criar("job", status="em_andamento", url="https://youtu.be/x")
+    assert armazem.obter("job")["url"] == "https://youtu.be/x"
+    assert armazem.obter("job", com_texto=True).get("texto") is None
+    armazem.fechar()
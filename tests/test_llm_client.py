@@ -0,0 +1,156 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from llm_client import CircuitoAberto, ClienteLLM, Disjuntor, ErroLLM
+
+
+def resposta_ok(conteudo="ok"):
+    return httpx.Response(200, json={"choices": [{"message": {"content": conteudo}}]})
+
+
+def test_chamada_de_teste_cancelada_libera_o_circuito():
+    lenta = asyncio.Event()
+
+    async def handler(request):
+        if lenta.is_set():
+            await asyncio.sleep(10)
+        return resposta_ok()
+
+    async def cenario():
+        disjuntor = Disjuntor(falhas_para_abrir=1, tempo_aberto=0.05)
+        cliente = ClienteLLM("http://llm.local/v1", api_key="chave", tentativas=1,
+                             disjuntor=disjuntor, transport=httpx.MockTransport(handler))
+        disjuntor.falha()
+        await asyncio.sleep(0.06)
+        assert disjuntor.estado == "meio_aberto"
+
+        # A chamada de teste é cancelada no meio (ex.: parte irmã de um map-reduce falhou)
+        lenta.set()
+        teste = asyncio.create_task(cliente.completar([{"role": "user", "content": "x"}]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitoAberto):
+            await cliente.completar([{"role": "user", "content": "x"}])
+        teste.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await teste
+
+        # Não conta como sucesso nem como falha, mas a próxima chamada de teste pode passar
+        assert disjuntor.estado == "meio_aberto"
+        assert disjuntor.falhas == 1
+        lenta.clear()
+        assert await cliente.completar([{"role": "user", "content": "x"}]) == "ok"
+        assert disjuntor.estado == "fechado"
+        await cliente.fechar()
+
+    asyncio.run(cenario())
+
+
+def test_chamada_fechada_nao_libera_teste_de_outra():
+    async def handler(request):
+        return resposta_ok()
+
+    async def cenario():
+        disjuntor = Disjuntor(falhas_para_abrir=1, tempo_aberto=0.05)
+        cliente = ClienteLLM("http://llm.local/v1", api_key="chave", tentativas=1,
+                             disjuntor=disjuntor, transport=httpx.MockTransport(handler))
+        disjuntor.falha()
+        await asyncio.sleep(0.06)
+        assert disjuntor.permitir() is True
+        # Enquanto a chamada de teste está em andamento, as outras são recusadas
+        with pytest.raises(CircuitoAberto):
+            await cliente.completar([{"role": "user", "content": "x"}])
+        assert disjuntor._testando
+        await cliente.fechar()
+
+    asyncio.run(cenario())
+
+
+class ServidorLLM:
+    """Stand-in local do endpoint de chat: responde ok, com erro (status) ou depois de um atraso"""
+
+    def __init__(self):
+        self.status = 200
+        self.atraso = 0.0
+        self.requisicoes = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_POST(self):
+                servidor.requisicoes += 1
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(servidor.atraso)
+                corpo = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+                try:
+                    self.send_response(servidor.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(corpo)))
+                    self.end_headers()
+                    self.wfile.write(corpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._http.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._http.server_address[1]}/v1"
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+@pytest.fixture
+def servidor_llm():
+    servidor = ServidorLLM()
+    yield servidor
+    servidor.fechar()
+
+
+def test_disjuntor_contra_servidor_local(servidor_llm):
+    mensagens = [{"role": "user", "content": "x"}]
+
+    async def cenario():
+        disjuntor = Disjuntor(falhas_para_abrir=2, tempo_aberto=0.3)
+        cliente = ClienteLLM(servidor_llm.base_url, api_key="chave", tentativas=1, timeout=0.2,
+                             disjuntor=disjuntor)
+        assert await cliente.completar(mensagens) == "ok"
+
+        # Provedor fora do ar: duas falhas seguidas abrem o circuito
+        servidor_llm.status = 503
+        for _ in range(2):
+            with pytest.raises(ErroLLM):
+                await cliente.completar(mensagens)
+        assert disjuntor.estado == "aberto"
+        requisicoes = servidor_llm.requisicoes
+        with pytest.raises(CircuitoAberto):
+            await cliente.completar(mensagens)
+        assert servidor_llm.requisicoes == requisicoes  # Recusada sem ir ao provedor
+
+        # Meio aberto: a chamada de teste estoura o timeout e o circuito volta a abrir
+        await asyncio.sleep(0.35)
+        assert disjuntor.estado == "meio_aberto"
+        servidor_llm.status, servidor_llm.atraso = 200, 1.0
+        with pytest.raises(ErroLLM, match="Tempo esgotado"):
+            await cliente.completar(mensagens)
+        assert disjuntor.estado == "aberto"
+        with pytest.raises(CircuitoAberto):
+            await cliente.completar(mensagens)
+
+        # Provedor recuperado: a próxima chamada de teste fecha o circuito
+        await asyncio.sleep(0.35)
+        servidor_llm.atraso = 0.0
+        assert await cliente.completar(mensagens) == "ok"
+        assert disjuntor.estado == "fechado"
+        assert await cliente.completar(mensagens) == "ok"
+        await cliente.fechar()
+
+    asyncio.run(cenario())
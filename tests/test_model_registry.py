@@ -0,0 +1,50 @@
+from inference_pool import PoolInferencia
+from model_registry import MB, RegistroModelos
+
+
+class Tensor:
+    def __init__(self, mb):
+        self.mb = mb
+
+    def numel(self):
+        return self.mb * MB
+
+    def element_size(self):
+        return 1
+
+
+class ModeloFalso:
+    def __init__(self, mb):
+        self._parametros = [Tensor(mb)]
+
+    def parameters(self):
+        return self._parametros
+
+    def buffers(self):
+        return []
+
+
+def test_ajustar_orcamento_descarrega_os_modelos_menos_usados():
+    registro = RegistroModelos(orcamento_mb=1000, carregador=lambda nome: ModeloFalso(300))
+    registro.obter("tiny")
+    registro.obter("base")
+    registro.obter("tiny")
+    assert registro.relatorio()["total_mb"] == 600
+
+    registro.ajustar_orcamento(400)
+    # 'base' foi o usado há mais tempo
+    assert registro.carregados() == ["tiny"]
+    assert registro.relatorio()["orcamento_mb"] == 400
+
+
+def test_orcamento_do_pool_e_dividido_entre_os_processos():
+    pool = PoolInferencia(workers=4, orcamento_mb=4096)
+    assert pool.orcamento_por_worker_mb == 1024
+    pool.relatorios = {
+        101: {"orcamento_mb": 1024, "total_mb": 970.0, "modelos": []},
+        102: {"orcamento_mb": 1024, "total_mb": 290.5, "modelos": []},
+    }
+    resumo = pool.resumo_memoria()
+    assert resumo["orcamento_mb"] == 4096
+    assert resumo["total_mb"] == 1260.5
+    assert set(resumo["workers"]) == {"101", "102"}
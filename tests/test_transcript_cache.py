@@ -0,0 +1,22 @@
+import hashlib
+
+import numpy as np
+
+from transcript_cache import CacheTranscricoes, hash_audio
+
+
+def test_hash_audio_igual_ao_dos_bytes_pcm():
+    audio = np.random.default_rng(0).standard_normal(16000 * 5).astype(np.float32)
+    assert hash_audio(audio) == hashlib.sha256(audio.tobytes()).hexdigest()
+    # Fatias não contíguas e outros dtypes são normalizados para float32 contíguo
+    assert hash_audio(audio[::2]) == hashlib.sha256(audio[::2].copy().tobytes()).hexdigest()
+    assert hash_audio(audio.astype(np.float64)) == hash_audio(audio)
+
+
+def test_cache_devolve_transcricao_salva(tmp_path):
+    cache = CacheTranscricoes(str(tmp_path))
+    chave = cache.chave("abc", "small", "pt")
+    assert cache.obter(chave) is None
+    cache.salvar(chave, "olá", [{"inicio": 0, "fim": 1, "texto": "olá"}], modelo="small")
+    assert cache.obter(chave)["texto"] == "olá"
+    assert cache.chave("abc", "small", "en") != chave
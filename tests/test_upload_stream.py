@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import upload_stream
+from upload_stream import receber_upload
+
+
+class RequisicaoFalsa:
+    def __init__(self, corpo: bytes, fronteira: str, bloco: int = 1000):
+        self.headers = {"content-type": f"multipart/form-data; boundary={fronteira}"}
+        self._corpo = corpo
+        self._bloco = bloco
+
+    async def stream(self):
+        for i in range(0, len(self._corpo), self._bloco):
+            yield self._corpo[i:i + self._bloco]
+
+
+def corpo_multipart(fronteira, conteudo, modelo="small"):
+    return (
+        f"--{fronteira}\r\nContent-Disposition: form-data; name=\"modelo\"\r\n\r\n{modelo}\r\n"
+        f"--{fronteira}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"aula.mp4\"\r\n"
+        f"Content-Type: video/mp4\r\n\r\n"
+    ).encode() + conteudo + f"\r\n--{fronteira}--\r\n".encode()
+
+
+def test_upload_gravado_em_thread_com_hash_e_campos(tmp_path, monkeypatch):
+    conteudo = bytes(range(256)) * 40
+    fronteira = "fronteira123"
+    threads_do_hash = set()
+    sha256 = hashlib.sha256
+
+    class HashRegistrandoThread:
+        def __init__(self):
+            self._hash = sha256()
+
+        def update(self, dados):
+            threads_do_hash.add(threading.current_thread() is threading.main_thread())
+            self._hash.update(dados)
+
+        def hexdigest(self):
+            return self._hash.hexdigest()
+
+    monkeypatch.setattr(upload_stream.hashlib, "sha256", HashRegistrandoThread)
+    resultado = asyncio.run(receber_upload(RequisicaoFalsa(corpo_multipart(fronteira, conteudo), fronteira),
+                                           str(tmp_path), "job", decodificar=False))
+
+    assert resultado["nome_arquivo"] == "aula.mp4"
+    assert resultado["tamanho"] == len(conteudo)
+    assert resultado["sha256"] == sha256(conteudo).hexdigest()
+    assert resultado["campos"] == {"modelo": "small"}
+    with open(resultado["caminho"], "rb") as f:
+        assert f.read() == conteudo
+    # Escrita e hash de cada bloco rodam fora da thread do event loop
+    assert threads_do_hash == {False}
@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+import pytest
+
+from youtube_download import OrquestradorDownload, estrategia_direta
+
+VIDEO_ID = "dQw4w9WgXcQ"
+URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+
+class ServidorYoutube:
+    """Stand-in local do get_video_info + stream de áudio, com atraso até o 1º byte e ritmo configuráveis"""
+
+    def __init__(self, atraso_primeiro_byte=0.0, blocos=20, intervalo=0.0):
+        self.atraso_primeiro_byte = atraso_primeiro_byte
+        self.blocos = blocos
+        self.intervalo = intervalo
+        self.requisicoes_audio = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/get_video_info"):
+                    player = {
+                        "videoDetails": {"title": "Vídeo de teste", "lengthSeconds": "12"},
+                        "streamingData": {"adaptiveFormats": [{
+                            "mimeType": "audio/mp4; codecs=\"mp4a.40.2\"",
+                            "bitrate": 128000,
+                            "url": f"{servidor.base_url}/audio",
+                        }]},
+                    }
+                    corpo = urlencode({"player_response": json.dumps(player)}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(corpo)))
+                    self.end_headers()
+                    self.wfile.write(corpo)
+                    return
+                servidor.requisicoes_audio += 1
+                time.sleep(servidor.atraso_primeiro_byte)
+                self.send_response(200)
+                self.send_header("Content-Length", str(servidor.blocos * 100))
+                self.end_headers()
+                try:
+                    for _ in range(servidor.blocos):
+                        self.wfile.write(b"a" * 100)
+                        self.wfile.flush()
+                        time.sleep(servidor.intervalo)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._http.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._http.server_address[1]}"
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+@pytest.fixture
+def servidores():
+    criados = []
+
+    def criar(**kwargs):
+        servidor = ServidorYoutube(**kwargs)
+        criados.append(servidor)
+        return servidor
+
+    yield criar
+    for servidor in criados:
+        servidor.fechar()
+
+
+def test_download_longo_com_progresso_nao_dispara_hedge(servidores, tmp_path):
+    # 20 blocos a cada 0,05s: o download leva ~1s, bem mais que o atraso de hedge
+    lento = servidores(blocos=20, intervalo=0.05)
+    reserva = servidores()
+    orquestrador = OrquestradorDownload(
+        [("principal", partial(estrategia_direta, base_url=lento.base_url)),
+         ("reserva", partial(estrategia_direta, base_url=reserva.base_url))],
+        atraso_hedge=0.3, diretorio=str(tmp_path))
+
+    arquivo, titulo, duracao = orquestrador.baixar(URL)
+
+    assert open(arquivo, "rb").read() == b"a" * 2000
+    assert (titulo, duracao) == ("Vídeo de teste", 12)
+    assert reserva.requisicoes_audio == 0
+
+
+def test_estrategia_sem_primeiro_byte_dispara_hedge(servidores, tmp_path):
+    parado = servidores(atraso_primeiro_byte=3)
+    reserva = servidores()
+    orquestrador = OrquestradorDownload(
+        [("principal", partial(estrategia_direta, base_url=parado.base_url)),
+         ("reserva", partial(estrategia_direta, base_url=reserva.base_url))],
+        atraso_hedge=0.3, diretorio=str(tmp_path))
+
+    inicio = time.monotonic()
+    arquivo, _, _ = orquestrador.baixar(URL)
+
+    assert time.monotonic() - inicio < 2
+    assert reserva.requisicoes_audio == 1
+    assert open(arquivo, "rb").read() == b"a" * 2000
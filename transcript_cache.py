@@ -0,0 +1,110 @@
+"""
+Cache de transcrições endereçado por conteúdo
+
+A chave é formada pelo SHA-256 do áudio normalizado (PCM mono 16 kHz, o mesmo
+que vai para o Whisper), o modelo, o idioma e as opções de decodificação.
+Reenvios de um mesmo arquivo, mesmo com outro nome ou contêiner, devolvem a
+transcrição salva sem nenhuma inferência.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+DIRETORIO_CACHE_TRANSCRICOES = os.getenv("DIRETORIO_CACHE_TRANSCRICOES", "cache/transcricoes")
+CACHE_TRANSCRICOES_MAX_MB = float(os.getenv("CACHE_TRANSCRICOES_MAX_MB", "500"))
+
+
+def hash_audio(audio) -> str:
+    """SHA-256 das amostras PCM (float32) do áudio normalizado, lidas direto do array (sem cópia)"""
+    # ascontiguousarray só copia se o array não for float32 contíguo (o que o decoder já entrega)
+    return hashlib.sha256(memoryview(np.ascontiguousarray(audio, dtype=np.float32)).cast("B")).hexdigest()
+
+
+class CacheTranscricoes:
+    def __init__(self, diretorio: str = DIRETORIO_CACHE_TRANSCRICOES, max_mb: float = CACHE_TRANSCRICOES_MAX_MB):
+        """
+        Inicializa o cache
+
+        Args:
+            diretorio: Onde cada transcrição é guardada como {chave}.json
+            max_mb: Tamanho máximo do cache; as entradas usadas há mais tempo saem primeiro
+        """
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chave(hash_do_audio: str, modelo: str, idioma: str, opcoes: dict = None) -> str:
+        conteudo = json.dumps(
+            {"audio": hash_do_audio, "modelo": modelo, "idioma": idioma, "opcoes": opcoes or {}},
+            sort_keys=True,
+        )
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _caminho(self, chave: str) -> Path:
+        return self.diretorio / f"{chave}.json"
+
+    def obter(self, chave: str):
+        """Retorna a transcrição salva (texto e segmentos) ou None"""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            # O mtime marca o último acesso, usado na remoção LRU
+            os.utime(caminho, None)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return dados
+
+    def salvar(self, chave: str, texto: str, segmentos: list, **metadados):
+        dados = {"texto": texto, "segmentos": segmentos, "salvo_em": time.time()}
+        dados.update(metadados)
+        caminho = self._caminho(chave)
+        temporario = caminho.with_suffix(".tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        self._remover_excedente()
+
+    def _remover_excedente(self):
+        """Remove as entradas usadas há mais tempo até o cache caber no limite"""
+        with self._lock:
+            entradas = []
+            for caminho in self.diretorio.glob("*.json"):
+                try:
+                    info = caminho.stat()
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, caminho))
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                caminho.unlink(missing_ok=True)
+                total -= tamanho
+
+    def estatisticas(self) -> dict:
+        arquivos = list(self.diretorio.glob("*.json"))
+        total = sum(c.stat().st_size for c in arquivos if c.exists())
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taxa_acerto": round(self.hits / consultas, 3) if consultas else 0.0,
+            "entradas": len(arquivos),
+            "tamanho_mb": round(total / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+        }
@@ -0,0 +1,226 @@
+"""
+Recebimento de uploads em streaming
+
+O corpo multipart é lido em blocos direto da requisição (sem passar pelo
+UploadFile, que guarda o arquivo inteiro antes de a rota rodar). Cada bloco do
+arquivo vai ao mesmo tempo para o disco, para o hash SHA-256 e para um ffmpeg
+que já decodifica a faixa de áudio para PCM 16 kHz. A extração termina junto
+com o upload e a memória usada por upload é constante. A escrita em disco e o
+hash rodam em uma thread, fora do event loop.
+"""
+
+import asyncio
+import hashlib
+import os
+
+from fastapi import HTTPException
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from audio_decoder import TAXA_AMOSTRAGEM
+
+TAMANHO_MAXIMO_UPLOAD_MB = float(os.getenv("TAMANHO_MAXIMO_UPLOAD_MB", "4096"))
+TAMANHO_MAXIMO_CAMPO = 64 * 1024
+
+
+class DecodificadorStreaming:
+    def __init__(self, caminho_pcm: str):
+        """ffmpeg lendo a mídia pelo stdin e gravando PCM float32 16 kHz em caminho_pcm"""
+        self.caminho_pcm = caminho_pcm
+        self.processo = None
+        self.falhou = False
+
+    async def iniciar(self):
+        try:
+            self.processo = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-y", "-loglevel", "error", "-i", "pipe:0",
+                "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(TAXA_AMOSTRAGEM),
+                "-f", "f32le", "-acodec", "pcm_f32le", self.caminho_pcm,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            print(f"Não foi possível iniciar o ffmpeg para decodificação em streaming: {e}")
+            self.falhou = True
+
+    async def escrever(self, dados: bytes):
+        if self.falhou:
+            return
+        try:
+            self.processo.stdin.write(dados)
+            await self.processo.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # O ffmpeg desistiu (ex.: MP4 com o índice no fim não é decodificável por pipe)
+            self.falhou = True
+
+    async def finalizar(self) -> bool:
+        """Fecha a entrada e retorna True se o PCM completo foi gerado"""
+        if self.processo is None:
+            return False
+        if not self.falhou:
+            try:
+                self.processo.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        _, erros = await self.processo.communicate()
+        sucesso = (not self.falhou and self.processo.returncode == 0
+                   and os.path.exists(self.caminho_pcm) and os.path.getsize(self.caminho_pcm) > 0)
+        if not sucesso:
+            print(f"Decodificação em streaming falhou, o áudio será extraído do arquivo salvo: "
+                  f"{erros.decode(errors='ignore')[-300:]}")
+            self._remover_pcm()
+        return sucesso
+
+    async def cancelar(self):
+        if self.processo is not None and self.processo.returncode is None:
+            self.processo.kill()
+            await self.processo.wait()
+        self._remover_pcm()
+
+    def _remover_pcm(self):
+        if os.path.exists(self.caminho_pcm):
+            os.remove(self.caminho_pcm)
+
+
+async def receber_upload(request, diretorio: str, prefixo: str, diretorio_audio: str = "audios",
+                         max_mb: float = TAMANHO_MAXIMO_UPLOAD_MB, decodificar: bool = True) -> dict:
+    """
+    Recebe um upload multipart em blocos, gravando o arquivo e extraindo o áudio ao mesmo tempo
+
+    Args:
+        request: Requisição multipart/form-data com um campo de arquivo
+        diretorio: Onde salvar o arquivo ({prefixo}_{nome original})
+        prefixo: Prefixo do arquivo salvo (ex.: o ID da transcrição)
+        diretorio_audio: Onde gravar o PCM decodificado ({prefixo}.f32)
+        max_mb: Tamanho máximo do arquivo; acima disso responde 413
+        decodificar: Se False, apenas grava o arquivo
+
+    Returns:
+        Dict com 'caminho', 'nome_arquivo', 'tamanho', 'sha256', 'campos' (demais campos
+        do formulário) e 'caminho_audio' (PCM pronto, ou None se o ffmpeg não conseguiu
+        decodificar em streaming)
+    """
+    tipo, parametros = parse_options_header(request.headers.get("content-type", ""))
+    if tipo != b"multipart/form-data" or b"boundary" not in parametros:
+        raise HTTPException(status_code=400, detail="Envie o arquivo como multipart/form-data")
+    max_bytes = max_mb * 1024 * 1024
+
+    # O parser é síncrono: os callbacks só enfileiram eventos, processados após cada bloco
+    eventos = []
+    cabecalho = {"campo": b"", "valor": b"", "cabecalhos": {}}
+
+    def on_part_begin():
+        cabecalho["cabecalhos"] = {}
+
+    def on_header_field(dados, inicio, fim):
+        cabecalho["campo"] += dados[inicio:fim]
+
+    def on_header_value(dados, inicio, fim):
+        cabecalho["valor"] += dados[inicio:fim]
+
+    def on_header_end():
+        cabecalho["cabecalhos"][cabecalho["campo"].lower()] = cabecalho["valor"]
+        cabecalho["campo"] = b""
+        cabecalho["valor"] = b""
+
+    def on_headers_finished():
+        eventos.append(("cabecalhos", cabecalho["cabecalhos"]))
+
+    def on_part_data(dados, inicio, fim):
+        eventos.append(("dados", bytes(dados[inicio:fim])))
+
+    def on_part_end():
+        eventos.append(("fim", None))
+
+    parser = MultipartParser(parametros[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    campos = {}
+    parte = None  # {"nome", "arquivo": bool}
+    resultado = None
+    arquivo = None
+    decodificador = None
+    sha256 = hashlib.sha256()
+    tamanho = 0
+
+    def gravar(dados):
+        arquivo.write(dados)
+        sha256.update(dados)
+
+    async def processar_eventos():
+        nonlocal parte, resultado, arquivo, decodificador, tamanho
+        for evento, valor in eventos:
+            if evento == "cabecalhos":
+                _, opcoes = parse_options_header(valor.get(b"content-disposition", b""))
+                nome = opcoes.get(b"name", b"").decode("utf-8", "replace")
+                nome_arquivo = opcoes.get(b"filename")
+                if nome_arquivo is not None and resultado is None:
+                    nome_arquivo = os.path.basename(nome_arquivo.decode("utf-8", "replace")) or "upload"
+                    caminho = os.path.join(diretorio, f"{prefixo}_{nome_arquivo}")
+                    arquivo = await asyncio.to_thread(open, caminho, "wb")
+                    resultado = {"caminho": caminho, "nome_arquivo": nome_arquivo, "caminho_audio": None}
+                    if decodificar:
+                        decodificador = DecodificadorStreaming(os.path.join(diretorio_audio, f"{prefixo}.f32"))
+                        await decodificador.iniciar()
+                    parte = {"nome": nome, "arquivo": True}
+                else:
+                    parte = {"nome": nome, "arquivo": False}
+                    campos[nome] = b""
+            elif evento == "dados" and parte is not None:
+                if parte["arquivo"]:
+                    tamanho += len(valor)
+                    if tamanho > max_bytes:
+                        raise HTTPException(status_code=413,
+                                            detail=f"Arquivo maior que o limite de {max_mb:.0f}MB")
+                    await asyncio.to_thread(gravar, valor)
+                    if decodificador is not None:
+                        await decodificador.escrever(valor)
+                else:
+                    campos[parte["nome"]] += valor
+                    if len(campos[parte["nome"]]) > TAMANHO_MAXIMO_CAMPO:
+                        raise HTTPException(status_code=413, detail="Campo do formulário muito grande")
+            elif evento == "fim" and parte is not None:
+                if parte["arquivo"]:
+                    await asyncio.to_thread(arquivo.close)
+                    if decodificador is not None and await decodificador.finalizar():
+                        resultado["caminho_audio"] = decodificador.caminho_pcm
+                    decodificador = None
+                parte = None
+        eventos.clear()
+
+    try:
+        async for bloco in request.stream():
+            parser.write(bloco)
+            await processar_eventos()
+        parser.finalize()
+        await processar_eventos()
+    except BaseException:
+        # Upload interrompido, inválido ou acima do limite: nada fica pela metade no disco
+        if arquivo is not None:
+            arquivo.close()
+        if decodificador is not None:
+            await decodificador.cancelar()
+        if resultado is not None and os.path.exists(resultado["caminho"]):
+            os.remove(resultado["caminho"])
+        raise
+
+    if resultado is None:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado")
+
+    resultado.update({
+        "tamanho": tamanho,
+        "sha256": sha256.hexdigest(),
+        "campos": {nome: valor.decode("utf-8", "replace") for nome, valor in campos.items()},
+    })
+    return resultado
@@ -0,0 +1,201 @@
+"""
+Cache de downloads do YouTube
+
+Guarda o áudio baixado e os metadados (título e duração) de cada vídeo,
+indexados pelo ID canônico do vídeo e pelo formato. Pedidos repetidos do mesmo
+vídeo não acessam a rede nem o ffmpeg, e pedidos simultâneos compartilham um
+único download (single-flight).
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+DIRETORIO_CACHE_YOUTUBE = os.getenv("DIRETORIO_CACHE_YOUTUBE", "cache/youtube")
+CACHE_YOUTUBE_MAX_MB = float(os.getenv("CACHE_YOUTUBE_MAX_MB", "5000"))
+CACHE_YOUTUBE_TTL_HORAS = float(os.getenv("CACHE_YOUTUBE_TTL_HORAS", "72"))
+
+_PADRAO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def extrair_video_id(url: str) -> Optional[str]:
+    """Extrai o ID de 11 caracteres de qualquer formato de URL do YouTube"""
+    try:
+        query = urlparse(url.strip())
+    except ValueError:
+        return None
+    host = (query.hostname or "").lower()
+    video_id = None
+    if host in ("youtu.be", "www.youtu.be"):
+        video_id = query.path[1:].split("/")[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        if query.path == "/watch":
+            video_id = parse_qs(query.query).get("v", [None])[0]
+        elif query.path.startswith(("/embed/", "/v/", "/shorts/", "/live/")):
+            video_id = query.path.split("/")[2]
+    if video_id and _PADRAO_ID.match(video_id):
+        return video_id
+    return None
+
+
+class CacheYoutube:
+    def __init__(self, diretorio: str = DIRETORIO_CACHE_YOUTUBE, max_mb: float = CACHE_YOUTUBE_MAX_MB,
+                 ttl_horas: float = CACHE_YOUTUBE_TTL_HORAS):
+        """
+        Inicializa o cache
+
+        Args:
+            diretorio: Onde ficam o áudio ({id}_{formato}.ext) e os metadados (.json)
+            max_mb: Tamanho máximo; os vídeos usados há mais tempo saem primeiro
+            ttl_horas: Validade de cada entrada
+        """
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl = ttl_horas * 3600
+        self.hits = 0
+        self.misses = 0
+        self.downloads_compartilhados = 0
+        self._lock = threading.Lock()
+        self._em_andamento = {}  # chave -> {"evento", "erro"}
+
+    def _ler_entrada(self, chave: str):
+        """Retorna os metadados de uma entrada válida (chamar com o lock adquirido)"""
+        caminho_meta = self.diretorio / f"{chave}.json"
+        try:
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        arquivo = self.diretorio / entrada.get("arquivo", "")
+        if time.time() - entrada.get("criado_em", 0) > self.ttl or not arquivo.is_file():
+            self._remover(chave)
+            return None
+        # O mtime dos metadados marca o último acesso, usado na remoção LRU
+        os.utime(caminho_meta, None)
+        entrada["caminho"] = str(arquivo)
+        return entrada
+
+    def _remover(self, chave: str):
+        for caminho in self.diretorio.glob(f"{chave}.*"):
+            caminho.unlink(missing_ok=True)
+
+    def consultar(self, url: str, formato: str = "audio"):
+        """Retorna a entrada em cache do vídeo (sem baixar nada) ou None"""
+        video_id = extrair_video_id(url)
+        if not video_id:
+            return None
+        with self._lock:
+            return self._ler_entrada(f"{video_id}_{formato}")
+
+    def obter_ou_baixar(self, url: str, baixar, formato: str = "audio") -> dict:
+        """
+        Retorna o áudio do vídeo, baixando-o apenas se não estiver em cache
+
+        Args:
+            url: URL do vídeo
+            baixar: Função (url) -> (arquivo, titulo, duracao) que faz o download
+            formato: Formato do áudio, faz parte da chave
+
+        Returns:
+            Dict com 'caminho', 'titulo', 'duracao' e 'video_id'
+        """
+        video_id = extrair_video_id(url)
+        if not video_id:
+            # Sem ID canônico não há como deduplicar: baixa sem cache
+            arquivo, titulo, duracao = baixar(url)
+            return {"caminho": arquivo, "titulo": titulo, "duracao": duracao, "video_id": None}
+
+        chave = f"{video_id}_{formato}"
+        while True:
+            with self._lock:
+                entrada = self._ler_entrada(chave)
+                if entrada:
+                    self.hits += 1
+                    print(f"Vídeo {video_id} encontrado no cache do YouTube")
+                    return entrada
+                voo = self._em_andamento.get(chave)
+                if voo is None:
+                    voo = self._em_andamento[chave] = {"evento": threading.Event(), "erro": None}
+                    self.misses += 1
+                    break
+                self.downloads_compartilhados += 1
+            # Outro pedido já está baixando este vídeo: aguarda e relê o cache
+            print(f"Aguardando download em andamento do vídeo {video_id}")
+            voo["evento"].wait()
+            if voo["erro"] is not None:
+                raise voo["erro"]
+
+        try:
+            arquivo, titulo, duracao = baixar(url)
+            extensao = os.path.splitext(arquivo)[1]
+            destino = self.diretorio / f"{chave}{extensao}"
+            shutil.move(arquivo, destino)
+            entrada = {
+                "video_id": video_id,
+                "formato": formato,
+                "arquivo": destino.name,
+                "titulo": titulo,
+                "duracao": duracao,
+                "criado_em": time.time(),
+            }
+            temporario = self.diretorio / f"{chave}.json.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(entrada, f, ensure_ascii=False)
+            os.replace(temporario, self.diretorio / f"{chave}.json")
+            self._remover_excedente(manter=chave)
+            entrada["caminho"] = str(destino)
+            return entrada
+        except Exception as e:
+            voo["erro"] = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            voo["evento"].set()
+
+    def _remover_excedente(self, manter: str = None):
+        """Remove entradas vencidas e, se preciso, as usadas há mais tempo até caber no limite"""
+        with self._lock:
+            entradas = []
+            for caminho_meta in self.diretorio.glob("*.json"):
+                chave = caminho_meta.stem
+                arquivos = [c for c in self.diretorio.glob(f"{chave}.*") if c.is_file()]
+                tamanho = sum(c.stat().st_size for c in arquivos)
+                try:
+                    with open(caminho_meta, "r", encoding="utf-8") as f:
+                        criado_em = json.load(f).get("criado_em", 0)
+                except (OSError, json.JSONDecodeError):
+                    criado_em = 0
+                if chave != manter and time.time() - criado_em > self.ttl:
+                    self._remover(chave)
+                    continue
+                entradas.append((caminho_meta.stat().st_mtime, tamanho, chave))
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, chave in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                if chave == manter:
+                    continue
+                self._remover(chave)
+                total -= tamanho
+
+    def estatisticas(self) -> dict:
+        arquivos = [c for c in self.diretorio.iterdir() if c.is_file()]
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "downloads_compartilhados": self.downloads_compartilhados,
+            "taxa_acerto": round(self.hits / consultas, 3) if consultas else 0.0,
+            "videos": len([c for c in arquivos if c.suffix == ".json"]),
+            "tamanho_mb": round(sum(c.stat().st_size for c in arquivos) / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            "ttl_horas": round(self.ttl / 3600, 2),
+        }
@@ -0,0 +1,338 @@
+"""
+Download de áudio do YouTube com estratégias concorrentes (hedging)
+
+As estratégias (yt-dlp, pytube, yt-dlp com formato fixo, acesso direto) não
+rodam mais estritamente uma após a outra: a primeira começa sozinha e a
+próxima começa em paralelo se a atual falhar ou se nenhuma estratégia em
+andamento receber bytes dentro do atraso de hedge (YOUTUBE_ATRASO_HEDGE_SEGUNDOS).
+Um download saudável, ainda que longo, não dispara outra estratégia; só o que
+demora a receber o primeiro byte ou fica parado no meio.
+
+O primeiro download concluído vence; os demais são cancelados e seus arquivos
+parciais removidos. Os metadados do yt-dlp são extraídos uma única vez e
+reaproveitados pelas estratégias seguintes.
+
+Cada estratégia é uma função (url, prefixo, contexto) -> (arquivo, titulo,
+duracao), o que permite testar o orquestrador com estratégias falsas ou contra
+um servidor HTTP local (YOUTUBE_BASE_URL).
+"""
+
+import copy
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from urllib.parse import parse_qs
+
+from youtube_cache import extrair_video_id
+
+YOUTUBE_BASE_URL = os.getenv("YOUTUBE_BASE_URL", "https://www.youtube.com").rstrip("/")
+YOUTUBE_ATRASO_HEDGE_SEGUNDOS = float(os.getenv("YOUTUBE_ATRASO_HEDGE_SEGUNDOS", "8"))
+YOUTUBE_TIMEOUT_SEGUNDOS = float(os.getenv("YOUTUBE_TIMEOUT_SEGUNDOS", "30"))
+YOUTUBE_TENTATIVAS = int(os.getenv("YOUTUBE_TENTATIVAS", "3"))
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36")
+
+
+class DownloadCancelado(Exception):
+    pass
+
+
+class ContextoDownload:
+    def __init__(self):
+        """Estado compartilhado pelas estratégias de um mesmo download"""
+        self.cancelado = threading.Event()
+        self._lock = threading.Lock()
+        self._info = None
+        self._extraindo = None  # threading.Event enquanto uma estratégia extrai os metadados
+
+    def verificar_cancelamento(self, *_):
+        """Levanta DownloadCancelado se outra estratégia já venceu (usado como hook de progresso)"""
+        if self.cancelado.is_set():
+            raise DownloadCancelado("Outra estratégia concluiu o download primeiro")
+
+    def info_youtube(self, url, extrair):
+        """Retorna os metadados do vídeo, extraindo-os uma única vez com 'extrair(url)'"""
+        while True:
+            with self._lock:
+                if self._info is not None:
+                    return _copiar(self._info)
+                evento = self._extraindo
+                if evento is None:
+                    self._extraindo = threading.Event()
+                    break
+            evento.wait()
+            with self._lock:
+                if self._info is None:
+                    # A extração da outra estratégia falhou: esta tenta por conta própria
+                    break
+
+        try:
+            info = extrair(url)
+            if not info:
+                raise Exception("Não foi possível obter informações do vídeo (info_dict vazio)")
+            with self._lock:
+                self._info = info
+            return _copiar(info)
+        finally:
+            with self._lock:
+                evento, self._extraindo = self._extraindo, None
+            if evento is not None:
+                evento.set()
+
+    @property
+    def info(self):
+        with self._lock:
+            return self._info
+
+
+class ContextoEstrategia:
+    def __init__(self, compartilhado: ContextoDownload):
+        """Contexto de uma estratégia: o estado compartilhado mais o instante do seu último progresso"""
+        self.compartilhado = compartilhado
+        self.ultimo_progresso = time.monotonic()  # Início conta como progresso: mede o tempo até o 1º byte
+        self.bytes = 0
+
+    def verificar_cancelamento(self, *_):
+        self.compartilhado.verificar_cancelamento()
+
+    def registrar_progresso(self, *args):
+        """Hook de progresso (yt-dlp, pytube ou leitura direta): marca o progresso e verifica o cancelamento"""
+        estado = args[0] if args and isinstance(args[0], dict) else None
+        if estado is None or estado.get("status") in ("downloading", "finished"):
+            self.ultimo_progresso = time.monotonic()
+            if estado is not None:
+                self.bytes = estado.get("downloaded_bytes") or self.bytes
+        self.compartilhado.verificar_cancelamento()
+
+    def info_youtube(self, url, extrair):
+        return self.compartilhado.info_youtube(url, extrair)
+
+    @property
+    def info(self):
+        return self.compartilhado.info
+
+
+def _copiar(info):
+    """Cópia independente dos metadados (process_ie_result altera o dict recebido)"""
+    try:
+        return copy.deepcopy(info)
+    except TypeError:
+        return dict(info)
+
+
+def _opcoes_yt_dlp(prefixo, contexto, formato):
+    return {
+        'format': formato,
+        'outtmpl': f'{prefixo}.%(ext)s',
+        'geo_bypass': True, 'geo_bypass_country': 'US',
+        'nocheckcertificate': True,  # Ignora verificação de certificado SSL
+        'ignoreerrors': False, 'noplaylist': True,
+        'socket_timeout': YOUTUBE_TIMEOUT_SEGUNDOS,
+        'retries': YOUTUBE_TENTATIVAS,
+        'fragment_retries': YOUTUBE_TENTATIVAS,
+        'hls_prefer_native': False,
+        'hls_use_mpegts': True,
+        'extractor_args': {'youtube': {'skip': ['dash', 'hls']}},
+        'progress_hooks': [contexto.registrar_progresso],
+        'http_headers': {
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-us,en;q=0.5', 'Sec-Fetch-Mode': 'navigate',
+        },
+    }
+
+
+def _baixar_yt_dlp(url, prefixo, contexto, formato):
+    # Importado só no primeiro uso para não atrasar a inicialização do servidor
+    import yt_dlp
+
+    opcoes = _opcoes_yt_dlp(prefixo, contexto, formato)
+    with yt_dlp.YoutubeDL(opcoes) as ydl:
+        # Metadados brutos (sem seleção de formato), compartilhados entre as estratégias
+        info = contexto.info_youtube(url, lambda u: ydl.extract_info(u, download=False, process=False))
+        contexto.verificar_cancelamento()
+        info_dict = ydl.process_ie_result(info, download=True)
+    arquivos = glob.glob(f'{glob.escape(prefixo)}.*')
+    if not arquivos:
+        raise Exception("Arquivo de áudio não foi criado após o download (yt-dlp)")
+    return arquivos[0], info_dict.get('title', 'Video sem título'), info_dict.get('duration')
+
+
+def estrategia_yt_dlp(url, prefixo, contexto):
+    """yt-dlp com o melhor áudio disponível, no contêiner original (m4a/webm)"""
+    return _baixar_yt_dlp(url, prefixo, contexto, 'bestaudio/best')
+
+
+def estrategia_yt_dlp_formato_fixo(url, prefixo, contexto):
+    """yt-dlp forçando o formato 140 (m4a), reaproveitando os metadados já extraídos"""
+    return _baixar_yt_dlp(url, prefixo, contexto, '140/bestaudio/best')
+
+
+def estrategia_pytube(url, prefixo, contexto):
+    """pytube, com o primeiro stream só de áudio"""
+    import pytube
+
+    yt = pytube.YouTube(url, on_progress_callback=contexto.registrar_progresso)
+    audio_stream = yt.streams.filter(only_audio=True).first()
+    if not audio_stream:
+        raise Exception("Nenhum stream de áudio disponível (pytube)")
+    contexto.verificar_cancelamento()
+    extensao = f".{audio_stream.subtype}" if audio_stream.subtype else ""
+    arquivo = audio_stream.download(output_path=os.path.dirname(prefixo),
+                                    filename=f"{os.path.basename(prefixo)}{extensao}")
+    if not os.path.exists(arquivo):
+        raise Exception(f"Falha ao baixar o arquivo (pytube): {arquivo}")
+    return arquivo, yt.title, yt.length
+
+
+def estrategia_direta(url, prefixo, contexto, base_url=None):
+    """
+    Acesso direto: lê o player_response em {base}/get_video_info e baixa o
+    stream de áudio de maior bitrate, sem bibliotecas de terceiros
+    """
+    video_id = extrair_video_id(url)
+    if not video_id:
+        raise Exception("Não foi possível extrair o ID do vídeo da URL")
+
+    base_url = base_url or YOUTUBE_BASE_URL
+    resposta = _abrir(f"{base_url}/get_video_info?video_id={video_id}").read().decode("utf-8")
+    player = json.loads(parse_qs(resposta).get("player_response", ["{}"])[0])
+    detalhes = player.get("videoDetails", {})
+    formatos = player.get("streamingData", {}).get("adaptiveFormats", [])
+    audios = [f for f in formatos if f.get("mimeType", "").startswith("audio/") and f.get("url")]
+    if not audios:
+        raise Exception("Nenhum stream de áudio direto disponível")
+    stream = max(audios, key=lambda f: f.get("bitrate", 0))
+    extensao = "." + stream["mimeType"].split(";")[0].split("/")[1]
+
+    arquivo = f"{prefixo}{extensao}"
+    with _abrir(stream["url"]) as entrada, open(arquivo, "wb") as saida:
+        # read1 devolve o que já chegou, para o progresso ser registrado a cada bloco recebido
+        for bloco in iter(lambda: entrada.read1(256 * 1024), b""):
+            contexto.bytes += len(bloco)
+            contexto.registrar_progresso()
+            saida.write(bloco)
+    if os.path.getsize(arquivo) <= 1000:
+        raise Exception("Arquivo baixado parece estar vazio ou é muito pequeno")
+
+    titulo = detalhes.get("title") or (contexto.info or {}).get("title") or f"Video {video_id}"
+    duracao = detalhes.get("lengthSeconds")
+    return arquivo, titulo, int(duracao) if duracao else None
+
+
+def _abrir(url):
+    requisicao = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    return urllib.request.urlopen(requisicao, timeout=YOUTUBE_TIMEOUT_SEGUNDOS)
+
+
+ESTRATEGIAS_PADRAO = [
+    ("yt-dlp", estrategia_yt_dlp),
+    ("pytube", estrategia_pytube),
+    ("yt-dlp formato fixo", estrategia_yt_dlp_formato_fixo),
+    ("direto", estrategia_direta),
+]
+
+
+class OrquestradorDownload:
+    def __init__(self, estrategias=None, atraso_hedge: float = YOUTUBE_ATRASO_HEDGE_SEGUNDOS,
+                 diretorio: str = "audios"):
+        """
+        Inicializa o orquestrador
+
+        Args:
+            estrategias: Lista de (nome, função) na ordem de preferência
+            atraso_hedge: Segundos sem progresso de nenhuma estratégia até iniciar a próxima em paralelo
+            diretorio: Onde os arquivos são baixados
+        """
+        self.estrategias = estrategias or ESTRATEGIAS_PADRAO
+        self.atraso_hedge = atraso_hedge
+        self.diretorio = diretorio
+
+    def baixar(self, url):
+        """Baixa o áudio do vídeo e retorna (arquivo, título, duração em segundos ou None)"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        download_id = str(uuid.uuid4())
+        contexto = ContextoDownload()
+        resultados = queue.Queue()
+        vencedor = {"nome": None}
+        lock = threading.Lock()
+
+        em_andamento = {}  # índice -> ContextoEstrategia das estratégias que ainda não terminaram
+
+        def executar(indice, nome, estrategia, contexto_estrategia):
+            prefixo = os.path.join(self.diretorio, f"audio_{download_id}_{indice}")
+            inicio = time.time()
+            try:
+                arquivo, titulo, duracao = estrategia(url, prefixo, contexto_estrategia)
+            except Exception as e:
+                _remover_parciais(prefixo)
+                if not isinstance(e, DownloadCancelado):
+                    print(f"Estratégia {nome} falhou após {time.time() - inicio:.1f}s: {e}")
+                resultados.put((indice, nome, None, e))
+                return
+            with lock:
+                venceu = vencedor["nome"] is None
+                if venceu:
+                    vencedor["nome"] = nome
+                    contexto.cancelado.set()
+            if not venceu:
+                # Terminou depois da vencedora: descarta
+                _remover_parciais(prefixo)
+                return
+            print(f"Download concluído pela estratégia {nome} em {time.time() - inicio:.1f}s: {arquivo}")
+            resultados.put((indice, nome, (arquivo, titulo, duracao), None))
+
+        iniciadas = 0
+        ultimo_erro = None
+        iniciar_proxima = True
+        while True:
+            # Na primeira volta, após um hedge (nada progredindo) ou após uma falha: próxima estratégia
+            if iniciar_proxima and iniciadas < len(self.estrategias):
+                nome, estrategia = self.estrategias[iniciadas]
+                print(f"Iniciando download do YouTube (estratégia {iniciadas + 1} - {nome}): {url}")
+                em_andamento[iniciadas] = ContextoEstrategia(contexto)
+                threading.Thread(target=executar, args=(iniciadas, nome, estrategia, em_andamento[iniciadas]),
+                                 daemon=True).start()
+                iniciadas += 1
+            iniciar_proxima = False
+
+            # Espera um resultado até o atraso de hedge contado do último progresso de qualquer estratégia
+            restam_estrategias = iniciadas < len(self.estrategias)
+            espera = None
+            if restam_estrategias:
+                ultimo_progresso = max(c.ultimo_progresso for c in em_andamento.values())
+                espera = ultimo_progresso + self.atraso_hedge - time.monotonic()
+                if espera <= 0:
+                    print(f"Nenhuma estratégia progrediu em {self.atraso_hedge:.0f}s; iniciando a próxima")
+                    iniciar_proxima = True
+                    continue
+            try:
+                indice, nome, resultado, erro = resultados.get(timeout=espera)
+            except queue.Empty:
+                continue
+            em_andamento.pop(indice, None)
+            if resultado is not None:
+                arquivo, titulo, duracao = resultado
+                destino = os.path.join(self.diretorio, f"audio_{download_id}{os.path.splitext(arquivo)[1]}")
+                os.replace(arquivo, destino)
+                return destino, titulo, duracao
+            ultimo_erro = erro
+            iniciar_proxima = True
+            if not em_andamento and not restam_estrategias:
+                print(f"Todas as tentativas de download para {url} falharam.")
+                raise ultimo_erro
+
+
+def _remover_parciais(prefixo):
+    """Remove o que uma estratégia deixou no disco (inclusive .part e fragmentos)"""
+    for caminho in glob.glob(f"{glob.escape(prefixo)}*"):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass